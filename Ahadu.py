@@ -1,14 +1,11 @@
 import os
 import json
-import requests
-import kivy
-import pyaudio
-import speech_recognition as sr
-import pyttsx3
-import vosk
-import pytesseract
-from gtts import gTTS
+import threading
+from connectivity import get_monitor
+from metrics import stage
+from vosk_models import model_path_for, registry as vosk_models
 from kivy.app import App
+from kivy.clock import Clock
 from kivy.uix.boxlayout import BoxLayout
 from kivy.uix.button import Button
 from kivy.uix.textinput import TextInput
@@ -16,11 +13,21 @@ from kivy.uix.label import Label
 from kivy.uix.filechooser import FileChooserIconView
 from kivy.uix.spinner import Spinner
 
+# speech_recognition, vosk, pyaudio, the TTS engines and the OCR backend are
+# imported by the features that use them, so none of them slow down opening
+# the window.
+
 class SpeechApp(App):
     def build(self):
-        self.recognizer = sr.Recognizer()
-        self.online_mode = self.check_internet()
+        self.recognizer = None
+        self.dictation = None
+        self.speaker = None
+        self.dictating = False
+        self.dictated = []  # finished utterances of the current dictation
+        self.online_mode = False
         self.language = "am-ET"  # Default to Amharic
+        # Network probing and model loading wait until the window is up
+        Clock.schedule_once(self.start_background_work, 0)
 
         self.layout = BoxLayout(orientation="vertical", padding=10, spacing=10)
 
@@ -37,6 +44,7 @@ class SpeechApp(App):
 
         # Buttons
         self.speech_btn = Button(text="🎤 Speak :", on_press=self.speech_to_text, size_hint=(1, 0.2))
+        self.dictate_btn = Button(text="🎙 Start Live Dictation", on_press=self.toggle_dictation, size_hint=(1, 0.2))
         self.tts_btn = Button(text="🔊 Convert Text to Speech", on_press=self.text_to_speech, size_hint=(1, 0.2))
         self.ocr_btn = Button(text="📷 Extract Text from Image", on_press=self.image_extractor, size_hint=(1, 0.2))
         self.exit_btn = Button(text="❌ Exit", on_press=self.stop_app, size_hint=(1, 0.2))
@@ -50,6 +58,7 @@ class SpeechApp(App):
         # Adding widgets to layout
         self.layout.add_widget(self.language_spinner)
         self.layout.add_widget(self.speech_btn)
+        self.layout.add_widget(self.dictate_btn)
         self.layout.add_widget(self.tts_btn)
         self.layout.add_widget(self.text_input)
         self.layout.add_widget(self.ocr_btn)
@@ -59,28 +68,53 @@ class SpeechApp(App):
 
         return self.layout
 
+    def start_background_work(self, dt):
+        monitor = get_monitor()
+        monitor.add_listener(self.on_connectivity_change)
+        self.online_mode = monitor.is_online
+        # Warm up the offline model now so the first offline request only pays for decoding
+        vosk_models.preload(model_path_for(self.language))
+
+    def get_recognizer(self):
+        if self.recognizer is None:
+            import speech_recognition as sr
+
+            self.recognizer = sr.Recognizer()
+        return self.recognizer
+
     def set_language(self, spinner, text):
         """Change language based on user selection."""
-        if text == "Amharic":
+        if text.strip() == "Amharic":
             self.language = "am-ET"
         else:
             self.language = "en-US"
+        vosk_models.preload(model_path_for(self.language))
 
     def check_internet(self):
-        """Check if internet connection exists."""
-        try:
-            requests.get("https://www.google.com", timeout=3)
-            return True
-        except requests.ConnectionError:
-            return False
+        """Check if internet connection exists (cached, doesn't block)."""
+        return get_monitor().is_online
+
+    def on_connectivity_change(self, online):
+        """Keep online_mode current; called from the connectivity monitor's thread."""
+        self.online_mode = online
 
     def speech_to_text(self, instance):
         """Convert speech to text dynamically based on language and internet connection."""
+        import speech_recognition as sr
+
+        from dictation import calibration
+
+        recognizer = self.get_recognizer()
         mic = sr.Microphone()
         with mic as source:
-            self.recognizer.adjust_for_ambient_noise(source)
+            # The ambient level measured last time saves a second of listening to silence
+            if not calibration.apply_to(recognizer):
+                recognizer.adjust_for_ambient_noise(source, duration=0.5)
             self.result_label.text = "Listening..."
-            audio = self.recognizer.listen(source)
+            with stage("ahadu.listen"):
+                audio = recognizer.listen(source)
+        calibration.update_from(recognizer)
+        calibration.save()
 
         if self.online_mode:
             text = self.online_speech_to_text(audio)
@@ -91,59 +125,144 @@ class SpeechApp(App):
 
     def online_speech_to_text(self, audio):
         """Convert speech to text using Google Cloud Speech API (Online Mode)."""
+        import speech_recognition as sr
+        from speech_client import get_client
+
         try:
-            text = self.recognizer.recognize_google(audio, language=self.language)
+            with stage("speech.google", items=1):
+                # Vosk takes over if Google is slow or unreachable
+                text = get_client().recognize(audio, language=self.language, fallback="vosk",
+                                              model_path=model_path_for(self.language))
             return f"Recognized (Online): {text}"
         except sr.UnknownValueError:
             return "Could not understand"
         except sr.RequestError as e:
-            return f"Google API Error: {e}"
+            return f"Speech recognition error: {e}"
 
     def offline_speech_to_text(self, audio):
         """Convert speech to text using Vosk (Offline Mode)."""
-        if self.language == "am-ET":
-            model_path = "vosk-model-amharic" 
-        else:
-            "vosk-model-en"
-            if not os.path.exists(model_path):
-                return "[Error] Model not found! Download and extract it."
+        model_path = model_path_for(self.language)
+        if not os.path.exists(model_path):
+            return "[Error] Model not found! Download and extract it."
 
-        model = vosk.Model(model_path)
+        import vosk
+
+        # The model is loaded once and shared; a recognizer is cheap to create
+        model = vosk_models.get(model_path)
         recognizer = vosk.KaldiRecognizer(model, 16000)
 
-        with sr.AudioFile(audio) as source:
-            audio_data = source.record()
-            if recognizer.AcceptWaveform(audio_data.frame_data):
-                result = json.loads(recognizer.Result())
-                return f"Recognized (Offline): {result['text']}"
-            else:
-                return "Vosk could not process audio."
+        with stage("speech.vosk", items=1) as timing:
+            pcm = audio.get_raw_data(convert_rate=16000, convert_width=2)
+            timing.add(nbytes=len(pcm))
+            recognizer.AcceptWaveform(pcm)
+            result = json.loads(recognizer.FinalResult())
+        if result.get("text"):
+            return f"Recognized (Offline): {result['text']}"
+        else:
+            return "Vosk could not process audio."
+
+    def toggle_dictation(self, instance):
+        """Start or stop live dictation, showing words as they are recognised (offline, Vosk)."""
+        if self.dictating:
+            self.dictating = False
+            self.dictate_btn.text = "🎙 Start Live Dictation"
+            if self.dictation:
+                threading.Thread(target=self.dictation.stop, daemon=True).start()
+            return
+        model_path = model_path_for(self.language)
+        if not os.path.exists(model_path):
+            self.result_label.text = "[Error] Model not found! Download and extract it."
+            return
+        self.dictating = True
+        self.dictate_btn.text = "⏹ Stop Live Dictation"
+        self.dictated = []
+        self.result_label.text = "Listening..." if vosk_models.is_loaded(model_path) else "Loading model..."
+        threading.Thread(target=self.start_dictation, args=(model_path,), daemon=True).start()
+
+    def start_dictation(self, model_path):
+        try:
+            model = vosk_models.get(model_path)
+            if self.dictation is None or self.dictation.model is not model:
+                # Kept between sessions so the recogniser and the audio device stay open
+                if self.dictation:
+                    self.dictation.close()
+                from dictation import Dictation
+
+                self.dictation = Dictation(model, on_partial=self.on_dictation_partial,
+                                           on_text=self.on_dictation_text)
+            self.dictation.start()
+            if not self.dictating:
+                self.dictation.stop()  # stopped while the model was loading
+                return
+            Clock.schedule_once(lambda dt: self.show_dictation(""), 0)
+        except Exception as e:
+            message = f"[Error] Could not start dictation: {e}"
+            Clock.schedule_once(lambda dt: self.dictation_failed(message), 0)
+
+    def dictation_failed(self, message):
+        self.dictating = False
+        self.dictate_btn.text = "🎙 Start Live Dictation"
+        self.result_label.text = message
+
+    def on_dictation_partial(self, text):
+        """Called from the recognition thread with the utterance so far."""
+        Clock.schedule_once(lambda dt: self.show_dictation(text), 0)
+
+    def on_dictation_text(self, text):
+        """Called from the recognition thread with each finished utterance."""
+        def show(dt):
+            self.dictated.append(text)
+            self.show_dictation("")
+
+        Clock.schedule_once(show, 0)
+
+    def show_dictation(self, partial):
+        text = " ".join(self.dictated + ([partial] if partial else []))
+        self.result_label.text = text or "Listening..."
 
     def text_to_speech(self, instance):
         """Convert text to speech dynamically based on the selected language."""
         text = self.text_input.text
         if text:
-            tts = gTTS(text=text, lang="am" if self.language == "am-ET" else "en")
-            tts.save("output.mp3")
-            os.system("start output.mp3")  # Play the audio
-            self.result_label.text = "Converted to speech!"
+            if self.speaker is None:
+                from tts import Speaker
+
+                self.speaker = Speaker()
+            # Sentences are played as soon as each is synthesised (offline voices when there are any)
+            self.speaker.speak(text, self.language, online=self.online_mode,
+                               on_done=lambda: self.post_result("Converted to speech!"),
+                               on_error=lambda e: self.post_result(f"[Error] {e}"))
+            self.result_label.text = "Speaking..."
         else:
             self.result_label.text = "Please enter text......"
 
+    def post_result(self, text):
+        """Show text in result_label; safe to call from any thread."""
+        def show(dt):
+            self.result_label.text = text
+
+        Clock.schedule_once(show, 0)
+
     def image_extractor(self, instance):
         """Extract text from an image dynamically based on language."""
         file_path = self.file_chooser.selection
         if file_path:
+            from ocr_backend import image_to_string
+
             lang_code = "amh" if self.language == "am-ET" else "eng"
-            text = pytesseract.image_to_string(file_path[0], lang=lang_code)
+            text = image_to_string(file_path[0], lang=lang_code)
             self.result_label.text = f"Extracted Text: {text}"
         else:
             self.result_label.text = "[Error] No image selected!"
 
     def stop_app(self, instance):
         """Exit the application."""
+        if self.dictation:
+            self.dictation.close()
+        if self.speaker:
+            self.speaker.close()
         App.get_running_app().stop()
 
-if __name__ == "main":
+if __name__ == "__main__":
     SpeechApp().run()
 
@@ -13,24 +13,22 @@ from kivy.uix.label import Label
 from kivy.uix.popup import Popup
 from kivy.uix.filechooser import FileChooserListView
 from kivy.uix.image import Image as KivyImage
+from kivy.uix.scrollview import ScrollView
+from kivy.uix.textinput import TextInput
 from kivy.clock import Clock
-from PIL import Image
 import os
-from fpdf import FPDF
-import pytesseract
-import speech_recognition as sr
-import requests
-import fitz  # PyMuPDF for PDF rendering
-from kivy.core.image import Image as CoreImage
-from io import BytesIO
-
-# Check internet connection
+from connectivity import get_monitor
+from jobs import JobExecutor, KivyDispatcher
+
+# OCR, PDF, rendering and speech modules are imported by the features that
+# use them, so opening the window doesn't wait for fitz, PIL or speech_recognition.
+
+# Check internet connection (cached by a background monitor). Only waits for
+# the first probe, so call it from a job rather than the UI thread.
 def is_connected():
-    try:
-        requests.get("http://www.google.com", timeout=3)
-        return True
-    except requests.ConnectionError:
-        return False
+    monitor = get_monitor()
+    monitor.wait_for_first_check(timeout=2)
+    return monitor.is_online
 
 class ImageToPdfApp(App):
     def __init__(self):
@@ -42,8 +40,17 @@ class ImageToPdfApp(App):
         self.pdf_document = None
         self.current_page = 0
         self.total_pages = 0
+        self.page_cache = None
+        self.reader_image = None
+        self.page_label = None
+        self.ocr_cache = None
+        self._engine = None
+        # Conversions run here, one at a time, so the window stays responsive
+        self.jobs = JobExecutor(KivyDispatcher())
 
     def build(self):
+        # Start probing once the window is up so the state is known before the first conversion
+        Clock.schedule_once(lambda dt: get_monitor(), 0)
         self.layout = BoxLayout(orientation='vertical', padding=10, spacing=10)
 
         # Title
@@ -59,6 +66,10 @@ class ImageToPdfApp(App):
         convert_images_btn.bind(on_press=self.convert_to_pdf)
         self.layout.add_widget(convert_images_btn)
 
+        searchable_btn = Button(text="Convert Images to Searchable PDF", size_hint=(1, 0.1))
+        searchable_btn.bind(on_press=self.convert_to_searchable_pdf)
+        self.layout.add_widget(searchable_btn)
+
         select_audio_btn = Button(text="Select Audio", size_hint=(1, 0.1))
         select_audio_btn.bind(on_press=self.select_audio)
         self.layout.add_widget(select_audio_btn)
@@ -71,6 +82,14 @@ class ImageToPdfApp(App):
         read_pdf_btn.bind(on_press=self.open_pdf_reader)
         self.layout.add_widget(read_pdf_btn)
 
+        search_btn = Button(text="Search PDFs", size_hint=(1, 0.1))
+        search_btn.bind(on_press=self.open_search)
+        self.layout.add_widget(search_btn)
+
+        cancel_btn = Button(text="Cancel", size_hint=(1, 0.1))
+        cancel_btn.bind(on_press=self.cancel_jobs)
+        self.layout.add_widget(cancel_btn)
+
         # Status Label
         self.status_label = Label(text="Ready", size_hint=(1, 0.1))
         self.layout.add_widget(self.status_label)
@@ -113,112 +132,236 @@ class ImageToPdfApp(App):
             self.audio_file = selected[0]
             self.status_label.text = f"Selected audio: {os.path.basename(self.audio_file)}"
 
-    def extract_text_from_images(self):
-        text = ""
-        for image_path in self.image_paths:
-            try:
-                img = Image.open(image_path)
-                extracted_text = pytesseract.image_to_string(img)
-                text += f"Text from {os.path.basename(image_path)}:\n{extracted_text}\n\n"
-            except Exception as e:
-                self.show_popup("Warning", f"Failed to process {image_path}: {str(e)}")
-        return text
+    @property
+    def engine(self):
+        if self._engine is None:
+            from engine import ConversionEngine
+            from ocr_cache import OcrCache
+            from preprocess import Preprocessor
+            from text_index import get_index
+
+            self.ocr_cache = OcrCache()
+            self._engine = ConversionEngine(cache=self.ocr_cache, preprocessor=Preprocessor(), index=get_index())
+        return self._engine
+
+    def run_job(self, task, name, message):
+        self.status_label.text = message
+        self.jobs.submit(task, on_progress=self.on_job_progress, on_done=self.on_job_done,
+                         on_error=self.on_job_error, name=name)
+
+    def on_job_progress(self, job, done, total, message):
+        self.status_label.text = f"{message} {done}/{total}"
+
+    def on_job_done(self, job, message):
+        if job.state == "cancelled":
+            self.status_label.text = f"{job.name} cancelled"
+            return
+        self.show_popup("Success", message)
+        self.status_label.text = "Ready"
+
+    def on_job_error(self, job, error):
+        self.show_popup("Error", f"{job.name} failed: {str(error)}")
+        self.status_label.text = "Ready"
+
+    def cancel_jobs(self, instance):
+        self.jobs.cancel_all()
+
+    def convert_images(self, job, image_paths, pdf_path, mode):
+        """Run image_paths through the conversion engine, warning about failures; returns the pages written."""
+        pages = 0
+        results = self.engine.convert(image_paths, pdf_path, mode=mode, titles=True)
+        for result in job.track(results, len(image_paths), "Processing images..."):
+            if result.error:
+                job.post(self.show_popup, "Warning", f"Failed to process {result.source}: {result.error}")
+            pages += result.pages
+        return pages
 
     def convert_to_pdf(self, instance):
         if not self.image_paths:
             self.show_popup("Error", "No images selected!")
             return
 
-        self.status_label.text = "Processing images..."
-        Clock.schedule_once(lambda dt: self._convert_to_pdf(), 0.1)
+        image_paths = list(self.image_paths)
+        self.run_job(lambda job: self._convert_to_pdf(job, image_paths), "PDF creation", "Processing images...")
+
+    def _convert_to_pdf(self, job, image_paths):
+        from pdf_writer import unused_path
 
-    def _convert_to_pdf(self):
-        extracted_text = self.extract_text_from_images()
-        if not extracted_text.strip():
-            self.show_popup("Error", "No text extracted from images!")
-            self.status_label.text = "Ready"
+        pdf_path = unused_path(os.path.join(os.getcwd(), "output.pdf"))
+        if not self.convert_images(job, image_paths, pdf_path, "text"):
+            raise ValueError("No text extracted from images!")
+        self.pdf_path = pdf_path
+        stats = self.ocr_cache.stats()
+        return f"PDF saved as {pdf_path}\n(OCR cache: {stats['hits']} hits, {stats['misses']} misses)"
+
+    def convert_to_searchable_pdf(self, instance):
+        if not self.image_paths:
+            self.show_popup("Error", "No images selected!")
             return
 
-        self.pdf_path = os.path.join(os.getcwd(), "output.pdf")
-        try:
-            pdf = FPDF()
-            pdf.add_page()
-            pdf.set_font("Helvetica", size=12)
-            pdf.multi_cell(0, 10, extracted_text.encode('latin-1', 'replace').decode('latin-1'))
-            pdf.output(self.pdf_path)
-            self.show_popup("Success", f"PDF saved as {self.pdf_path}")
-            self.status_label.text = "Ready"
-        except Exception as e:
-            self.show_popup("Error", f"Failed to create PDF: {str(e)}")
-            self.status_label.text = "Ready"
+        image_paths = list(self.image_paths)
+        self.run_job(lambda job: self._convert_to_searchable_pdf(job, image_paths), "PDF creation",
+                     "Processing images...")
+
+    def _convert_to_searchable_pdf(self, job, image_paths):
+        from pdf_writer import unused_path
+
+        # One OCR pass per image gives both the words and their positions on the page
+        pdf_path = unused_path(os.path.join(os.getcwd(), "searchable_output.pdf"))
+        if not self.convert_images(job, image_paths, pdf_path, "searchable"):
+            raise ValueError("No images could be converted!")
+        self.pdf_path = pdf_path
+        return f"PDF saved as {pdf_path}"
 
     def convert_audio_to_pdf(self, instance):
         if not self.audio_file:
             self.show_popup("Error", "No audio file selected!")
             return
 
-        self.status_label.text = "Processing audio..."
-        Clock.schedule_once(lambda dt: self._convert_audio_to_pdf(), 0.1)
+        audio_file = self.audio_file
+        self.run_job(lambda job: self._convert_audio_to_pdf(job, audio_file), "Audio processing",
+                     "Processing audio...")
 
-    def _convert_audio_to_pdf(self):
-        if is_connected():
-            self.extract_text_from_audio_online()
-        else:
-            self.extract_text_from_audio_offline()
+    def _convert_audio_to_pdf(self, job, audio_file):
+        from long_audio import LONG_AUDIO_SECONDS, audio_duration
+
+        online = is_connected()
+        length = audio_duration(audio_file)
+        if length > LONG_AUDIO_SECONDS:
+            return self.extract_text_from_long_audio(job, audio_file, length, online)
+        if online:
+            return self.extract_text_from_audio_online(audio_file)
+        return self.extract_text_from_audio_offline(audio_file)
+
+    def extract_text_from_long_audio(self, job, audio_file, length, online):
+        """Recognise a long recording in parallel segments, writing each to the PDF as it finishes."""
+        from long_audio import transcribe_long_audio
+        from pdf_writer import StreamingPdfWriter, unused_path
+
+        pdf_path = unused_path(os.path.join(os.getcwd(), "audio_output.pdf"))
+
+        def on_text(segment, text):
+            job.check_cancelled()
+            pdf.write_text(text)
+            job.progress(int(segment.end), int(length), "Processing audio (seconds)...")
 
-    def extract_text_from_audio_online(self):
-        recognizer = sr.Recognizer()
         try:
-            with sr.AudioFile(self.audio_file) as source:
-                audio = recognizer.record(source)
-            text = recognizer.recognize_google(audio)
-            self.create_pdf_from_text(text)
-        except sr.UnknownValueError:
-            self.show_popup("Error", "Google Speech Recognition could not understand the audio.")
-            self.status_label.text = "Ready"
-        except Exception as e:
-            self.show_popup("Error", f"Audio processing failed: {str(e)}")
-            self.status_label.text = "Ready"
+            with StreamingPdfWriter(pdf_path) as pdf:
+                pdf.begin_text()
+                text = transcribe_long_audio(audio_file, backend="google" if online else "sphinx", on_text=on_text)
+        except BaseException:
+            # Cancelled or failed: don't leave half a transcript behind
+            if os.path.exists(pdf_path):
+                os.remove(pdf_path)
+            raise
+        if not text:
+            os.remove(pdf_path)
+            raise ValueError("Speech Recognition could not understand the audio.")
+        self.index_text(audio_file, pdf_path, text)
+        self.pdf_path = pdf_path
+        return f"PDF saved as {pdf_path}"
+
+    def extract_text_from_audio_online(self, audio_file):
+        import speech_recognition as sr
+        from long_audio import load_audio
+        from speech_client import get_client
 
-    def extract_text_from_audio_offline(self):
-        recognizer = sr.Recognizer()
         try:
-            with sr.AudioFile(self.audio_file) as source:
-                audio = recognizer.record(source)
-            text = recognizer.recognize_sphinx(audio)
-            self.create_pdf_from_text(text)
+            # Falls back to PocketSphinx by itself if Google is slow or unreachable
+            text = get_client().recognize(load_audio(audio_file))
         except sr.UnknownValueError:
-            self.show_popup("Error", "Offline Speech Recognition could not understand the audio.")
-            self.status_label.text = "Ready"
-        except Exception as e:
-            self.show_popup("Error", f"Offline audio processing failed: {str(e)}")
-            self.status_label.text = "Ready"
+            raise ValueError("Google Speech Recognition could not understand the audio.")
+        return self.create_pdf_from_text(text, audio_file)
 
-    def create_pdf_from_text(self, text):
-        self.pdf_path = os.path.join(os.getcwd(), "audio_output.pdf")
+    def extract_text_from_audio_offline(self, audio_file):
+        import speech_recognition as sr
+        from long_audio import load_audio
+
+        recognizer = sr.Recognizer()
         try:
-            pdf = FPDF()
-            pdf.add_page()
-            pdf.set_font("Helvetica", size=12)
-            pdf.multi_cell(0, 10, text.encode('latin-1', 'replace').decode('latin-1'))
-            pdf.output(self.pdf_path)
-            self.show_popup("Success", f"PDF saved as {self.pdf_path}")
-            self.status_label.text = "Ready"
-        except Exception as e:
-            self.show_popup("Error", f"Failed to create PDF from audio: {str(e)}")
-            self.status_label.text = "Ready"
+            text = recognizer.recognize_sphinx(load_audio(audio_file))
+        except sr.UnknownValueError:
+            raise ValueError("Offline Speech Recognition could not understand the audio.")
+        return self.create_pdf_from_text(text, audio_file)
+
+    def create_pdf_from_text(self, text, audio_file):
+        from pdf_writer import StreamingPdfWriter, unused_path
+
+        pdf_path = unused_path(os.path.join(os.getcwd(), "audio_output.pdf"))
+        with StreamingPdfWriter(pdf_path) as pdf:
+            pdf.add_text(text)
+        self.index_text(audio_file, pdf_path, text)
+        self.pdf_path = pdf_path
+        return f"PDF saved as {pdf_path}"
+
+    @staticmethod
+    def index_text(source, pdf_path, text):
+        from text_index import get_index
+
+        index = get_index()
+        index.remove_pdf(pdf_path)  # anything left from an earlier file of the same name
+        index.add_text(source, pdf_path, text)
+        index.flush()
+
+    def open_search(self, instance):
+        """Search the text of everything converted so far; pressing a hit opens its page."""
+        search_layout = BoxLayout(orientation='vertical', spacing=5)
+        popup = Popup(title="Search PDFs", content=search_layout, size_hint=(0.9, 0.9))
+        query_input = TextInput(multiline=False, size_hint=(1, None), height=40)
+        results = BoxLayout(orientation='vertical', size_hint_y=None, spacing=5)
+        results.bind(minimum_height=results.setter('height'))
+        scroll = ScrollView()
+        scroll.add_widget(results)
+
+        def open_hit(hit):
+            popup.dismiss()
+            self.open_pdf_at(hit.pdf, hit.page - 1)
+
+        def search(instance):
+            from text_index import get_index
+
+            results.clear_widgets()
+            hits = get_index().search(query_input.text)
+            for hit in hits:
+                snippet = " ".join(hit.snippet.split())
+                hit_btn = Button(text=f"{os.path.basename(hit.pdf)}, page {hit.page}: {snippet}",
+                                 size_hint_y=None, height=60, halign='left', valign='middle')
+                hit_btn.bind(width=lambda btn, width: setattr(btn, 'text_size', (width - 20, None)))
+                hit_btn.bind(on_press=lambda btn, hit=hit: open_hit(hit))
+                results.add_widget(hit_btn)
+            if not hits:
+                results.add_widget(Label(text="No matches", size_hint_y=None, height=40))
+
+        query_input.bind(on_text_validate=search)
+        search_btn = Button(text="Search", size_hint=(1, None), height=40)
+        search_btn.bind(on_press=search)
+        search_layout.add_widget(query_input)
+        search_layout.add_widget(search_btn)
+        search_layout.add_widget(scroll)
+        popup.open()
 
     def open_pdf_reader(self, instance):
         self.select_files(["*.pdf"], self.load_pdf)
 
     def load_pdf(self, selected):
-        if not selected:
+        if selected:
+            self.open_pdf_at(selected[0], 0)
+
+    def open_pdf_at(self, pdf_path, page):
+        if not os.path.exists(pdf_path):
+            self.show_popup("Error", f"{pdf_path} has been moved or deleted.")
             return
-        self.pdf_path = selected[0]
+        self.pdf_path = pdf_path
         try:
+            import fitz  # PyMuPDF for PDF rendering
+            from page_cache import PageRenderCache
+
             self.pdf_document = fitz.open(self.pdf_path)
             self.total_pages = self.pdf_document.page_count
-            self.current_page = 0
+            self.current_page = min(max(page, 0), self.total_pages - 1)
+            if self.page_cache:
+                self.page_cache.close()
+            self.page_cache = PageRenderCache(self.pdf_document)
             self.show_pdf_reader()
         except Exception as e:
             self.show_popup("Error", f"Failed to open PDF: {str(e)}")
@@ -227,13 +370,10 @@ class ImageToPdfApp(App):
         reader_layout = BoxLayout(orientation='vertical')
         popup = Popup(title=f"PDF Reader: {os.path.basename(self.pdf_path)}", content=reader_layout, size_hint=(0.9, 0.9))
 
-        # Render current page as an image
-        page = self.pdf_document.load_page(self.current_page)
-        pix = page.get_pixmap()
-        img_data = BytesIO(pix.tobytes("png"))
-        kivy_img = CoreImage(img_data, ext="png")
-        image_widget = KivyImage(texture=kivy_img.texture)
-        reader_layout.add_widget(image_widget)
+        self.reader_image = KivyImage()
+        # Re-render at the widget's real pixel size once the popup is laid out or resized
+        self.reader_image.bind(size=lambda *args: self.display_page())
+        reader_layout.add_widget(self.reader_image)
 
         # Navigation buttons
         nav_layout = BoxLayout(size_hint=(1, 0.1))
@@ -241,23 +381,47 @@ class ImageToPdfApp(App):
         prev_btn.bind(on_press=self.prev_page)
         next_btn = Button(text="Next")
         next_btn.bind(on_press=self.next_page)
-        page_label = Label(text=f"Page {self.current_page + 1}/{self.total_pages}")
+        self.page_label = Label()
         nav_layout.add_widget(prev_btn)
-        nav_layout.add_widget(page_label)
+        nav_layout.add_widget(self.page_label)
         nav_layout.add_widget(next_btn)
-        reader_layout.add_widget nav_layout)
+        reader_layout.add_widget(nav_layout)
 
+        popup.bind(on_dismiss=self.close_pdf_reader)
+        self.display_page()
         popup.open()
 
+    def close_pdf_reader(self, popup):
+        """Stop the page cache's prefetch thread and free its pages once the reader is closed."""
+        if self.page_cache:
+            self.page_cache.close()
+            self.page_cache = None
+
+    def display_page(self):
+        """Show the current page in the open reader, reusing its widgets."""
+        from pixmap_view import fit_zoom, pixmap_to_texture
+
+        if self.page_cache is None:
+            return  # the reader has been closed
+        width, height = self.reader_image.size
+        zoom = fit_zoom(self.page_cache.page_rect(self.current_page), width, height)
+        pix = self.page_cache.get(self.current_page, zoom)
+        texture = pixmap_to_texture(pix, self.reader_image.texture)
+        self.reader_image.texture = texture
+        # blit_buffer updates a reused texture in place, so ask the widget to redraw
+        self.reader_image.canvas.ask_update()
+        self.page_label.text = f"Page {self.current_page + 1}/{self.total_pages}"
+        self.page_cache.prefetch_around(self.current_page, zoom)
+
     def prev_page(self, instance):
         if self.current_page > 0:
             self.current_page -= 1
-            self.show_pdf_reader()
+            self.display_page()
 
     def next_page(self, instance):
         if self.current_page < self.total_pages - 1:
             self.current_page += 1
-            self.show_pdf_reader()
+            self.display_page()
 
 if __name__ == "__main__":
     ImageToPdfApp().run()
\ No newline at end of file
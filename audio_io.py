@@ -0,0 +1,262 @@
+"""
+Audio ingestion for the speech recognisers.
+
+sr.AudioFile only reads WAV/AIFF/FLAC and loads the whole file as Python
+bytes. Here WAV files are memory-mapped and everything else (MP3, OGG, ...)
+is decoded in fixed-size blocks with soundfile, or ffmpeg when soundfile
+can't read the format. Every block is downmixed and resampled to 16 kHz mono
+16-bit PCM with NumPy, so memory use doesn't depend on the file's length.
+
+"""
+
+import json
+import mmap
+import shutil
+import struct
+import subprocess
+
+import numpy as np
+
+from metrics import stage
+
+try:
+    import soundfile
+except (ImportError, OSError):
+    soundfile = None
+
+TARGET_RATE = 16000
+SAMPLE_WIDTH = 2  # bytes per sample of the PCM we hand out
+
+WAVE_FORMAT_PCM = 1
+WAVE_FORMAT_IEEE_FLOAT = 3
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+# (format, bits) of the WAV files decoded here; others go to soundfile or ffmpeg
+WAV_ENCODINGS = {(WAVE_FORMAT_PCM, 8), (WAVE_FORMAT_PCM, 16), (WAVE_FORMAT_PCM, 24), (WAVE_FORMAT_PCM, 32),
+                 (WAVE_FORMAT_IEEE_FLOAT, 32)}
+
+
+class Resampler:
+    """Streaming sample-rate converter: windowed-sinc low-pass, then linear interpolation."""
+
+    def __init__(self, source_rate, target_rate=TARGET_RATE, taps=63):
+        self.step = source_rate / target_rate
+        self.kernel = None
+        if source_rate > target_rate:
+            # Cut off just below the new Nyquist frequency to avoid aliasing.
+            cutoff = 0.45 * target_rate / source_rate
+            n = np.arange(taps) - (taps - 1) / 2
+            kernel = 2 * cutoff * np.sinc(2 * cutoff * n) * np.hanning(taps)
+            self.kernel = (kernel / kernel.sum()).astype(np.float32)
+            self._history = np.zeros(taps - 1, dtype=np.float32)
+        self._pos = 0.0
+        self._last = np.zeros(0, dtype=np.float32)
+
+    def process(self, samples):
+        """Resample the next block of mono float samples."""
+        if self.step == 1:
+            return samples
+        if self.kernel is not None:
+            padded = np.concatenate((self._history, samples))
+            self._history = padded[len(padded) - len(self._history):]
+            samples = np.convolve(padded, self.kernel, mode="valid")
+        data = np.concatenate((self._last, samples))
+        last = len(data) - 1
+        if last < self._pos:
+            self._last = data
+            return np.zeros(0, dtype=np.float32)
+        count = int((last - self._pos) // self.step) + 1
+        positions = self._pos + self.step * np.arange(count)
+        out = np.interp(positions, np.arange(len(data)), data).astype(np.float32)
+        # Keep the last sample so the next block can interpolate across the join.
+        self._pos = positions[-1] + self.step - last
+        self._last = data[last:]
+        return out
+
+
+def to_pcm16(samples):
+    """Float samples in [-1, 1] as little-endian 16-bit PCM bytes."""
+    return (np.clip(samples, -1.0, 1.0) * 32767).astype("<i2").tobytes()
+
+
+def _wav_format(mm):
+    """Parse a WAV header: (format, channels, rate, bits, data offset, data length)."""
+    if mm[:4] != b"RIFF" or mm[8:12] != b"WAVE":
+        raise ValueError("Not a WAV file")
+    pos = 12
+    fmt = None
+    while pos + 8 <= len(mm):
+        chunk_id, size = struct.unpack("<4sI", mm[pos:pos + 8])
+        body = pos + 8
+        if chunk_id == b"fmt ":
+            tag, channels, rate, _, _, bits = struct.unpack("<HHIIHH", mm[body:body + 16])
+            if tag == WAVE_FORMAT_EXTENSIBLE and size >= 40:
+                tag = struct.unpack("<H", mm[body + 24:body + 26])[0]
+            fmt = (tag, channels, rate, bits)
+        elif chunk_id == b"data":
+            if fmt is None:
+                raise ValueError("WAV data chunk before fmt chunk")
+            return fmt + (body, min(size, len(mm) - body))
+        pos = body + size + (size & 1)
+    raise ValueError("WAV file has no data chunk")
+
+
+def _wav_samples(buf, tag, width, channels):
+    """Decode a slice of WAV data into float32 samples shaped (frames, channels)."""
+    if tag == WAVE_FORMAT_IEEE_FLOAT and width == 4:
+        samples = np.frombuffer(buf, dtype="<f4").astype(np.float32)
+    elif tag == WAVE_FORMAT_PCM and width == 1:
+        samples = (np.frombuffer(buf, dtype=np.uint8).astype(np.float32) - 128) / 128
+    elif tag == WAVE_FORMAT_PCM and width in (2, 4):
+        dtype = "<i2" if width == 2 else "<i4"
+        samples = np.frombuffer(buf, dtype=dtype).astype(np.float32) / float(2 ** (8 * width - 1))
+    elif tag == WAVE_FORMAT_PCM and width == 3:
+        raw = np.frombuffer(buf, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+        ints = raw[:, 0] | raw[:, 1] << 8 | raw[:, 2] << 16
+        samples = ((ints ^ 0x800000) - 0x800000).astype(np.float32) / float(2 ** 23)
+    else:
+        raise ValueError(f"Unsupported WAV encoding (format {tag}, {8 * width} bits)")
+    return samples.reshape(-1, channels)
+
+
+def _wav_blocks(path, block_seconds):
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        tag, channels, rate, bits, offset, length = _wav_format(mm)
+        width = bits // 8
+        frame_bytes = width * channels
+        frames = length // frame_bytes
+        block_frames = max(1, int(rate * block_seconds))
+        yield rate, channels
+        for start in range(0, frames, block_frames):
+            count = min(block_frames, frames - start)
+            # Only this block is paged in; the samples are copied out as float32.
+            view = memoryview(mm)[offset + start * frame_bytes:offset + (start + count) * frame_bytes]
+            try:
+                block = _wav_samples(view, tag, width, channels)
+            finally:
+                view.release()
+            yield block
+
+
+def _wav_decodable(path):
+    """Whether _wav_blocks can read path itself, rather than e.g. A-law or ADPCM data."""
+    try:
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            tag, _, _, bits, _, _ = _wav_format(mm)
+    except ValueError:
+        return False
+    return (tag, bits) in WAV_ENCODINGS
+
+
+def _soundfile_blocks(path, block_seconds):
+    info = soundfile.info(path)
+    yield info.samplerate, info.channels
+    block_frames = max(1, int(info.samplerate * block_seconds))
+    for block in soundfile.blocks(path, blocksize=block_frames, dtype="float32", always_2d=True):
+        yield block
+
+
+def _ffmpeg_blocks(path, block_seconds):
+    if not shutil.which("ffmpeg") or not shutil.which("ffprobe"):
+        raise RuntimeError(f"Can't decode {path}: install soundfile or ffmpeg")
+    probe = subprocess.run(["ffprobe", "-v", "error", "-select_streams", "a:0", "-show_entries",
+                            "stream=sample_rate,channels", "-of", "json", path],
+                           capture_output=True, check=True)
+    stream = json.loads(probe.stdout)["streams"][0]
+    rate, channels = int(stream["sample_rate"]), int(stream["channels"])
+    yield rate, channels
+    process = subprocess.Popen(["ffmpeg", "-v", "error", "-i", path, "-f", "f32le", "-"],
+                               stdout=subprocess.PIPE)
+    try:
+        frame_bytes = channels * 4
+        block_bytes = max(1, int(rate * block_seconds)) * frame_bytes
+        pending = b""
+        while True:
+            data = process.stdout.read(block_bytes)
+            if not data:
+                break
+            data = pending + data
+            usable = len(data) // frame_bytes * frame_bytes
+            pending = data[usable:]
+            yield np.frombuffer(data[:usable], dtype="<f4").reshape(-1, channels)
+    finally:
+        process.stdout.close()
+        process.kill()
+        process.wait()
+
+
+def _decoded_blocks(path, block_seconds):
+    """Yield (sample rate, channels) and then float32 blocks shaped (frames, channels)."""
+    with open(path, "rb") as f:
+        header = f.read(12)
+    if header[:4] == b"RIFF" and header[8:12] == b"WAVE" and _wav_decodable(path):
+        return _wav_blocks(path, block_seconds)
+    if soundfile is not None:
+        try:
+            soundfile.info(path)
+            return _soundfile_blocks(path, block_seconds)
+        except RuntimeError:
+            pass  # a format this libsndfile can't read, e.g. MP3 before 1.1
+    return _ffmpeg_blocks(path, block_seconds)
+
+
+class AudioStream:
+    """
+    Decode an audio file as 16 kHz mono 16-bit PCM, one block at a time.
+
+    Iterating yields bytes objects of about block_seconds of audio each.
+    """
+
+    def __init__(self, path, rate=TARGET_RATE, block_seconds=1.0):
+        self.path = path
+        self.rate = rate
+        self.block_seconds = block_seconds
+        self.sample_width = SAMPLE_WIDTH
+
+    def __iter__(self):
+        blocks = _decoded_blocks(self.path, self.block_seconds)
+        try:
+            source_rate, _ = next(blocks)
+            resampler = Resampler(source_rate, self.rate)
+            while True:
+                # Only the decoding is timed, not what the consumer does between blocks
+                with stage("audio.decode") as timing:
+                    block = next(blocks, None)
+                    if block is None:
+                        break
+                    mono = block.mean(axis=1) if block.shape[1] > 1 else block[:, 0]
+                    pcm = to_pcm16(resampler.process(mono.astype(np.float32, copy=False)))
+                    timing.add(items=1, nbytes=len(pcm))
+                if pcm:
+                    yield pcm
+        finally:
+            blocks.close()
+
+
+def pcm_blocks(path, rate=TARGET_RATE, block_seconds=1.0):
+    """Shorthand for iterating an AudioStream."""
+    return iter(AudioStream(path, rate, block_seconds))
+
+
+def read_pcm(path, rate=TARGET_RATE):
+    """Decode a whole (short) file into one PCM bytes object."""
+    return b"".join(pcm_blocks(path, rate))
+
+
+def duration(path):
+    """Length of an audio file in seconds, read from its header where possible."""
+    with open(path, "rb") as f:
+        header = f.read(12)
+    if header[:4] == b"RIFF" and header[8:12] == b"WAVE":
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            _, channels, rate, bits, _, length = _wav_format(mm)
+            return length / (channels * (bits // 8) * rate)
+    if soundfile is not None:
+        try:
+            return soundfile.info(path).duration
+        except RuntimeError:
+            pass
+    if shutil.which("ffprobe"):
+        probe = subprocess.run(["ffprobe", "-v", "error", "-show_entries", "format=duration",
+                                "-of", "json", path], capture_output=True, check=True)
+        return float(json.loads(probe.stdout)["format"]["duration"])
+    raise RuntimeError(f"Can't read the length of {path}")
@@ -0,0 +1,286 @@
+"""
+Headless batch conversion of a directory tree.
+
+Walks a directory (recursively) and converts every image and audio file it
+finds to PDF, without starting Tk or Kivy, so it can run from cron on a
+server. Images are recognised in parallel by the shared OCR engine; audio
+files are transcribed side by side, their segments in parallel on one pool.
+The exit status is non-zero if any file failed.
+
+    python batch_cli.py scans/ -o pdfs/ --workers 8 --json results.jsonl
+
+"""
+
+import argparse
+import itertools
+import json
+import os
+import sys
+import time
+
+import metrics
+from engine import MODES, ConversionEngine
+from ocr_cache import OcrCache
+from pdf_writer import StreamingPdfWriter
+from preprocess import Preprocessor
+from text_index import TextIndex
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".gif", ".tif", ".tiff")
+AUDIO_EXTENSIONS = (".wav", ".mp3", ".ogg", ".flac")
+LAYOUTS = ("mirror", "flat", "dir")
+
+
+def scan_tree(root, extensions, skip=None):
+    """
+    Yield the files under root with one of the extensions, sorted by name.
+
+    A directory's own files come before those of its subdirectories, so each
+    directory's files are contiguous.
+    """
+    try:
+        entries = sorted(os.scandir(root), key=lambda entry: entry.name)
+    except OSError:
+        return
+    subdirs = []
+    for entry in entries:
+        if entry.is_dir(follow_symlinks=False):
+            if not (skip and os.path.abspath(entry.path) == skip):
+                subdirs.append(entry.path)
+        elif entry.is_file() and entry.name.lower().endswith(extensions):
+            yield entry.path
+    for subdir in subdirs:
+        yield from scan_tree(subdir, extensions, skip)
+
+
+def output_path(source, source_root, output_root, layout):
+    """
+    Where the PDF for source goes.
+
+    mirror: the source tree is mirrored under output_root, one PDF per file.
+    flat:   one PDF per file directly in output_root, named after its relative path.
+    dir:    one PDF per source directory, named after the directory; audio files
+            get one each, named after the directory and the file.
+    """
+    relative = os.path.relpath(source, source_root)
+    if layout == "flat":
+        return os.path.join(output_root, os.path.splitext(relative)[0].replace(os.sep, "_") + ".pdf")
+    if layout == "dir":
+        directory = os.path.dirname(relative)
+        name = directory.replace(os.sep, "_") if directory else os.path.basename(os.path.abspath(source_root))
+        if source.lower().endswith(AUDIO_EXTENSIONS):
+            name += "_" + os.path.splitext(os.path.basename(source))[0]
+        return os.path.join(output_root, name + ".pdf")
+    return os.path.join(output_root, os.path.splitext(relative)[0] + ".pdf")
+
+
+class BatchConverter:
+    def __init__(self, source_root, output_root, layout="mirror", mode="text", workers=None, lang="eng",
+                 use_processes=False, cache=True, audio_backend="sphinx", language="en-US", report=None, index=True):
+        self.source_root = source_root
+        self.output_root = output_root
+        self.layout = layout
+        self.mode = mode
+        self.workers = workers
+        self.audio_backend = audio_backend
+        self.language = language
+        self.report = report
+        self.index = TextIndex() if index else None
+        self.engine = ConversionEngine(workers=workers, lang=lang, use_processes=use_processes,
+                                       cache=OcrCache() if cache else None, preprocessor=Preprocessor(),
+                                       index=self.index)
+        self.failures = 0
+        self.results = {}  # source -> status of its last conversion
+        self.outputs = {}  # owner (see owner()) -> its PDF
+        self.owners = {}  # PDF -> owner
+
+    def record(self, source, output, status, error=None, pages=0):
+        """Note the result for source and write it to the JSON report, if one was asked for."""
+        self.results[source] = status
+        if status == "error":
+            self.failures += 1
+        if self.report:
+            self.report.write(json.dumps({"source": source, "output": output, "status": status,
+                                          "error": error, "pages": pages}, ensure_ascii=False) + "\n")
+            self.report.flush()
+
+    def convert_images(self, image_paths):
+        # Results come back in input order, so a "dir" PDF gets its pages in file name order
+        results = self.engine.convert(image_paths, self.output_for, mode=self.mode, titles=self.layout == "dir")
+        for result in results:
+            self.record(result.source, result.output, result.status, result.error, result.pages)
+
+    def owner(self, source):
+        """What source's PDF holds: its directory's images in the dir layout, otherwise just source."""
+        if self.layout == "dir" and not source.lower().endswith(AUDIO_EXTENSIONS):
+            return os.path.dirname(os.path.abspath(source))
+        return os.path.abspath(source)
+
+    def output_for(self, source):
+        """
+        The PDF for source, chosen the first time it is asked for.
+
+        When that name is taken by another file (x.png and x.jpg, an image and an
+        audio file with the same stem, or a/b.png and a_b.png in the flat layout)
+        the source's extension goes into the name, x.png.pdf, and if that is taken
+        too a number is added. A directory's PDF in the dir layout goes straight
+        to the number.
+        """
+        owner = self.owner(source)
+        output = self.outputs.get(owner)
+        if output is None:
+            output = output_path(source, self.source_root, self.output_root, self.layout)
+            base = os.path.splitext(output)[0]
+            names = [output]
+            if owner == os.path.abspath(source):
+                names.append(base + os.path.splitext(source)[1] + ".pdf")
+            output = next(name for name in itertools.chain(names, (f"{base}_{n}.pdf" for n in itertools.count(2)))
+                          if name not in self.owners)
+            self.reserve(source, output)
+        return output
+
+    def plan_outputs(self, sources):
+        """Pick the PDFs for images, then audio, in name order, so the same tree always gets the same names."""
+        for source in sorted(sources, key=lambda source: (source.lower().endswith(AUDIO_EXTENSIONS), source)):
+            self.output_for(source)
+
+    def reserve(self, source, output):
+        """Record that source goes into output."""
+        self.outputs[self.owner(source)] = output
+        self.owners[output] = self.owner(source)
+
+    def release(self, output):
+        """Free the name of a PDF that no longer has any sources."""
+        self.outputs.pop(self.owners.pop(output, None), None)
+
+    def convert_audio(self, audio_paths):
+        if not audio_paths:
+            return
+        from concurrent.futures import ThreadPoolExecutor
+
+        from long_audio import segment_executor
+
+        outputs = [self.output_for(source) for source in audio_paths]
+        if self.index:
+            for output in outputs:
+                self.index.remove_pdf(output)  # rewritten below, or removed if nothing is heard
+        # The files are transcribed side by side, their segments sharing one pool, so
+        # the workers stay busy across the gaps and tails of each file
+        segments = segment_executor(self.audio_backend, self.workers)
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers or max(1, os.cpu_count() or 1)) as files:
+                futures = [files.submit(self._transcribe, source, output, segments)
+                           for source, output in zip(audio_paths, outputs)]
+                for source, output, future in zip(audio_paths, outputs, futures):
+                    try:
+                        text, pages = future.result()
+                    except Exception as e:
+                        self.record(source, output, "error", str(e))
+                        continue
+                    if not text:
+                        self.record(source, output, "empty")
+                    else:
+                        if self.index:
+                            self.index.add_text(source, output, text)
+                        self.record(source, output, "ok", pages=pages)
+        finally:
+            segments.shutdown()
+        if self.index:
+            self.index.flush()
+
+    def _transcribe(self, source, output, segments):
+        """Write source's transcript to output, which is removed if nothing is heard. Returns (text, pages)."""
+        from long_audio import transcribe_long_audio
+
+        os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+        try:
+            with StreamingPdfWriter(output) as pdf:
+                pdf.begin_text()
+                text = transcribe_long_audio(source, backend=self.audio_backend, language=self.language,
+                                             workers=self.workers, executor=segments,
+                                             on_text=lambda segment, text: pdf.write_text(text))
+        except BaseException:
+            if os.path.exists(output):
+                os.remove(output)
+            raise
+        if not text:
+            os.remove(output)
+        return text, pdf.page_count
+
+    def run(self):
+        skip = os.path.abspath(self.output_root)
+        image_paths = list(scan_tree(self.source_root, IMAGE_EXTENSIONS, skip))
+        audio_paths = list(scan_tree(self.source_root, AUDIO_EXTENSIONS, skip))
+        self.plan_outputs(image_paths + audio_paths)
+        try:
+            self.convert_images(image_paths)
+            self.convert_audio(audio_paths)
+        finally:
+            self.engine.close()
+        return len(image_paths) + len(audio_paths)
+
+
+def build_parser(description="Convert the images and audio in a directory tree to PDFs."):
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("source", help="directory to scan (recursively)")
+    parser.add_argument("-o", "--output", help="where to write the PDFs (default: SOURCE/pdf)")
+    parser.add_argument("-w", "--workers", type=int, default=None, help="parallel workers (default: CPU count)")
+    parser.add_argument("--layout", choices=LAYOUTS, default="mirror",
+                        help="mirror the source tree, write all PDFs flat, or one PDF per directory")
+    parser.add_argument("--mode", choices=MODES, default="text",
+                        help="OCR text only, images with a searchable text layer, or images without OCR")
+    parser.add_argument("--lang", default="eng", help="Tesseract language(s), e.g. eng+amh")
+    parser.add_argument("--processes", action="store_true", help="run OCR in processes instead of threads")
+    parser.add_argument("--no-cache", action="store_true", help="don't use the OCR result cache")
+    parser.add_argument("--no-index", action="store_true", help="don't add the text to the full-text index")
+    parser.add_argument("--audio-backend", choices=("sphinx", "vosk", "google"), default="sphinx")
+    parser.add_argument("--language", default="en-US", help="speech recognition language")
+    parser.add_argument("--json", metavar="PATH", help="write one JSON result per file to PATH ('-' for stdout)")
+    parser.add_argument("--metrics", metavar="PATH", help="append per-stage timings to PATH as JSON lines")
+    parser.add_argument("--metrics-prom", metavar="PATH", help="write a Prometheus summary of the stages to PATH")
+    parser.add_argument("--trace-memory", action="store_true", help="record peak memory of the outermost stages (slower)")
+    return parser
+
+
+def parse_args(argv=None):
+    return build_parser().parse_args(argv)
+
+
+def open_report(path, mode="w"):
+    """The stream for --json: None, stdout for '-', or the named file."""
+    if path == "-":
+        return sys.stdout
+    if path:
+        return open(path, mode, encoding="utf-8")
+    return None
+
+
+def enable_metrics(args):
+    if args.metrics or args.metrics_prom or args.trace_memory:
+        metrics.enable(args.metrics, args.metrics_prom, trace_memory=args.trace_memory)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not os.path.isdir(args.source):
+        print(f"Not a directory: {args.source}", file=sys.stderr)
+        return 2
+    enable_metrics(args)
+    output = args.output or os.path.join(args.source, "pdf")
+    report = open_report(args.json)
+
+    started = time.perf_counter()
+    converter = BatchConverter(args.source, output, layout=args.layout, mode=args.mode, workers=args.workers,
+                               lang=args.lang, use_processes=args.processes, cache=not args.no_cache,
+                               audio_backend=args.audio_backend, language=args.language, report=report,
+                               index=not args.no_index)
+    try:
+        total = converter.run()
+    finally:
+        if report and report is not sys.stdout:
+            report.close()
+    print(f"{total} files, {converter.failures} failed, {time.perf_counter() - started:.1f}s", file=sys.stderr)
+    return 1 if converter.failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
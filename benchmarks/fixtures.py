@@ -0,0 +1,219 @@
+"""
+Synthetic, reproducible benchmark fixtures.
+
+Everything is generated offline from a fixed seed: page images of Latin and
+Ethiopic text rendered with PIL, a multi-hundred-page PDF and speech-like
+WAV recordings. The fonts come from the Noto/Charis fonts built into MuPDF,
+so no system fonts need to be installed. Generated files are kept in a
+directory and reused while their parameters don't change.
+
+"""
+
+import io
+import json
+import os
+import random
+import wave
+
+import numpy as np
+
+LATIN_WORDS = (
+    "the of and to in is that for it as was with be by on not he this are or his from at which but have an "
+    "they you were her she there been one all we their has would when if so no will more can who its said "
+    "about other many time them these two may then do first any my now such like our over man me even most "
+    "made after also did many before must through back years where much your way well down should because "
+    "each just those people how too little state good very make world still own see men work long get here "
+    "between both life being under never day same another know while last might us great old year off come "
+    "since against go came right used take three"
+).split()
+
+# Ethiopic syllables: consonant rows of the Ethiopic block, seven vowel orders each.
+ETHIOPIC_ROWS = [0x1200, 0x1208, 0x1218, 0x1228, 0x1230, 0x1238, 0x1240, 0x1260, 0x1270, 0x1278, 0x1290,
+                 0x1298, 0x12A0, 0x12A8, 0x12C8, 0x12D8, 0x12E8, 0x12F0, 0x1300, 0x1308, 0x1320, 0x1338,
+                 0x1348]
+ETHIOPIC_FULL_STOP = "።"
+
+PAGE_SIZE = (1654, 2339)  # A4 at 200 dpi
+PAGE_DPI = 200
+
+
+def _mupdf_font(text, family):
+    """Bytes of the font MuPDF picks for text, so PIL can render scripts no system font covers."""
+    import fitz
+
+    doc = fitz.open()
+    page = doc.new_page()
+    page.insert_htmlbox(fitz.Rect(10, 10, 500, 200), f"<p style='font-family:{family}'>{text}</p>")
+    for xref, _, _, name, _, _ in page.get_fonts():
+        buffer = doc.extract_font(xref)[3]
+        if buffer:
+            return name, buffer
+    raise RuntimeError(f"MuPDF has no font for {text!r}")
+
+
+def load_font(script, size):
+    from PIL import ImageFont
+
+    sample = "ሰላም" if script == "ethiopic" else "Sample"
+    _, buffer = _mupdf_font(sample, "serif")
+    return ImageFont.truetype(io.BytesIO(buffer), size)
+
+
+def latin_text(rng, words):
+    sentences = []
+    while words > 0:
+        count = min(words, rng.randint(6, 16))
+        sentence = " ".join(rng.choice(LATIN_WORDS) for _ in range(count))
+        sentences.append(sentence[0].upper() + sentence[1:] + ".")
+        words -= count
+    return " ".join(sentences)
+
+
+def ethiopic_text(rng, words):
+    def word():
+        return "".join(chr(rng.choice(ETHIOPIC_ROWS) + rng.randint(0, 6)) for _ in range(rng.randint(2, 5)))
+
+    sentences = []
+    while words > 0:
+        count = min(words, rng.randint(5, 12))
+        sentences.append(" ".join(word() for _ in range(count)) + ETHIOPIC_FULL_STOP)
+        words -= count
+    return " ".join(sentences)
+
+
+def _wrap(draw, text, font, width):
+    lines, line = [], ""
+    for word in text.split():
+        candidate = f"{line} {word}".strip()
+        if line and draw.textlength(candidate, font=font) > width:
+            lines.append(line)
+            line = word
+        else:
+            line = candidate
+    if line:
+        lines.append(line)
+    return lines
+
+
+def render_page(text, font, size=PAGE_SIZE, margin=150):
+    """A white page with text set in lines, like a clean scan."""
+    from PIL import Image, ImageDraw
+
+    image = Image.new("L", size, 255)
+    draw = ImageDraw.Draw(image)
+    line_height = int(font.size * 1.5)
+    y = margin
+    used = []
+    for line in _wrap(draw, text, font, size[0] - 2 * margin):
+        if y + line_height > size[1] - margin:
+            break
+        draw.text((margin, y), line, font=font, fill=0)
+        used.append(line)
+        y += line_height
+    return image, "\n".join(used)
+
+
+class Fixtures:
+    def __init__(self, directory, seed=1234):
+        self.directory = directory
+        self.seed = seed
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _stamp_path(self, name):
+        return self._path(name + ".params.json")
+
+    def _fresh(self, name, params):
+        """True if name exists and was generated with the same params."""
+        try:
+            with open(self._stamp_path(name), encoding="utf-8") as f:
+                return json.load(f) == dict(params, seed=self.seed) and os.path.exists(self._path(name))
+        except (OSError, ValueError):
+            return False
+
+    def _stamp(self, name, params):
+        with open(self._stamp_path(name), "w", encoding="utf-8") as f:
+            json.dump(dict(params, seed=self.seed), f)
+
+    def text_images(self, script="latin", count=10, font_size=36, words=400):
+        """
+        Page images of script ("latin" or "ethiopic") text, saved as PNG.
+
+        Returns [(image path, ground truth text)].
+        """
+        name = f"{script}_pages"
+        directory = self._path(name)
+        truth_path = os.path.join(directory, "truth.json")
+        params = {"count": count, "font_size": font_size, "words": words}
+        if not self._fresh(name, params):
+            os.makedirs(directory, exist_ok=True)
+            rng = random.Random(f"{self.seed}-{script}")
+            font = load_font(script, font_size)
+            truth = {}
+            for i in range(count):
+                text = ethiopic_text(rng, words) if script == "ethiopic" else latin_text(rng, words)
+                image, used = render_page(text, font)
+                path = os.path.join(directory, f"page_{i:04d}.png")
+                image.save(path, dpi=(PAGE_DPI, PAGE_DPI))
+                truth[os.path.basename(path)] = used
+            with open(truth_path, "w", encoding="utf-8") as f:
+                json.dump(truth, f, ensure_ascii=False)
+            self._stamp(name, params)
+        with open(truth_path, encoding="utf-8") as f:
+            truth = json.load(f)
+        return [(os.path.join(directory, name), text) for name, text in sorted(truth.items())]
+
+    def long_text(self, words=100000):
+        """Plain Latin text of the given length, for the PDF writer."""
+        return latin_text(random.Random(f"{self.seed}-text"), words)
+
+    def large_pdf(self, pages=300):
+        """A PDF of pages of text, written with the project's own writer."""
+        from pdf_writer import StreamingPdfWriter
+
+        name = f"large_{pages}.pdf"
+        path = self._path(name)
+        if not self._fresh(name, {"pages": pages}):
+            rng = random.Random(f"{self.seed}-pdf")
+            with StreamingPdfWriter(path) as pdf:
+                while pdf.page_count < pages:
+                    pdf.add_text(latin_text(rng, 450))
+            self._stamp(name, {"pages": pages})
+        return path
+
+    def speech_wav(self, seconds=60, rate=44100, channels=2):
+        """
+        A speech-like recording: voiced "syllables" with harmonics and a
+        wandering pitch, grouped into phrases separated by pauses, over noise.
+        """
+        name = f"speech_{seconds}s_{rate}_{channels}ch.wav"
+        path = self._path(name)
+        params = {"seconds": seconds, "rate": rate, "channels": channels}
+        if self._fresh(name, params):
+            return path
+        rng = np.random.default_rng(self.seed)
+        total = int(seconds * rate)
+        signal = rng.normal(0, 0.003, total).astype(np.float32)
+        position = int(0.5 * rate)
+        while position < total:
+            phrase = int(rng.uniform(1.0, 4.0) * rate)
+            end = min(total, position + phrase)
+            t = np.arange(end - position) / rate
+            pitch = 120 + 40 * np.sin(2 * np.pi * rng.uniform(0.2, 0.8) * t)
+            phase = 2 * np.pi * np.cumsum(pitch) / rate
+            voice = sum(np.sin(k * phase) / k for k in range(1, 6))
+            syllables = np.clip(np.sin(2 * np.pi * rng.uniform(3, 5) * t), 0, None) ** 0.5
+            signal[position:end] += (0.2 * voice * syllables).astype(np.float32)
+            position = end + int(rng.uniform(0.4, 1.2) * rate)
+        samples = (np.clip(signal, -1, 1) * 32767).astype("<i2")
+        if channels > 1:
+            samples = np.repeat(samples[:, None], channels, axis=1)
+        with wave.open(path, "wb") as f:
+            f.setnchannels(channels)
+            f.setsampwidth(2)
+            f.setframerate(rate)
+            f.writeframes(samples.tobytes())
+        self._stamp(name, params)
+        return path
@@ -0,0 +1,362 @@
+"""
+Benchmark suite for OCR, PDF writing, page rendering and audio.
+
+Generates its fixtures offline (see fixtures.py), runs each benchmark and
+writes the results as JSON. If a baseline exists, each metric is compared
+against it and the exit status is 1 when one regressed by more than the
+tolerance. Benchmarks whose backend isn't installed (Tesseract or one of its
+languages, pocketsphinx) are reported as skipped.
+
+    python benchmarks/run.py                      # everything; compare with benchmarks/baseline.json
+    python benchmarks/run.py --quick --only pdf_text,render
+    python benchmarks/run.py --save-baseline      # on the reference machine
+
+"""
+
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from difflib import SequenceMatcher
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+REPO = os.path.dirname(HERE)
+sys.path.insert(0, REPO)
+
+from fixtures import Fixtures  # noqa: E402
+
+DEFAULT_FIXTURES = os.path.join(tempfile.gettempdir(), "anapro-bench-fixtures")
+DEFAULT_BASELINE = os.path.join(HERE, "baseline.json")
+
+
+class Skip(Exception):
+    pass
+
+
+def metric(value, unit, better="higher"):
+    return {"value": round(value, 6), "unit": unit, "better": better}
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+
+def best_time(fn, repeat=3):
+    """Fastest of repeat runs of fn(), in seconds, and fn's last result."""
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - started)
+    return min(times), result
+
+
+def similarity(expected, actual):
+    """How close OCR output is to the ground truth, ignoring whitespace (0..1)."""
+    return SequenceMatcher(None, "".join(expected.split()), "".join(actual.split()), autojunk=False).ratio()
+
+
+def _tesseract_languages():
+    try:
+        import pytesseract
+
+        return set(pytesseract.get_languages(config=""))
+    except Exception as e:
+        raise Skip(f"Tesseract is not available: {e}")
+
+
+def bench_preprocess(fixtures, sizes):
+    from PIL import Image
+    from preprocess import Preprocessor
+
+    pages = fixtures.text_images("latin", sizes["ocr_pages"])
+    preprocessor = Preprocessor()
+
+    def process():
+        for path, _ in pages:
+            with Image.open(path) as image:
+                preprocessor.process(image)
+
+    elapsed, _ = best_time(process)
+    return {"pages_per_s": metric(len(pages) / elapsed, "pages/s")}
+
+
+def _bench_ocr(fixtures, sizes, script, lang):
+    if lang not in _tesseract_languages():
+        raise Skip(f"Tesseract language {lang} is not installed")
+    from ocr_engine import ParallelOcrEngine
+    from preprocess import Preprocessor
+
+    pages = fixtures.text_images(script, sizes["ocr_pages"])
+    engine = ParallelOcrEngine(lang=lang, preprocessor=Preprocessor())
+    try:
+        engine.recognize([pages[0][0]])  # start the workers and load the language data
+        started = time.perf_counter()
+        results = engine.recognize([path for path, _ in pages])
+        elapsed = time.perf_counter() - started
+    finally:
+        engine.close()
+    errors = [result.error for result in results if result.error]
+    if errors:
+        raise RuntimeError(errors[0])
+    accuracy = sum(similarity(truth, result.text) for (_, truth), result in zip(pages, results)) / len(pages)
+    return {"pages_per_s": metric(len(pages) / elapsed, "pages/s"), "accuracy": metric(accuracy, "ratio")}
+
+
+def bench_ocr_latin(fixtures, sizes):
+    return _bench_ocr(fixtures, sizes, "latin", "eng")
+
+
+def bench_ocr_ethiopic(fixtures, sizes):
+    return _bench_ocr(fixtures, sizes, "ethiopic", "amh")
+
+
+def bench_pdf_text(fixtures, sizes):
+    from pdf_writer import StreamingPdfWriter
+
+    text = fixtures.long_text(sizes["pdf_words"])
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "text.pdf")
+
+        def write():
+            with StreamingPdfWriter(path) as pdf:
+                pdf.add_text(text)
+            return pdf
+
+        elapsed, pdf = best_time(write)
+        size = os.path.getsize(path)
+    return {"mb_per_s": metric(size / 1e6 / elapsed, "MB/s"),
+            "pages_per_s": metric(pdf.page_count / elapsed, "pages/s")}
+
+
+def bench_pdf_images(fixtures, sizes):
+    from pdf_writer import images_to_pdf
+
+    paths = [path for path, _ in fixtures.text_images("latin", sizes["ocr_pages"])]
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "images.pdf")
+        elapsed, (pages, failures) = best_time(lambda: images_to_pdf(paths, path))
+        size = os.path.getsize(path)
+    if failures:
+        raise RuntimeError(failures[0][1])
+    return {"mb_per_s": metric(size / 1e6 / elapsed, "MB/s"), "pages_per_s": metric(pages / elapsed, "pages/s")}
+
+
+def bench_pipeline(fixtures, sizes):
+    """Images to a text PDF through the whole conversion engine, as the front-ends run it."""
+    if "eng" not in _tesseract_languages():
+        raise Skip("Tesseract language eng is not installed")
+    from engine import ConversionEngine
+    from preprocess import Preprocessor
+
+    paths = [path for path, _ in fixtures.text_images("latin", sizes["ocr_pages"])]
+    engine = ConversionEngine(preprocessor=Preprocessor())
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "pipeline.pdf")
+            list(engine.convert(paths[:1], path))  # start the workers and load the language data
+            started = time.perf_counter()
+            results = list(engine.convert(paths, path))
+            elapsed = time.perf_counter() - started
+    finally:
+        engine.close()
+    errors = [result.error for result in results if result.error]
+    if errors:
+        raise RuntimeError(errors[0])
+    return {"pages_per_s": metric(len(paths) / elapsed, "pages/s")}
+
+
+def bench_render(fixtures, sizes, view=(800, 1000)):
+    import fitz
+    from page_cache import PageRenderCache
+    from pixmap_view import fit_zoom
+
+    document = fitz.open(fixtures.large_pdf(sizes["pdf_pages"]))
+    try:
+        # Cold: every page rendered on demand, as without the cache
+        cache = PageRenderCache(document, prefetch=0)
+        cold = []
+        for page_no in range(document.page_count):
+            zoom = fit_zoom(cache.page_rect(page_no), *view)
+            started = time.perf_counter()
+            cache.get(page_no, zoom)
+            cold.append(time.perf_counter() - started)
+        cache.close()
+
+        # Reading: next page after a short pause, with the neighbours prefetched meanwhile
+        cache = PageRenderCache(document)
+        reading = []
+        for page_no in range(min(document.page_count, sizes["read_pages"])):
+            zoom = fit_zoom(cache.page_rect(page_no), *view)
+            started = time.perf_counter()
+            cache.get(page_no, zoom)
+            reading.append(time.perf_counter() - started)
+            cache.prefetch_around(page_no, zoom)
+            time.sleep(0.05)
+        cache.close()
+    finally:
+        document.close()
+    return {
+        "cold_p50_ms": metric(percentile(cold, 50) * 1000, "ms", "lower"),
+        "cold_p95_ms": metric(percentile(cold, 95) * 1000, "ms", "lower"),
+        "reading_p50_ms": metric(percentile(reading, 50) * 1000, "ms", "lower"),
+        "reading_p95_ms": metric(percentile(reading, 95) * 1000, "ms", "lower"),
+    }
+
+
+def bench_audio_decode(fixtures, sizes):
+    from audio_io import AudioStream
+
+    path = fixtures.speech_wav(sizes["audio_seconds"])
+    elapsed, _ = best_time(lambda: sum(len(block) for block in AudioStream(path)))
+    return {"real_time_factor": metric(elapsed / sizes["audio_seconds"], "x", "lower")}
+
+
+def bench_audio_segment(fixtures, sizes):
+    from long_audio import iter_segments
+
+    path = fixtures.speech_wav(sizes["audio_seconds"])
+    elapsed, segments = best_time(lambda: sum(1 for _ in iter_segments(path)))
+    return {"real_time_factor": metric(elapsed / sizes["audio_seconds"], "x", "lower"),
+            "segments": metric(segments, "count", "none")}
+
+
+def bench_speech_sphinx(fixtures, sizes):
+    if importlib.util.find_spec("pocketsphinx") is None:
+        raise Skip("pocketsphinx is not installed")
+    from long_audio import transcribe_long_audio
+
+    path = fixtures.speech_wav(sizes["audio_seconds"])
+    started = time.perf_counter()
+    transcribe_long_audio(path, backend="sphinx")
+    elapsed = time.perf_counter() - started
+    return {"real_time_factor": metric(elapsed / sizes["audio_seconds"], "x", "lower")}
+
+
+BENCHMARKS = {
+    "preprocess": bench_preprocess,
+    "ocr_latin": bench_ocr_latin,
+    "ocr_ethiopic": bench_ocr_ethiopic,
+    "pdf_text": bench_pdf_text,
+    "pdf_images": bench_pdf_images,
+    "pipeline": bench_pipeline,
+    "render": bench_render,
+    "audio_decode": bench_audio_decode,
+    "audio_segment": bench_audio_segment,
+    "speech_sphinx": bench_speech_sphinx,
+}
+
+SIZES = {
+    "full": {"ocr_pages": 20, "pdf_words": 200000, "pdf_pages": 300, "read_pages": 60, "audio_seconds": 300},
+    "quick": {"ocr_pages": 4, "pdf_words": 20000, "pdf_pages": 100, "read_pages": 20, "audio_seconds": 60},
+}
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(names, fixtures, sizes):
+    results = {}
+    for name in names:
+        print(f"{name}...", end=" ", flush=True, file=sys.stderr)
+        try:
+            results[name] = BENCHMARKS[name](fixtures, sizes)
+            print("done", file=sys.stderr)
+        except Skip as e:
+            results[name] = {"skipped": str(e)}
+            print(f"skipped ({e})", file=sys.stderr)
+        except Exception as e:
+            results[name] = {"error": f"{type(e).__name__}: {e}"}
+            print(f"failed ({e})", file=sys.stderr)
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Print every metric next to its baseline and return the regressions."""
+    regressions = []
+    for name, metrics in results.items():
+        for key, current in metrics.items():
+            if not isinstance(current, dict):
+                print(f"{name:15} {key:16} {current}")
+                continue
+            base = baseline.get(name, {}).get(key)
+            line = f"{name:15} {key:16} {current['value']:12.3f} {current['unit']:8}"
+            if isinstance(base, dict) and base.get("value"):
+                change = current["value"] / base["value"] - 1
+                line += f" baseline {base['value']:12.3f} ({change:+.1%})"
+                worse = -change if current["better"] == "higher" else change if current["better"] == "lower" else 0
+                if worse > tolerance:
+                    line += "  REGRESSION"
+                    regressions.append(f"{name}.{key}")
+            print(line)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the benchmark suite.")
+    parser.add_argument("--only", help="comma-separated benchmarks to run: " + ", ".join(BENCHMARKS))
+    parser.add_argument("--quick", action="store_true", help="smaller fixtures, for a fast check")
+    parser.add_argument("--fixtures", default=DEFAULT_FIXTURES, help="where generated fixtures are kept")
+    parser.add_argument("--output", default="bench_results.json", help="where to write the results")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="results to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.15,
+                        help="allowed slowdown before a metric counts as a regression (default 0.15)")
+    args = parser.parse_args(argv)
+
+    names = args.only.split(",") if args.only else list(BENCHMARKS)
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmark(s): {', '.join(unknown)}")
+    size = "quick" if args.quick else "full"
+
+    results = run(names, Fixtures(args.fixtures), SIZES[size])
+    report = {
+        "meta": {
+            "revision": git_revision(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "size": size,
+        },
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    baseline = {}
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            stored = json.load(f)
+        if stored["meta"].get("size") == size:
+            baseline = stored["results"]
+        else:
+            print(f"Baseline was recorded with --{stored['meta'].get('size')} fixtures; not comparing",
+                  file=sys.stderr)
+    regressions = compare(results, baseline, args.tolerance)
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline saved to {args.baseline}", file=sys.stderr)
+    failed = [name for name, metrics in results.items() if "error" in metrics]
+    for name in failed:
+        print(f"FAIL: {name}: {results[name]['error']}", file=sys.stderr)
+    for name in regressions:
+        print(f"REGRESSION: {name}", file=sys.stderr)
+    return 1 if failed or regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,99 @@
+"""
+Startup-time budget for the GUI apps.
+
+Imports each app module in a fresh interpreter with `python -X importtime`
+and fails (exit status 1) if the import takes longer than its budget or
+pulls in a heavy backend that should only be loaded when its feature is
+first used. Run from anywhere:
+
+    python benchmarks/startup.py
+    python benchmarks/startup.py MarMob --budget-ms 600 --repeat 5
+
+"""
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Budgets for importing the module, in milliseconds. Kivy itself accounts for most of it.
+DEFAULT_BUDGETS_MS = {
+    "Ahadu": 1000,
+    "MarMob": 1000,
+    "imagetopdfbeta": 300,
+}
+
+# Backends that must not be imported before their feature is used.
+HEAVY_MODULES = ("fitz", "PIL", "fpdf", "numpy", "speech_recognition", "pyaudio", "pyttsx3", "vosk",
+                 "gtts", "pytesseract", "tesserocr", "requests")
+
+IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)")
+
+
+def import_profile(module):
+    """
+    Import module in a new interpreter and return {name: (self µs, cumulative µs)}
+    for module and everything it imported.
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], cwd=REPO,
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        error = result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "unknown error"
+        raise RuntimeError(f"import {module} failed: {error}")
+    rows = []
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            rows.append((match.group(4), int(match.group(1)), int(match.group(2)), len(match.group(3))))
+    # Imports are listed after everything they imported, indented one level deeper
+    end = max(i for i, row in enumerate(rows) if row[0] == module and row[3] == 0)
+    start = end
+    while start > 0 and rows[start - 1][3] > 0:
+        start -= 1
+    return {name: (self_us, cumulative_us) for name, self_us, cumulative_us, _ in rows[start:end + 1]}
+
+
+def check(module, budget_ms, repeat=3, top=10):
+    """Print the import profile of module and return a list of budget violations."""
+    runs = [import_profile(module) for _ in range(repeat)]
+    # The fastest run is the least disturbed by whatever else the machine is doing
+    profile = min(runs, key=lambda p: p[module][1])
+    total_ms = profile[module][1] / 1000
+    print(f"{module}: {total_ms:.0f} ms (budget {budget_ms:g} ms, best of {repeat})")
+    heaviest = sorted(profile.items(), key=lambda item: item[1][0], reverse=True)[:top]
+    for name, (self_us, cumulative_us) in heaviest:
+        print(f"    {self_us / 1000:8.1f} ms self {cumulative_us / 1000:8.1f} ms cumulative  {name}")
+
+    problems = []
+    if total_ms > budget_ms:
+        problems.append(f"{module} took {total_ms:.0f} ms to import, over its {budget_ms:g} ms budget")
+    eager = sorted(name for name in profile if name in HEAVY_MODULES)
+    if eager:
+        problems.append(f"{module} imports {', '.join(eager)} at startup")
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fail if an app takes longer than its budget to import.")
+    parser.add_argument("modules", nargs="*", default=list(DEFAULT_BUDGETS_MS), help="app modules to check")
+    parser.add_argument("--budget-ms", type=float, help="budget for every module (default: per-module budgets)")
+    parser.add_argument("--repeat", type=int, default=3, help="imports per module; the fastest one counts")
+    args = parser.parse_args(argv)
+
+    problems = []
+    for module in args.modules:
+        budget = args.budget_ms or DEFAULT_BUDGETS_MS.get(module, 1000)
+        try:
+            problems.extend(check(module, budget, args.repeat))
+        except RuntimeError as e:
+            problems.append(str(e))
+    for problem in problems:
+        print(f"FAIL: {problem}", file=sys.stderr)
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,154 @@
+"""
+Background connectivity monitor.
+
+The apps used to send a blocking HTTP request to google.com (with a
+3 second timeout) before every audio conversion, freezing the UI whenever
+the machine was offline. Instead a background thread probes with a plain
+socket connect, caches the answer and notifies listeners when it changes.
+Reading the state is a simple attribute lookup.
+
+Unless told otherwise it probes the host of the speech service the apps
+would send audio to (ANAPRO_SPEECH_URL, as for speech_client, so the probe
+moves along with the recogniser): a network that can reach some other host
+but not that one is no use to online recognition. The URL is resolved here
+rather than through speech_client, whose imports may fail on a broken
+install; that must not stop the monitor from answering.
+
+"""
+
+import os
+import socket
+import threading
+import time
+from urllib.parse import urlsplit
+
+# speech_recognition's Google endpoint, which speech_client uses by default
+DEFAULT_SPEECH_URL = "http://www.google.com/speech-api/v2/recognize"
+
+
+def speech_service_url():
+    """The URL speech_client sends audio to unless given base_url."""
+    return os.environ.get("ANAPRO_SPEECH_URL") or DEFAULT_SPEECH_URL
+
+
+def probe_address(url):
+    """(host, port) to connect to when checking that url is reachable."""
+    parts = urlsplit(url)
+    return parts.hostname, parts.port or (443 if parts.scheme == "https" else 80)
+
+
+class ConnectivityMonitor:
+    def __init__(self, host=None, port=None, timeout=1.0, ttl=30.0, retry_interval=2.0, max_interval=60.0):
+        self.host = host  # None: the speech service's host, looked up by the monitor thread
+        self.port = port
+        self.timeout = timeout
+        self.ttl = ttl
+        self.retry_interval = retry_interval
+        self.max_interval = max_interval
+        self.online = False
+        self.checked_at = None
+        self._listeners = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._checked = threading.Event()
+        self._thread = None
+
+    def probe(self):
+        """Try to open a TCP connection to the probe endpoint."""
+        if self.host is None:
+            self.host, port = probe_address(speech_service_url())
+            self.port = self.port or port
+        try:
+            with socket.create_connection((self.host, self.port), timeout=self.timeout):
+                return True
+        except OSError:
+            return False
+
+    @property
+    def is_online(self):
+        """The last known state; asks for a fresh probe if it is older than ttl."""
+        # While offline the backoff schedule decides when to probe again.
+        if self.online and time.monotonic() - self.checked_at > self.ttl:
+            self._wake.set()
+        return self.online
+
+    def add_listener(self, callback):
+        """Call callback(online) from the monitor thread whenever the state changes."""
+        with self._lock:
+            self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        with self._lock:
+            if callback in self._listeners:
+                self._listeners.remove(callback)
+
+    def check_now(self):
+        """Ask the monitor thread to probe again without waiting for the next interval."""
+        self._wake.set()
+
+    def wait_for_first_check(self, timeout=None):
+        """Block until the first probe has finished. Returns False on timeout."""
+        return self._checked.wait(timeout)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        self._wake.set()
+
+    def _update(self, online):
+        changed = online != self.online or self.checked_at is None
+        self.online = online
+        self.checked_at = time.monotonic()
+        self._checked.set()
+        if changed:
+            with self._lock:
+                listeners = list(self._listeners)
+            for callback in listeners:
+                try:
+                    callback(online)
+                except Exception:
+                    pass
+
+    def _run(self):
+        delay = self.retry_interval
+        while not self._stopped.is_set():
+            # Cleared before probing, so a check_now() that arrives during the probe isn't lost
+            self._wake.clear()
+            try:
+                online = self.probe()
+            except Exception:
+                # A broken probe counts as offline, so the thread lives on and waiters are released
+                online = False
+            self._update(online)
+            if online:
+                delay = self.retry_interval
+                wait = self.ttl
+            else:
+                # Back off while offline so a dead network costs next to nothing.
+                wait = delay
+                delay = min(delay * 2, self.max_interval)
+            self._wake.wait(wait)
+
+
+_monitor = None
+_monitor_lock = threading.Lock()
+
+
+def get_monitor():
+    """The shared, already started, monitor."""
+    global _monitor
+    with _monitor_lock:
+        if _monitor is None:
+            _monitor = ConnectivityMonitor().start()
+        return _monitor
+
+
+def is_online():
+    """Cached connectivity state of the shared monitor."""
+    return get_monitor().is_online
@@ -0,0 +1,259 @@
+"""
+Streaming microphone dictation.
+
+sr.Microphone showed nothing for seconds: adjust_for_ambient_noise listened
+for a second first, listen() then waited for the speaker to stop, and only
+then did recognition start. Here PyAudio hands over 100 ms frames from its
+callback and each one goes straight into a Vosk recogniser that lives for
+the whole session. Its partial result is shown while the speaker is still
+talking, and every utterance is finalised as soon as Vosk hears its end.
+
+The noise floor is tracked from the quiet frames as the session runs (the
+same estimate SilenceSplitter uses) and saved per input device, so the next
+session, and sr's listen(), start calibrated. Once Vosk has had enough
+silence to close an utterance, further quiet frames aren't fed to it.
+
+"""
+
+import json
+import os
+import queue
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+from audio_io import SAMPLE_WIDTH, TARGET_RATE, Resampler, to_pcm16
+from long_audio import frame_energies, track_noise_floor
+from metrics import metrics
+
+DEFAULT_CALIBRATION_PATH = os.path.join(os.path.expanduser("~"), ".cache", "anapro", "noise_floor.json")
+
+# speech_recognition's energy_threshold is an RMS in sample units, set this
+# far above the ambient level (its dynamic_energy_ratio).
+SR_ENERGY_RATIO = 1.5
+SR_FULL_SCALE = 32768
+
+
+class NoiseCalibration:
+    """Noise floor per input device (RMS as a fraction of full scale), kept in a small JSON file."""
+
+    def __init__(self, path=DEFAULT_CALIBRATION_PATH):
+        self.path = path
+        self._floors = {}
+        self._lock = threading.Lock()
+        try:
+            with open(path, encoding="utf-8") as f:
+                self._floors = {key: float(value) for key, value in json.load(f).items()}
+        except (OSError, ValueError, AttributeError):
+            pass
+
+    @staticmethod
+    def device_key(device_index=None):
+        return "default" if device_index is None else str(device_index)
+
+    def get(self, device_index=None):
+        with self._lock:
+            return self._floors.get(self.device_key(device_index))
+
+    def set(self, device_index, floor):
+        with self._lock:
+            self._floors[self.device_key(device_index)] = float(floor)
+
+    def save(self):
+        with self._lock:
+            floors = dict(self._floors)
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(floors, f)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            pass  # calibration is only a head start; losing it costs one re-measure
+
+    def apply_to(self, recognizer, device_index=None):
+        """Set an sr.Recognizer's energy_threshold from the cached floor; False if there is none."""
+        floor = self.get(device_index)
+        if floor is None:
+            return False
+        recognizer.energy_threshold = max(floor * SR_FULL_SCALE * SR_ENERGY_RATIO, 50)
+        return True
+
+    def update_from(self, recognizer, device_index=None):
+        """Remember the ambient level an sr.Recognizer has measured (or adapted to while listening)."""
+        self.set(device_index, recognizer.energy_threshold / SR_ENERGY_RATIO / SR_FULL_SCALE)
+
+
+calibration = NoiseCalibration()
+
+
+class Dictation:
+    """
+    Live dictation from a microphone into one Vosk recogniser.
+
+    on_partial(text) is called with the utterance so far whenever it
+    changes and on_text(text) with each finished utterance. Both are called
+    from the recognition thread; front-ends hand them to their UI thread.
+    """
+
+    def __init__(self, model, on_partial=None, on_text=None, device_index=None, frame_ms=100,
+                 hangover_ms=800, preroll_ms=300, energy_ratio=3.0, min_energy=0.003, calibration=calibration):
+        self.model = model
+        self.on_partial = on_partial
+        self.on_text = on_text
+        self.device_index = device_index
+        self.frame_ms = frame_ms
+        self.hangover_frames = max(1, hangover_ms // frame_ms)
+        self.energy_ratio = energy_ratio
+        self.min_energy = min_energy
+        self.calibration = calibration
+        self.noise_floor = calibration.get(device_index) if calibration else None
+        self.first_word_latency = None
+        self._recognizer = None
+        self._pyaudio = None
+        self._stream = None
+        self._frames = queue.Queue()
+        self._thread = None
+        self._preroll = deque(maxlen=max(1, preroll_ms // frame_ms))
+        self._quiet_frames = self.hangover_frames  # nothing to close before the first word
+        self._partial = ""
+        self._onset = None
+        self._resampler = None
+        self._continue = None
+
+    @property
+    def running(self):
+        return self._stream is not None
+
+    def _recognizer_for_session(self):
+        # Creating a KaldiRecognizer builds its decoding graph; do it once and reset between sessions.
+        if self._recognizer is None:
+            import vosk
+
+            self._recognizer = vosk.KaldiRecognizer(self.model, TARGET_RATE)
+        return self._recognizer
+
+    def _open_stream(self):
+        import pyaudio
+
+        if self._pyaudio is None:
+            self._pyaudio = pyaudio.PyAudio()  # enumerating devices is slow, so keep it
+        audio = self._pyaudio
+        self._continue = pyaudio.paContinue
+        self._resampler = None
+        rate = TARGET_RATE
+        try:
+            supported = audio.is_format_supported(rate, input_device=self.device_index, input_channels=1,
+                                                  input_format=pyaudio.paInt16)
+        except ValueError:
+            supported = False
+        if not supported:
+            # Record at the device's own rate and resample each frame to 16 kHz
+            info = (audio.get_device_info_by_index(self.device_index) if self.device_index is not None
+                    else audio.get_default_input_device_info())
+            rate = int(info["defaultSampleRate"])
+            self._resampler = Resampler(rate, TARGET_RATE)
+        return audio.open(format=pyaudio.paInt16, channels=1, rate=rate, input=True,
+                          input_device_index=self.device_index, frames_per_buffer=rate * self.frame_ms // 1000,
+                          stream_callback=self._callback)
+
+    def start(self):
+        """Open the microphone and start recognising; returns at once."""
+        if self.running:
+            return
+        self._recognizer_for_session()
+        self._frames = queue.Queue()
+        self._partial = ""
+        self._quiet_frames = self.hangover_frames
+        self.first_word_latency = None
+        self._onset = None
+        # Frames queue up until the thread is running, so nothing is lost if the callback comes first
+        self._stream = self._open_stream()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _callback(self, in_data, frame_count, time_info, status):
+        # PyAudio's thread must not wait on recognition, or frames are dropped
+        self._frames.put(in_data)
+        return None, self._continue
+
+    def _run(self):
+        while True:
+            pcm = self._frames.get()
+            if pcm is None:
+                break
+            if self._resampler:
+                samples = np.frombuffer(pcm, dtype="<i2").astype(np.float32) / SR_FULL_SCALE
+                pcm = to_pcm16(self._resampler.process(samples))
+            self.feed(pcm)
+
+    def feed(self, pcm):
+        """Recognise one frame of 16 kHz mono 16-bit PCM."""
+        energies = frame_energies(pcm, SAMPLE_WIDTH, max(1, len(pcm) // SAMPLE_WIDTH))
+        if not len(energies):
+            return
+        energy = float(energies[0])
+        if self.noise_floor is None:
+            self.noise_floor = energy
+        voiced = energy > max(self.noise_floor * self.energy_ratio, self.min_energy)
+        if voiced:
+            self._quiet_frames = 0
+            if self._onset is None:
+                self._onset = time.perf_counter()
+        else:
+            self.noise_floor = track_noise_floor(self.noise_floor, energy)
+            self._quiet_frames += 1
+            if self._quiet_frames > self.hangover_frames:
+                # Vosk has already closed the utterance; keep a little lead-in for the next word
+                self._preroll.append(pcm)
+                return
+        recognizer = self._recognizer
+        while self._preroll:
+            self._accept(recognizer, self._preroll.popleft())
+        self._accept(recognizer, pcm)
+
+    def _accept(self, recognizer, pcm):
+        if recognizer.AcceptWaveform(pcm):
+            self._partial = ""
+            text = json.loads(recognizer.Result()).get("text", "").strip()
+            if text and self.on_text:
+                self.on_text(text)
+            return
+        partial = json.loads(recognizer.PartialResult()).get("partial", "").strip()
+        if partial != self._partial:
+            self._partial = partial
+            if partial and self.first_word_latency is None and self._onset is not None:
+                # From the first voiced frame reaching us to its word being on screen
+                self.first_word_latency = time.perf_counter() - self._onset
+                if metrics.enabled:
+                    metrics.record("dictation.first_word", self.first_word_latency, 1, 0, None, False)
+            if self.on_partial:
+                self.on_partial(partial)
+
+    def stop(self):
+        """Close the microphone, finish the last utterance and save the calibration."""
+        if not self.running:
+            return
+        stream, self._stream = self._stream, None
+        stream.stop_stream()
+        stream.close()
+        self._frames.put(None)
+        self._thread.join()
+        self._thread = None
+        self._resampler = None
+        self._preroll.clear()
+        text = json.loads(self._recognizer.FinalResult()).get("text", "").strip()
+        self._partial = ""
+        if text and self.on_text:
+            self.on_text(text)
+        if self.calibration and self.noise_floor is not None:
+            self.calibration.set(self.device_index, self.noise_floor)
+            self.calibration.save()
+
+    def close(self):
+        self.stop()
+        if self._pyaudio is not None:
+            self._pyaudio.terminate()
+            self._pyaudio = None
@@ -0,0 +1,182 @@
+"""
+Image to PDF conversion engine shared by the front-ends and the CLIs.
+
+imagepdf.py, MarMob.py, imagetopdfbeta.py, writer.py and batch_cli.py used
+to carry their own copies of the OCR to PDF loop. They now hand their images
+to ConversionEngine.convert(), which runs a pipeline of stages:
+
+    load -> preprocess -> recognize -> layout -> write
+
+load, preprocess and recognize run together on the OCR worker pool
+(ParallelOcrEngine), one image per task, so decoded images never have to
+cross a process boundary. layout turns each result into finished pages
+(wrapped lines of text, or the image data to embed) on a thread of its own,
+and write appends them to the PDF on the caller's thread, adding the text to
+the full-text index (text_index.py) when the engine has one. The stages are
+joined by bounded queues: when writing falls behind, layout blocks, the OCR
+window stops taking new images and memory stays flat however long the batch.
+
+"""
+
+import os
+import queue
+import threading
+from collections import namedtuple
+
+from ocr_engine import ParallelOcrEngine
+from pdf_images import load_image
+from pdf_writer import StreamingPdfWriter, TextLayout
+
+MODES = ("text", "searchable", "images")
+
+# The outcome for one source image. status is "ok", "empty" (no text was
+# found) or "error"; pages is the number of pages it added to output.
+PageResult = namedtuple("PageResult", ["source", "output", "status", "pages", "error"])
+
+# What the layout stage hands to the writer: text pages or an image to embed,
+# and the recognised text of each page to index.
+_Laid = namedtuple("_Laid", ["source", "output", "pages", "image", "words", "texts", "error"])
+
+_DONE = object()
+
+
+class _Failed:
+    def __init__(self, error):
+        self.error = error
+
+
+class ConversionEngine:
+    def __init__(self, workers=None, lang="eng", config="", use_processes=False, cache=None,
+                 preprocessor=None, backend=None, queue_size=4, layout=None, index=None):
+        self.cache = cache
+        self.index = index  # a TextIndex to add the recognised text to, or None
+        self.ocr = ParallelOcrEngine(workers=workers, lang=lang, config=config, use_processes=use_processes,
+                                     cache=cache, preprocessor=preprocessor, backend=backend)
+        self.queue_size = queue_size
+        self.layout = layout or TextLayout()
+
+    def close(self):
+        """Shut down the OCR workers."""
+        self.ocr.close()
+
+    def _recognized(self, sources, mode):
+        if mode == "text":
+            return self.ocr.imap(sources)
+        if mode == "searchable":
+            return self.ocr.imap_words(sources)
+        return iter(sources)
+
+    def _lay_out(self, result, mode, output_for, titles):
+        source = result if mode == "images" else result.path
+        output = output_for(source)
+        if mode != "images" and result.error:
+            return _Laid(source, output, None, None, None, None, result.error)
+        try:
+            if mode == "text":
+                if not result.text.strip():
+                    return _Laid(source, output, [], None, None, None, None)
+                title = f"Text from {os.path.basename(source)}:" if titles else None
+                pages = self.layout.paginate(result.text, title)
+                texts = self.layout.page_texts(result.text, title, pages) if self.index else None
+                return _Laid(source, output, pages, None, None, texts, None)
+            words, texts = (result.words, [result.text]) if mode == "searchable" else (None, None)
+            return _Laid(source, output, None, load_image(source), words, texts, None)
+        except Exception as e:
+            return _Laid(source, output, None, None, None, None, str(e))
+
+    def _layout_stage(self, sources, mode, output_for, titles, laid, stop):
+        def put(item):
+            while not stop.is_set():
+                try:
+                    laid.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        results = self._recognized(sources, mode)
+        try:
+            for result in results:
+                if not put(self._lay_out(result, mode, output_for, titles)):
+                    return
+            put(_DONE)
+        except BaseException as e:
+            put(_Failed(e))
+        finally:
+            close = getattr(results, "close", None)
+            if close:
+                close()
+
+    def convert(self, sources, output, mode="text", titles=False):
+        """
+        Convert image files to PDF, yielding a PageResult for each source once
+        its pages are on disk.
+
+        output is the PDF path, or a function giving the PDF for each source.
+        Sources with the same PDF share it and are converted one after the
+        other, in the order given; the PDFs are written in the order of their
+        first source. mode is "text" (the OCR text only), "searchable" (the
+        image with an invisible text layer) or "images" (the image, no OCR).
+        titles heads each text section with the name of its image. PDFs that
+        end up without pages are removed. Stopping the iteration early closes
+        the PDF written so far.
+        """
+        if mode not in MODES:
+            raise ValueError(f"Unknown mode: {mode}")
+        output_for = output if callable(output) else (lambda source: output)
+        if callable(output):
+            # Reopening a PDF would truncate it, so each one's sources go through together
+            groups = {}
+            for source in sources:
+                groups.setdefault(output_for(source), []).append(source)
+            sources = [source for group in groups.values() for source in group]
+        laid = queue.Queue(maxsize=self.queue_size)
+        stop = threading.Event()
+        worker = threading.Thread(target=self._layout_stage, args=(sources, mode, output_for, titles, laid, stop),
+                                  daemon=True)
+        worker.start()
+        pdf = None
+        try:
+            while True:
+                item = laid.get()
+                if item is _DONE:
+                    break
+                if isinstance(item, _Failed):
+                    raise item.error
+                if item.error:
+                    yield PageResult(item.source, item.output, "error", 0, item.error)
+                    continue
+                try:
+                    if pdf is None or pdf.path != item.output:
+                        _close(pdf)
+                        pdf = None
+                        os.makedirs(os.path.dirname(item.output) or ".", exist_ok=True)
+                        pdf = StreamingPdfWriter(item.output, layout=self.layout)
+                        if self.index:
+                            self.index.remove_pdf(item.output)  # whatever it held before is gone
+                    before = pdf.page_count
+                    if item.image is not None:
+                        pdf.add_image(item.image, words=item.words)
+                    else:
+                        pdf.add_pages(item.pages)
+                    pages = pdf.page_count - before
+                    if self.index and pages and item.texts:
+                        self.index.add_pages(item.source, item.output, item.texts, before + 1)
+                except Exception as e:
+                    yield PageResult(item.source, item.output, "error", 0, str(e))
+                    continue
+                yield PageResult(item.source, item.output, "ok" if pages else "empty", pages, None)
+        finally:
+            stop.set()
+            _close(pdf)
+            worker.join()
+            if self.index:
+                self.index.flush()
+
+
+def _close(pdf):
+    """Finish pdf, removing it if nothing was written to it."""
+    if pdf is not None:
+        pdf.close()
+        if pdf.page_count == 0:
+            os.remove(pdf.path)
@@ -0,0 +1,263 @@
+"""
+Incremental folder watch mode.
+
+Keeps a manifest of every image in a watched folder (size, mtime and a
+SHA-256 of its contents) next to the PDFs it produced. Each pass only OCRs
+images that are new or whose contents changed, rewrites the PDFs they end up
+in and removes the entries (and PDFs) of deleted images. With watchdog
+installed, passes are driven by file system events and only look at the
+paths that changed; otherwise the folder is polled, which costs one stat()
+per file plus the work for the changes. A directory that is created, moved
+or deleted whole triggers a full pass, as its files get no events of their
+own.
+
+In the dir layout a changed image means rewriting its directory's PDF. The
+other images in it come from the OCR cache; with --no-cache the watcher keeps
+a cache of its own next to the manifest, so only the changed images are
+recognised again.
+
+    python folder_watch.py inbox/ -o pdfs/ --layout dir --interval 30
+
+"""
+
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+
+import metrics
+from batch_cli import IMAGE_EXTENSIONS, BatchConverter, build_parser, enable_metrics, open_report, scan_tree
+from ocr_cache import OcrCache
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:
+    Observer = None
+
+MANIFEST_NAME = ".manifest.json"
+CACHE_NAME = ".ocr-cache"
+
+
+def file_digest(path):
+    """SHA-256 of a file's contents, read in blocks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class FolderWatcher:
+    def __init__(self, converter, manifest_path=None):
+        self.converter = converter
+        self.source_root = converter.source_root
+        self.manifest_path = manifest_path or os.path.join(converter.output_root, MANIFEST_NAME)
+        if converter.layout == "dir" and converter.engine.cache is None:
+            # Rewriting a directory's PDF must not OCR its unchanged images again
+            cache = OcrCache(os.path.join(os.path.dirname(self.manifest_path) or ".", CACHE_NAME))
+            converter.engine.cache = converter.engine.ocr.cache = cache
+        self.manifest = self.load_manifest()
+        for key, entry in self.manifest.items():
+            converter.reserve(os.path.join(self.source_root, key), entry["output"])
+        self._lock = threading.Lock()
+
+    def load_manifest(self):
+        """path relative to the source root -> {size, mtime, sha256, output, status}."""
+        try:
+            with open(self.manifest_path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save_manifest(self):
+        os.makedirs(os.path.dirname(self.manifest_path) or ".", exist_ok=True)
+        tmp_path = f"{self.manifest_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.manifest, f, ensure_ascii=False, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.manifest_path)
+
+    def relative(self, path):
+        return os.path.relpath(path, self.source_root)
+
+    def check(self, path):
+        """
+        Compare one path with its manifest entry: "changed", "deleted" or None.
+
+        The contents are only hashed when size or mtime differ, and a file
+        that was merely touched just gets its entry updated.
+        """
+        key = self.relative(path)
+        entry = self.manifest.get(key)
+        try:
+            st = os.stat(path)
+        except OSError:
+            return "deleted" if entry else None
+        if entry and entry["size"] == st.st_size and entry["mtime"] == st.st_mtime_ns:
+            return None
+        try:
+            digest = file_digest(path)
+        except OSError:
+            return None  # vanished or unreadable; the next pass will tell
+        changed = entry is None or entry["sha256"] != digest
+        self.manifest[key] = {"size": st.st_size, "mtime": st.st_mtime_ns, "sha256": digest,
+                              "output": self.converter.output_for(path),
+                              "status": entry.get("status") if entry and not changed else None}
+        return "changed" if changed else None
+
+    def scan(self):
+        """Full pass over the folder. Returns (changed, deleted) paths."""
+        skip = os.path.abspath(self.converter.output_root)
+        seen = set()
+        changed = []
+        for path in scan_tree(self.source_root, IMAGE_EXTENSIONS, skip):
+            seen.add(self.relative(path))
+            if self.check(path) == "changed":
+                changed.append(path)
+        deleted = [os.path.join(self.source_root, key) for key in self.manifest if key not in seen]
+        return changed, deleted
+
+    def apply(self, changed, deleted):
+        """Update the PDFs affected by changed and deleted images, then save the manifest."""
+        if not changed and not deleted:
+            return 0
+        outputs = set()
+        for path in deleted:
+            entry = self.manifest.pop(self.relative(path), None)
+            if entry:
+                outputs.add(entry["output"])
+        if self.converter.layout == "dir":
+            # A directory's PDF holds all its images; unchanged ones are OCR cache hits (see __init__)
+            for path in changed:
+                outputs.add(self.manifest[self.relative(path)]["output"])
+            todo = []
+            for output in sorted(outputs):
+                members = sorted(key for key, entry in self.manifest.items() if entry["output"] == output)
+                if members:
+                    todo.extend(os.path.join(self.source_root, key) for key in members)
+                else:
+                    self.remove_output(output)
+        else:
+            for output in outputs:
+                self.remove_output(output)
+            todo = changed
+        self.converter.convert_images(todo)
+        for path in todo:
+            entry = self.manifest.get(self.relative(path))
+            if entry:
+                entry["status"] = self.converter.results.get(path)
+        if self.converter.index:
+            self.converter.index.flush()
+        self.save_manifest()
+        metrics.flush()
+        return len(changed) + len(deleted)
+
+    def remove_output(self, output):
+        """Delete a PDF none of whose images are left, and its pages in the full-text index."""
+        if os.path.exists(output):
+            os.remove(output)
+        self.converter.release(output)
+        if self.converter.index:
+            self.converter.index.remove_pdf(output)
+
+    def run_once(self):
+        with self._lock:
+            return self.apply(*self.scan())
+
+    def process_paths(self, paths):
+        """Handle the paths a file system event named, without scanning the rest of the folder."""
+        with self._lock:
+            changed, deleted = [], []
+            for path in sorted(paths):
+                if not path.lower().endswith(IMAGE_EXTENSIONS):
+                    continue
+                result = self.check(path)
+                if result == "changed":
+                    changed.append(path)
+                elif result == "deleted":
+                    deleted.append(path)
+            return self.apply(changed, deleted)
+
+    def poll(self, interval=30.0):
+        while True:
+            self.run_once()
+            time.sleep(interval)
+
+    def watch(self, settle=2.0):
+        """Process file system events, waiting until paths have been quiet for settle seconds."""
+        pending = {}
+        lock = threading.Lock()
+        output_root = os.path.abspath(self.converter.output_root)
+
+        class Handler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                if event.is_directory:
+                    # The files of a directory created, moved or deleted whole get no events of their own
+                    if event.event_type in ("created", "moved", "deleted"):
+                        with lock:
+                            pending[None] = time.monotonic()
+                    return
+                for path in (event.src_path, getattr(event, "dest_path", None)):
+                    if path and not os.path.abspath(path).startswith(output_root + os.sep):
+                        with lock:
+                            pending[path] = time.monotonic()
+
+        self.run_once()  # catch up with anything that changed while we weren't watching
+        observer = Observer()
+        observer.schedule(Handler(), self.source_root, recursive=True)
+        observer.start()
+        try:
+            while True:
+                time.sleep(settle / 2)
+                now = time.monotonic()
+                with lock:
+                    ready = [path for path, at in pending.items() if now - at >= settle]  # None: rescan
+                    for path in ready:
+                        del pending[path]
+                if None in ready:
+                    self.run_once()
+                elif ready:
+                    self.process_paths(ready)
+        finally:
+            observer.stop()
+            observer.join()
+
+
+def main(argv=None):
+    parser = build_parser("Keep PDFs of a folder of images up to date, converting only what changed.")
+    parser.add_argument("--interval", type=float, default=30.0, help="seconds between passes when polling")
+    parser.add_argument("--once", action="store_true", help="do a single pass and exit")
+    parser.add_argument("--poll", action="store_true", help="poll even if watchdog is installed")
+    parser.add_argument("--manifest", help=f"manifest file (default: OUTPUT/{MANIFEST_NAME})")
+    args = parser.parse_args(argv)
+    if not os.path.isdir(args.source):
+        print(f"Not a directory: {args.source}", file=sys.stderr)
+        return 2
+    enable_metrics(args)
+    output = args.output or os.path.join(args.source, "pdf")
+    report = open_report(args.json, "a")
+    converter = BatchConverter(args.source, output, layout=args.layout, mode=args.mode, workers=args.workers,
+                               lang=args.lang, use_processes=args.processes, cache=not args.no_cache,
+                               report=report, index=not args.no_index)
+    watcher = FolderWatcher(converter, args.manifest)
+    try:
+        if args.once:
+            watcher.run_once()
+            return 1 if converter.failures else 0
+        if Observer is not None and not args.poll:
+            watcher.watch()
+        else:
+            watcher.poll(args.interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        converter.engine.close()
+        if report and report is not sys.stdout:
+            report.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,19 +1,28 @@
 import tkinter as tk
 from tkinter import filedialog, messagebox
-from PIL import Image
 import os
-from fpdf import FPDF
-import pytesseract
+import sys
+from engine import ConversionEngine
+from preprocess import Preprocessor
+from ocr_cache import OcrCache
+from text_index import get_index
+from jobs import JobExecutor, TkDispatcher
 
 # Make sure tesseract is installed and accessible
 # If it's not installed, download and install from https://github.com/tesseract-ocr/tesseract
 
 class ImageToPdfConverter:
-    def __init__(self, root, image_dir=None):
+    def __init__(self, root, image_dir=None, workers=None):
         self.root = root
         self.image_paths = []
+        self.ocr_cache = OcrCache()
+        self.engine = ConversionEngine(workers=workers, cache=self.ocr_cache, preprocessor=Preprocessor(),
+                                       index=get_index())
         self.selected_images = tk.Listbox(root)
+        self.status_label = tk.Label(root, text="Ready")
         self.image_dir = image_dir
+        # OCR runs off the Tk thread; results come back through the dispatcher
+        self.jobs = JobExecutor(TkDispatcher(root))
 
         self.initialise_ui()
         if image_dir:
@@ -29,6 +38,13 @@ class ImageToPdfConverter:
         convert_btn = tk.Button(self.root, text="Convert Images to PDF", command=self.convert_to_pdf)
         convert_btn.pack(pady=10)
 
+        embed_btn = tk.Button(self.root, text="Convert Images to PDF (no OCR)", command=self.convert_images_only)
+        embed_btn.pack(pady=10)
+
+        cancel_btn = tk.Button(self.root, text="Cancel", command=self.jobs.cancel_all)
+        cancel_btn.pack(pady=10)
+
+        self.status_label.pack()
         self.selected_images.pack(pady=20)
 
     def select_images(self):
@@ -44,44 +60,73 @@ class ImageToPdfConverter:
                     self.image_paths.append(os.path.join(image_dir, filename))
                     self.selected_images.insert(tk.END, os.path.join(image_dir, filename))
 
-    def extract_text_from_images(self):
-        text = ""
-        for image_path in self.image_paths:
-            img = Image.open(image_path)
-            extracted_text = pytesseract.image_to_string(img)
-            text += extracted_text + "\n"  # Append text with new lines between images
-        return text
+    def run_job(self, task, message):
+        self.status_label.config(text=message)
+        self.jobs.submit(task, on_progress=self.on_job_progress, on_done=self.on_job_done,
+                         on_error=self.on_job_error)
+
+    def on_job_progress(self, job, done, total, message):
+        self.status_label.config(text=f"{message} {done}/{total}")
+
+    def on_job_done(self, job, message):
+        if job.state == "cancelled":
+            self.status_label.config(text="Cancelled")
+            return
+        self.status_label.config(text="Ready")
+        messagebox.showinfo("Success", message)
+
+    def on_job_error(self, job, error):
+        self.status_label.config(text="Ready")
+        messagebox.showerror("Error", str(error))
+
+    def convert(self, job, image_paths, pdf_path, mode, message):
+        """Run image_paths through the conversion engine, warning about failures; returns the pages written."""
+        pages = 0
+        results = self.engine.convert(image_paths, pdf_path, mode=mode)
+        for result in job.track(results, len(image_paths), message):
+            if result.error:
+                job.post(messagebox.showwarning, "Warning", f"Failed to process {result.source}: {result.error}")
+            pages += result.pages
+        return pages
 
     def convert_to_pdf(self):
         if len(self.image_paths) > 0:
-            # Extract text from the images
-            extracted_text = self.extract_text_from_images()
-
-            if extracted_text:
-                pdf_path = filedialog.asksaveasfilename(defaultextension=".pdf", filetypes=[("PDF Files", "*.pdf")])
-                if pdf_path:
-                    pdf = FPDF()
-                    pdf.set_auto_page_break(auto=True)
-                    pdf.add_page()
-                    pdf.set_font("Arial", size=12)
-
-                    # Add the extracted text to the PDF
-                    pdf.multi_cell(0, 10, extracted_text)
-
-                    # Save the PDF
-                    pdf.output(pdf_path)
-                    messagebox.showinfo("Success", "PDF successfully created!")
-            else:
-                messagebox.showerror("Error", "No text extracted from images!")
+            pdf_path = filedialog.asksaveasfilename(defaultextension=".pdf", filetypes=[("PDF Files", "*.pdf")])
+            if pdf_path:
+                image_paths = list(self.image_paths)
+                self.run_job(lambda job: self._convert_to_pdf(job, image_paths, pdf_path), "Processing images...")
+        else:
+            messagebox.showerror("Error", "No images selected!")
+
+    def _convert_to_pdf(self, job, image_paths, pdf_path):
+        # Each image's text goes on its own page(s), written as soon as it is recognised
+        if not self.convert(job, image_paths, pdf_path, "text", "Processing images..."):
+            raise ValueError("No text extracted from images!")
+        stats = self.ocr_cache.stats()
+        return f"PDF successfully created!\nOCR cache: {stats['hits']} hits, {stats['misses']} misses"
+
+    def convert_images_only(self):
+        if len(self.image_paths) > 0:
+            pdf_path = filedialog.asksaveasfilename(defaultextension=".pdf", filetypes=[("PDF Files", "*.pdf")])
+            if pdf_path:
+                image_paths = list(self.image_paths)
+                self.run_job(lambda job: self._convert_images_only(job, image_paths, pdf_path), "Adding images...")
         else:
             messagebox.showerror("Error", "No images selected!")
 
+    def _convert_images_only(self, job, image_paths, pdf_path):
+        # JPEG and PNG data is copied into the PDF as is, without OCR or recompression
+        if not self.convert(job, image_paths, pdf_path, "images", "Adding images..."):
+            raise ValueError("No images could be added to the PDF!")
+        return "PDF successfully created!"
+
 def main():
     root = tk.Tk()
     root.title("Image to PDF Converter")
 
-    # Automatically select images from a predefined directory (optional)
-    image_dir = "path_to_your_image_folder"  # Replace with your directory path
+    # Optionally pre-select the images in a directory given on the command line
+    # (for conversions without a window see batch_cli.py)
+    image_dir = sys.argv[1] if len(sys.argv) > 1 else None
     converter = ImageToPdfConverter(root, image_dir=image_dir)
 
     root.geometry("600x800")
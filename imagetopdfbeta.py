@@ -7,14 +7,17 @@ the network connection in real time and adjusting its behavior accordingly.
  """
 
 
+import os
 import tkinter as tk
 from tkinter import filedialog, messagebox
-from PIL import Image, ImageTk
-from fpdf import FPDF
-import pytesseract
-import speech_recognition as sr
-import requests
-import fitz  # PyMuPDF for rendering PDFs
+from connectivity import get_monitor
+from jobs import JobExecutor, TkDispatcher
+
+# fitz, PIL, fpdf and speech_recognition are imported by the features that use
+# them, so the window opens without loading any of them.
+
+# What extract_text_from_audio returns for a recording long_audio has to split up
+LONG_AUDIO = object()
 
 
 class PDFReader:
@@ -23,21 +26,34 @@ class PDFReader:
         self.pdf_document = None
         self.pdf_page = 0
         self.pdf_label = None
+        self.page_cache = None
 
     def open_pdf(self):
         file_path = filedialog.askopenfilename(filetypes=[("PDF Files", "*.pdf")])
-        if not file_path:
+        if file_path:
+            self.open_pdf_at(file_path, 0)
+
+    def open_pdf_at(self, file_path, page):
+        if not os.path.exists(file_path):
+            messagebox.showerror("Error", f"{file_path} has been moved or deleted.")
             return
+        import fitz  # PyMuPDF for rendering PDFs
+        from page_cache import PageRenderCache
+
         self.pdf_document = fitz.open(file_path)
-        self.pdf_page = 0
+        self.pdf_page = min(max(page, 0), len(self.pdf_document) - 1)
+        if self.page_cache:
+            self.page_cache.close()
+        self.page_cache = PageRenderCache(self.pdf_document)
         self.display_pdf_page()
 
     def display_pdf_page(self):
         if self.pdf_document:
-            page = self.pdf_document.load_page(self.pdf_page)
-            pix = page.get_pixmap()
-            img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
-            img_tk = ImageTk.PhotoImage(img)
+            from pixmap_view import fit_zoom, pixmap_to_photo
+
+            zoom = fit_zoom(self.page_cache.page_rect(self.pdf_page), *self.view_size())
+            pix = self.page_cache.get(self.pdf_page, zoom)
+            img_tk = pixmap_to_photo(pix, self.root)
 
             if self.pdf_label:
                 self.pdf_label.configure(image=img_tk)
@@ -46,6 +62,12 @@ class PDFReader:
                 self.pdf_label = tk.Label(self.root, image=img_tk)
                 self.pdf_label.image = img_tk
                 self.pdf_label.pack()
+            self.page_cache.prefetch_around(self.pdf_page, zoom)
+
+    def view_size(self):
+        """Pixels available for the page: the window's width and the half below the buttons."""
+        self.root.update_idletasks()
+        return self.root.winfo_width(), self.root.winfo_height() // 2
 
     def next_page(self):
         if self.pdf_document and self.pdf_page < len(self.pdf_document) - 1:
@@ -58,9 +80,53 @@ class PDFReader:
             self.display_pdf_page()
 
 
-class ImageToPdfConverter:
-    def __init__(self):
+class BackgroundTasks:
+    """Runs conversions on the shared job executor and reports progress in a status label."""
+
+    def __init__(self, jobs=None, status_label=None):
+        self.jobs = jobs
+        self.status_label = status_label
+
+    def set_status(self, text):
+        if self.status_label:
+            self.status_label.config(text=text)
+
+    def run_job(self, task, message, on_done=None):
+        self.set_status(message)
+        self.jobs.submit(task, on_progress=self.on_job_progress, on_done=on_done or self.on_job_done,
+                         on_error=self.on_job_error)
+
+    def on_job_progress(self, job, done, total, message):
+        self.set_status(f"{message} {done}/{total}")
+
+    def on_job_done(self, job, message):
+        if job.state == "cancelled":
+            self.set_status("Cancelled")
+            return
+        self.set_status("Ready")
+        messagebox.showinfo("Success", message)
+
+    def on_job_error(self, job, error):
+        self.set_status("Ready")
+        messagebox.showerror("Error", str(error))
+
+
+class ImageToPdfConverter(BackgroundTasks):
+    def __init__(self, workers=None, jobs=None, status_label=None):
+        super().__init__(jobs, status_label)
         self.image_paths = []
+        self.workers = workers
+        self._engine = None
+
+    @property
+    def engine(self):
+        if self._engine is None:
+            from engine import ConversionEngine
+            from preprocess import Preprocessor
+            from text_index import get_index
+
+            self._engine = ConversionEngine(workers=self.workers, preprocessor=Preprocessor(), index=get_index())
+        return self._engine
 
     def select_images(self, filechooser, popup):
         filepaths = filechooser.selection
@@ -68,33 +134,79 @@ class ImageToPdfConverter:
             self.image_paths.append(filepath)
         popup.dismiss()
 
-    def extract_text_from_images(self):
-        text = ""
-        for image_path in self.image_paths:
-            try:
-                img = Image.open(image_path)
-                text += f"Text from {os.path.basename(image_path)}:\n{pytesseract.image_to_string(img)}\n\n"
-            except Exception as e:
-                messagebox.showwarning("Warning", f"Failed to process {image_path}: {str(e)}")
-        return text
+    def convert(self, job, image_paths, pdf_path, mode, message="Processing images..."):
+        """Run image_paths through the conversion engine, warning about failures; returns the pages written."""
+        pages = 0
+        results = self.engine.convert(image_paths, pdf_path, mode=mode, titles=True)
+        for result in job.track(results, len(image_paths), message):
+            if result.error:
+                job.post(messagebox.showwarning, "Warning", f"Failed to process {result.source}: {result.error}")
+            pages += result.pages
+        return pages
 
-    def save_pdf(self, text):
+    def convert_to_pdf(self):
+        pdf_path = filedialog.asksaveasfilename(defaultextension=".pdf", filetypes=[("PDF Files", "*.pdf")])
+        if not pdf_path:
+            return
+        image_paths = list(self.image_paths)
+        self.run_job(lambda job: self._convert_to_pdf(job, image_paths, pdf_path), "Processing images...")
+
+    def _convert_to_pdf(self, job, image_paths, pdf_path):
+        if not self.convert(job, image_paths, pdf_path, "text"):
+            raise ValueError("No text extracted from images!")
+        return "PDF successfully created!"
+
+    def convert_to_searchable_pdf(self):
+        """Images with an invisible OCR text layer, from a single recognition per page."""
+        pdf_path = filedialog.asksaveasfilename(defaultextension=".pdf", filetypes=[("PDF Files", "*.pdf")])
+        if not pdf_path:
+            return
+        image_paths = list(self.image_paths)
+        self.run_job(lambda job: self._convert_to_searchable_pdf(job, image_paths, pdf_path), "Processing images...")
+
+    def _convert_to_searchable_pdf(self, job, image_paths, pdf_path):
+        if not self.convert(job, image_paths, pdf_path, "searchable"):
+            raise ValueError("No images could be converted!")
+        return "PDF successfully created!"
+
+    def convert_images_only(self):
+        """Put the images themselves into a PDF, one per page, without OCR."""
+        pdf_path = filedialog.asksaveasfilename(defaultextension=".pdf", filetypes=[("PDF Files", "*.pdf")])
+        if not pdf_path:
+            return
+        image_paths = list(self.image_paths)
+        self.run_job(lambda job: self._convert_images_only(job, image_paths, pdf_path), "Adding images...")
+
+    def _convert_images_only(self, job, image_paths, pdf_path):
+        if not self.convert(job, image_paths, pdf_path, "images", "Adding images..."):
+            raise ValueError("No images could be added to the PDF!")
+        return "PDF successfully created!"
+
+    def save_pdf(self, text, source=None):
+        """Ask where to save text as a PDF; with source, also index it as that file's text."""
         pdf_path = filedialog.asksaveasfilename(defaultextension=".pdf", filetypes=[("PDF Files", "*.pdf")])
         if pdf_path:
+            from pdf_writer import StreamingPdfWriter
+            from text_index import get_index
+
             try:
-                pdf = FPDF()
-                pdf.add_page()
-                pdf.set_font("Arial", size=12)
-                pdf.multi_cell(0, 10, text.encode('latin-1', 'replace').decode('latin-1'))
-                pdf.output(pdf_path)
+                index = get_index()
+                index.remove_pdf(pdf_path)  # it may be overwriting an indexed PDF
+                with StreamingPdfWriter(pdf_path) as pdf:
+                    pdf.add_text(text)
+                if source:
+                    index.add_text(source, pdf_path, text)
+                index.flush()
                 messagebox.showinfo("Success", "PDF successfully created!")
             except Exception as e:
                 messagebox.showerror("Error", f"Failed to create PDF: {str(e)}")
 
 
-class AudioToPdfConverter:
-    def __init__(self):
+class AudioToPdfConverter(BackgroundTasks):
+    def __init__(self, jobs=None, status_label=None, image_converter=None):
+        super().__init__(jobs, status_label)
         self.audio_file = None
+        self.image_converter = image_converter
 
     def select_audio(self):
         filepaths = filedialog.askopenfilenames(filetypes=[("Audio Files", "*.wav;*.mp3;*.ogg")])
@@ -105,44 +217,101 @@ class AudioToPdfConverter:
         if not self.audio_file:
             messagebox.showerror("Error", "No audio file selected!")
             return
-        text = self.extract_text_from_audio()
-        if text:
-            ImageToPdfConverter().save_pdf(text)
+        audio_file = self.audio_file
+        # The text is recognised in the background, then saved from the Tk thread
+        self.run_job(lambda job: self.extract_text_from_audio(job, audio_file), "Processing audio...",
+                     on_done=lambda job, text: self.on_text_extracted(job, text, audio_file))
+
+    def on_text_extracted(self, job, text, audio_file=None):
+        self.set_status("Ready")
+        if text is LONG_AUDIO:
+            self.process_long_audio_to_pdf(audio_file)
+        elif text:
+            (self.image_converter or ImageToPdfConverter()).save_pdf(text, audio_file)
+
+    def process_long_audio_to_pdf(self, audio_file=None):
+        """Recognise a long recording in parallel segments, writing each to the PDF as it finishes."""
+        pdf_path = filedialog.asksaveasfilename(defaultextension=".pdf", filetypes=[("PDF Files", "*.pdf")])
+        if not pdf_path:
+            return
+        audio_file = audio_file or self.audio_file
+        self.run_job(lambda job: self._process_long_audio_to_pdf(job, audio_file, pdf_path), "Processing audio...")
+
+    def _process_long_audio_to_pdf(self, job, audio_file, pdf_path):
+        from long_audio import audio_duration, transcribe_long_audio
+        from pdf_writer import StreamingPdfWriter
+        from text_index import get_index
+
+        length = audio_duration(audio_file)
+        index = get_index()
+        index.remove_pdf(pdf_path)  # it may be overwriting an indexed PDF
+
+        def on_text(segment, text):
+            job.check_cancelled()
+            pdf.write_text(text)
+            job.progress(int(segment.end), int(length), "Processing audio (seconds)...")
+
+        try:
+            with StreamingPdfWriter(pdf_path) as pdf:
+                pdf.begin_text()
+                text = transcribe_long_audio(audio_file, backend="google" if self.is_connected() else "sphinx",
+                                             on_text=on_text)
+        except BaseException:
+            # Cancelled or failed: don't leave half a transcript behind
+            if os.path.exists(pdf_path):
+                os.remove(pdf_path)
+            raise
+        if not text:
+            os.remove(pdf_path)
+            raise ValueError("Speech Recognition could not understand the audio.")
+        index.add_text(audio_file, pdf_path, text)
+        index.flush()
+        return "PDF successfully created!"
+
+    def extract_text_from_audio(self, job, audio_file):
+        """The text of a short recording, or LONG_AUDIO if it is too long to recognise in one go."""
+        import speech_recognition as sr
+        from long_audio import LONG_AUDIO_SECONDS, audio_duration, load_audio
+        from speech_client import get_client
 
-    def extract_text_from_audio(self):
-        recognizer = sr.Recognizer()
         try:
-            with sr.AudioFile(self.audio_file) as source:
-                audio = recognizer.record(source)
-                if self.is_connected():
-                    try:
-                        return recognizer.recognize_google(audio)
-                    except sr.RequestError:
-                        messagebox.showwarning("Warning", "Google Speech Recognition service is unavailable.")
-                return recognizer.recognize_sphinx(audio)
+            # Measuring may mean running ffprobe, so it is done here rather than on the Tk thread
+            if audio_duration(audio_file) > LONG_AUDIO_SECONDS:
+                return LONG_AUDIO
+            audio = load_audio(audio_file)
+            if self.is_connected():
+                # Falls back to PocketSphinx by itself if Google is slow or unreachable
+                return get_client().recognize(audio)
+            return sr.Recognizer().recognize_sphinx(audio)
         except sr.UnknownValueError:
-            messagebox.showerror("Error", "Speech Recognition could not understand the audio.")
+            job.post(messagebox.showerror, "Error", "Speech Recognition could not understand the audio.")
         except Exception as e:
-            messagebox.showerror("Error", f"Audio processing failed: {str(e)}")
+            job.post(messagebox.showerror, "Error", f"Audio processing failed: {str(e)}")
         return None
 
     @staticmethod
     def is_connected():
-        try:
-            requests.get("http://www.google.com", timeout=3)
-            return True
-        except requests.ConnectionError:
-            return False
+        """Cached connectivity; waits for the first probe, so only call it from a job."""
+        monitor = get_monitor()
+        monitor.wait_for_first_check(timeout=2)
+        return monitor.is_online
 
 
 class Application(tk.Frame):
     def __init__(self, master=None):
         super().__init__(master)
         self.master = master
-        self.image_converter = ImageToPdfConverter()
-        self.audio_converter = AudioToPdfConverter()
+        # Conversions run in the background, one at a time, so the window stays responsive
+        self.jobs = JobExecutor(TkDispatcher(self.master))
+        self.status_label = tk.Label(self.master, text="Ready")
+        self.image_converter = ImageToPdfConverter(jobs=self.jobs, status_label=self.status_label)
+        self.search_hits = []
+        self.audio_converter = AudioToPdfConverter(jobs=self.jobs, status_label=self.status_label,
+                                                   image_converter=self.image_converter)
         self.pdf_reader = PDFReader(self.master)
         self.create_widgets()
+        # Start probing once the window is up, so the state is known before the first conversion
+        self.master.after_idle(get_monitor)
 
     def create_widgets(self):
         self.title_label = tk.Label(self.master, text="Image to PDF Converter", font=("Helvetica", 16, "bold"))
@@ -155,6 +324,14 @@ class Application(tk.Frame):
         self.convert_btn = tk.Button(self.master, text="Convert Images to PDF", command=self.convert_to_pdf)
         self.convert_btn.pack(pady=10)
 
+        self.embed_images_btn = tk.Button(self.master, text="Convert Images to PDF (no OCR)",
+                                          command=self.convert_images_only)
+        self.embed_images_btn.pack(pady=10)
+
+        self.searchable_btn = tk.Button(self.master, text="Convert Images to Searchable PDF",
+                                        command=self.convert_to_searchable_pdf)
+        self.searchable_btn.pack(pady=10)
+
         # Audio conversion
         self.select_audio_btn = tk.Button(self.master, text="Select Audio for Speech-to-Text", command=self.select_audio)
         self.select_audio_btn.pack(pady=10)
@@ -162,6 +339,10 @@ class Application(tk.Frame):
         self.convert_audio_btn = tk.Button(self.master, text="Convert Audio to PDF", command=self.convert_audio_to_pdf)
         self.convert_audio_btn.pack(pady=10)
 
+        self.cancel_btn = tk.Button(self.master, text="Cancel", command=self.jobs.cancel_all)
+        self.cancel_btn.pack(pady=10)
+        self.status_label.pack()
+
         # PDF Reader
         self.open_pdf_btn = tk.Button(self.master, text="Open PDF", command=self.pdf_reader.open_pdf)
         self.open_pdf_btn.pack(pady=10)
@@ -172,20 +353,60 @@ class Application(tk.Frame):
         self.prev_page_btn = tk.Button(self.master, text="Previous Page", command=self.pdf_reader.previous_page)
         self.prev_page_btn.pack(pady=5)
 
+        # Search the text of everything converted so far; picking a hit opens its page
+        self.search_entry = tk.Entry(self.master, width=40)
+        self.search_entry.bind("<Return>", lambda event: self.search())
+        self.search_entry.pack(pady=5)
+
+        self.search_btn = tk.Button(self.master, text="Search PDFs", command=self.search)
+        self.search_btn.pack(pady=5)
+
+        self.search_results = tk.Listbox(self.master, height=5, width=80)
+        self.search_results.bind("<<ListboxSelect>>", self.open_search_hit)
+        self.search_results.pack(pady=5)
+
     def select_images(self):
         filechooser = filedialog.askopenfilenames(filetypes=[("Image Files", "*.png;*.jpg;*.jpeg;*.bmp;*.gif")])
         self.image_converter.select_images(filechooser, self)
 
     def convert_to_pdf(self):
-        text = self.image_converter.extract_text_from_images()
-        if not text.strip():
-            messagebox.showerror("Error", "No text extracted from images!")
+        if not self.image_converter.image_paths:
+            messagebox.showerror("Error", "No images selected!")
+            return
+        self.image_converter.convert_to_pdf()
+
+    def convert_to_searchable_pdf(self):
+        if not self.image_converter.image_paths:
+            messagebox.showerror("Error", "No images selected!")
             return
-        self.image_converter.save_pdf(text)
+        self.image_converter.convert_to_searchable_pdf()
+
+    def convert_images_only(self):
+        if not self.image_converter.image_paths:
+            messagebox.showerror("Error", "No images selected!")
+            return
+        self.image_converter.convert_images_only()
 
     def select_audio(self):
         self.audio_converter.select_audio()
 
+    def search(self):
+        from text_index import get_index
+
+        self.search_hits = get_index().search(self.search_entry.get())
+        self.search_results.delete(0, tk.END)
+        for hit in self.search_hits:
+            snippet = " ".join(hit.snippet.split())
+            self.search_results.insert(tk.END, f"{os.path.basename(hit.pdf)}, page {hit.page}: {snippet}")
+        if not self.search_hits:
+            self.search_results.insert(tk.END, "No matches")
+
+    def open_search_hit(self, event):
+        selection = self.search_results.curselection()
+        if selection and selection[0] < len(self.search_hits):
+            hit = self.search_hits[selection[0]]
+            self.pdf_reader.open_pdf_at(hit.pdf, hit.page - 1)
+
     def convert_audio_to_pdf(self):
         self.audio_converter.process_audio_to_pdf()
 
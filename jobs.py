@@ -0,0 +1,183 @@
+"""
+Background job executor for the Kivy and Tk front-ends.
+
+Conversions used to run on the UI thread (Kivy's Clock only delayed them),
+freezing the window for the whole batch. Jobs here run on worker threads and
+talk to the UI only through a dispatcher that hands calls over to the UI
+thread. Progress updates are coalesced, so a fast job can't flood the UI
+with more events than it can draw, and a job can be cancelled between
+items.
+
+"""
+
+import queue
+import threading
+
+from metrics import stage
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class KivyDispatcher:
+    """Run calls on the Kivy main thread."""
+
+    def post(self, fn, *args):
+        from kivy.clock import Clock
+
+        Clock.schedule_once(lambda dt: fn(*args), 0)
+
+
+class TkDispatcher:
+    """Run calls on the Tk main loop, which must not be touched from other threads."""
+
+    def __init__(self, root, poll_ms=15):
+        self.root = root
+        self.poll_ms = poll_ms
+        self._calls = queue.Queue()
+        self.root.after(self.poll_ms, self._drain)
+
+    def post(self, fn, *args):
+        self._calls.put((fn, args))
+
+    def _drain(self):
+        while True:
+            try:
+                fn, args = self._calls.get_nowait()
+            except queue.Empty:
+                break
+            fn(*args)
+        self.root.after(self.poll_ms, self._drain)
+
+
+class Job:
+    def __init__(self, task, dispatcher, on_progress=None, on_done=None, on_error=None, name=""):
+        self.task = task
+        self.dispatcher = dispatcher
+        self.on_progress = on_progress
+        self.on_done = on_done
+        self.on_error = on_error
+        self.name = name
+        self.state = "queued"
+        self._cancelled = threading.Event()
+        self._progress = None
+        self._progress_posted = False
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def cancel(self):
+        """Ask the job to stop at the next item boundary (or not to start at all)."""
+        self._cancelled.set()
+
+    def check_cancelled(self):
+        """Called by the task between items; raises JobCancelled if cancel() was called."""
+        if self._cancelled.is_set():
+            raise JobCancelled()
+
+    def post(self, fn, *args):
+        """Run fn(*args) on the UI thread."""
+        self.dispatcher.post(fn, *args)
+
+    def progress(self, done, total, message=""):
+        """Report progress; only the latest value is delivered if the UI is behind."""
+        if self.on_progress is None:
+            return
+        with self._lock:
+            self._progress = (done, total, message)
+            if self._progress_posted:
+                return
+            self._progress_posted = True
+        self.dispatcher.post(self._deliver_progress)
+
+    def track(self, items, total, message=""):
+        """Iterate items, stopping if cancelled and reporting progress after each one."""
+        done = 0
+        self.progress(done, total, message)
+        try:
+            for item in items:
+                self.check_cancelled()
+                yield item
+                done += 1
+                self.progress(done, total, message)
+        finally:
+            # Let a generator (e.g. a conversion pipeline) shut down as soon as the job stops
+            close = getattr(items, "close", None)
+            if close:
+                close()
+
+    def _deliver_progress(self):
+        with self._lock:
+            progress = self._progress
+            self._progress_posted = False
+        self.on_progress(self, *progress)
+
+    def run(self):
+        if self.cancelled:
+            self.state = "cancelled"
+        else:
+            self.state = "running"
+            try:
+                with stage(f"job.{self.name or 'unnamed'}", items=1):
+                    result = self.task(self)
+                self.state = "done"
+            except JobCancelled:
+                self.state = "cancelled"
+            except Exception as e:
+                self.state = "failed"
+                if self.on_error:
+                    self.post(self.on_error, self, e)
+                return
+        if self.on_done:
+            self.post(self.on_done, self, result if self.state == "done" else None)
+
+
+class JobExecutor:
+    """Runs submitted jobs in order on a small pool of worker threads."""
+
+    def __init__(self, dispatcher, workers=1):
+        self.dispatcher = dispatcher
+        self._jobs = queue.Queue()
+        self._active = []
+        self._lock = threading.Lock()
+        for _ in range(workers):
+            threading.Thread(target=self._worker, daemon=True).start()
+
+    def submit(self, task, on_progress=None, on_done=None, on_error=None, name=""):
+        """
+        Queue task(job) to run on a worker thread and return its Job.
+
+        The task should call job.check_cancelled() and job.progress() between
+        items and use job.post() for anything that touches the UI. on_progress,
+        on_done and on_error are called on the UI thread.
+        """
+        job = Job(task, self.dispatcher, on_progress, on_done, on_error, name)
+        with self._lock:
+            self._active.append(job)
+        self._jobs.put(job)
+        return job
+
+    def _worker(self):
+        while True:
+            job = self._jobs.get()
+            try:
+                job.run()
+            finally:
+                with self._lock:
+                    self._active.remove(job)
+
+    def pending(self):
+        """Jobs that are queued or running."""
+        with self._lock:
+            return list(self._active)
+
+    def cancel_all(self):
+        for job in self.pending():
+            job.cancel()
+
+    def post(self, fn, *args):
+        """Run fn(*args) on the UI thread."""
+        self.dispatcher.post(fn, *args)
@@ -0,0 +1,257 @@
+"""
+Long-audio speech to text.
+
+recognizer.record() loads a whole recording into memory and sends it off as
+one request. For long recordings we instead decode the file block by block
+(see audio_io),
+cut it into segments at silences found with an energy-based voice activity
+detector, recognise the segments in parallel and hand the text back in
+order as soon as each segment (and every one before it) is done.
+
+"""
+
+import json
+import os
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+import speech_recognition as sr
+
+from audio_io import SAMPLE_WIDTH, TARGET_RATE, AudioStream, duration, read_pcm
+from metrics import stage
+
+# Recordings longer than this are converted in long-audio mode.
+LONG_AUDIO_SECONDS = 60
+
+Segment = namedtuple("Segment", ["index", "start", "end", "pcm", "sample_rate", "sample_width"])
+
+
+def audio_duration(audio_path):
+    """Length of an audio file in seconds, or 0 if it can't be read."""
+    try:
+        return duration(audio_path)
+    except Exception:
+        return 0
+
+
+def load_audio(audio_path):
+    """A whole (short) recording of any supported format as 16 kHz AudioData."""
+    return sr.AudioData(read_pcm(audio_path), TARGET_RATE, SAMPLE_WIDTH)
+
+
+def frame_energies(pcm, sample_width, frame_len):
+    """RMS energy, as a fraction of full scale, of every whole frame in pcm."""
+    if sample_width == 1:
+        samples = np.frombuffer(pcm, dtype=np.uint8).astype(np.float32) - 128
+    else:
+        dtype = {2: "<i2", 4: "<i4"}[sample_width]
+        samples = np.frombuffer(pcm, dtype=dtype).astype(np.float32)
+    full_scale = float(2 ** (8 * sample_width - 1))
+    frames = samples[:len(samples) // frame_len * frame_len].reshape(-1, frame_len) / full_scale
+    return np.sqrt((frames ** 2).mean(axis=1))
+
+
+def track_noise_floor(floor, energy, voiced=False):
+    """
+    The noise floor after a frame. Unvoiced frames pull it down quickly and up
+    slowly; voiced ones move it very slowly, so a floor that started too low
+    still catches up with steady background noise.
+    """
+    if voiced:
+        return 0.999 * floor + 0.001 * energy
+    return min(energy, 0.95 * floor + 0.05 * energy)
+
+
+class SilenceSplitter:
+    """
+    Cut a stream of mono PCM into voiced segments.
+
+    A frame is voiced when its energy is well above a running estimate of
+    the noise floor, which starts at min_energy: the recording may well open
+    with speech. A segment ends after min_silence_ms of unvoiced frames, or at
+    max_segment_s, and keeps up to pad_ms of silence on either side.
+    """
+
+    def __init__(self, sample_rate, sample_width, frame_ms=30, min_silence_ms=400, max_segment_s=30,
+                 pad_ms=200, energy_ratio=3.0, min_energy=0.003):
+        self.sample_rate = sample_rate
+        self.sample_width = sample_width
+        self.frame_len = max(1, sample_rate * frame_ms // 1000)
+        self.frame_bytes = self.frame_len * sample_width
+        self.min_silence = max(1, min_silence_ms // frame_ms)
+        self.max_frames = max(1, int(max_segment_s * 1000 // frame_ms))
+        self.pad = max(0, pad_ms // frame_ms)
+        self.energy_ratio = energy_ratio
+        self.min_energy = min_energy
+        self.noise_floor = min_energy
+        self._leftover = b""
+        self._frame_no = 0
+        self._index = 0
+        self._frames = deque(maxlen=self.pad)
+        self._start = 0
+        self._voiced = False
+        self._silence_run = 0
+
+    def _segment(self, frames):
+        pcm = b"".join(frames)
+        start = self._start * self.frame_len / self.sample_rate
+        segment = Segment(self._index, start, start + len(frames) * self.frame_len / self.sample_rate,
+                          pcm, self.sample_rate, self.sample_width)
+        self._index += 1
+        return segment
+
+    def _reset(self):
+        self._frames = deque(maxlen=self.pad)
+        self._voiced = False
+        self._silence_run = 0
+
+    def feed(self, pcm):
+        """Take the next block of PCM and yield any segments it completes."""
+        data = self._leftover + pcm
+        usable = len(data) // self.frame_bytes * self.frame_bytes
+        self._leftover = data[usable:]
+        energies = frame_energies(data[:usable], self.sample_width, self.frame_len)
+        for i, energy in enumerate(energies):
+            frame = data[i * self.frame_bytes:(i + 1) * self.frame_bytes]
+            voiced = energy > max(self.noise_floor * self.energy_ratio, self.min_energy)
+            self.noise_floor = track_noise_floor(self.noise_floor, energy, voiced)
+
+            if not self._voiced and not voiced:
+                self._frames.append(frame)  # only the last pad_ms are kept
+            else:
+                if not self._voiced:
+                    self._frames = deque(self._frames)  # unbounded while in speech
+                    self._start = self._frame_no - len(self._frames)
+                    self._voiced = True
+                self._frames.append(frame)
+                self._silence_run = 0 if voiced else self._silence_run + 1
+                if self._silence_run >= self.min_silence or len(self._frames) >= self.max_frames:
+                    frames = list(self._frames)
+                    if self._silence_run > self.pad:
+                        frames = frames[:len(frames) - (self._silence_run - self.pad)]
+                    yield self._segment(frames)
+                    self._reset()
+            self._frame_no += 1
+
+    def flush(self):
+        """Yield the last segment once the input has ended."""
+        if self._voiced and self._frames:
+            yield self._segment(list(self._frames))
+        self._reset()
+
+
+def iter_segments(audio_path, block_seconds=1.0, **options):
+    """Decode audio_path block by block and yield its voiced Segments as 16 kHz PCM."""
+    splitter = SilenceSplitter(TARGET_RATE, SAMPLE_WIDTH, **options)
+    for pcm in AudioStream(audio_path, TARGET_RATE, block_seconds):
+        yield from splitter.feed(pcm)
+    yield from splitter.flush()
+
+
+def recognize_segment(backend, segment, language="en-US", model_path=None):
+    """Recognise one Segment, returning "" when nothing intelligible was said."""
+    recognizer = sr.Recognizer()
+    audio = sr.AudioData(segment.pcm, segment.sample_rate, segment.sample_width)
+    try:
+        with stage(f"speech.{backend}", items=1, nbytes=len(segment.pcm)):
+            if backend == "google":
+                from speech_client import get_client
+
+                return get_client().recognize(audio, language=language)
+            if backend == "vosk":
+                import vosk
+                from vosk_models import registry
+
+                kaldi = vosk.KaldiRecognizer(registry.get(model_path), segment.sample_rate)
+                kaldi.AcceptWaveform(segment.pcm)
+                return json.loads(kaldi.FinalResult()).get("text", "")
+            return recognizer.recognize_sphinx(audio)
+    except sr.UnknownValueError:
+        return ""
+
+
+def segment_executor(backend, workers=None, online_concurrency=4):
+    """
+    The pool transcribe_long_audio recognises backend's segments on: a process
+    pool for the offline backends (sphinx, vosk), a small thread pool for the
+    online one (google) so we don't flood the service.
+    """
+    if backend == "google":
+        return ThreadPoolExecutor(max_workers=online_concurrency)
+    return ProcessPoolExecutor(max_workers=workers or max(1, os.cpu_count() or 1))
+
+
+def transcribe_long_audio(audio_path, backend="sphinx", language="en-US", workers=None, online_concurrency=4,
+                          model_path=None, on_text=None, executor=None, **options):
+    """
+    Transcribe audio_path segment by segment and return the full text.
+
+    Segments are recognised in parallel on segment_executor(backend, workers,
+    online_concurrency), or on executor if one is given; that one is left
+    running, so several recordings can share it. on_text is called with
+    (segment, text) for every segment, in order, as soon as it and all
+    segments before it have been recognised.
+    """
+    own_executor = executor is None
+    if own_executor:
+        executor = segment_executor(backend, workers, online_concurrency)
+    if backend == "google":
+        window = online_concurrency * 2
+    else:
+        window = (workers or max(1, os.cpu_count() or 1)) * 2
+
+    texts = []
+    pending = deque()
+
+    def collect():
+        segment, future = pending.popleft()
+        text = future.result().strip()
+        if text:
+            texts.append(text)
+            if on_text:
+                on_text(segment, text)
+
+    try:
+        for segment in iter_segments(audio_path, **options):
+            pending.append((segment, executor.submit(recognize_segment, backend, segment, language, model_path)))
+            if len(pending) >= window:
+                collect()
+        while pending:
+            collect()
+    except BaseException:
+        # Cancelled or failed: don't wait for segments whose text nobody will read
+        for segment, future in pending:
+            future.cancel()
+        if own_executor:
+            executor.shutdown(wait=False, cancel_futures=True)
+        raise
+    if own_executor:
+        executor.shutdown()
+    return "\n".join(texts)
+
+
+def stream_vosk(audio_path, model, on_text=None, block_seconds=0.5):
+    """
+    Feed audio_path to a single Vosk recogniser one block at a time.
+
+    Vosk finds utterance boundaries itself, so this needs no segmentation;
+    on_text is called with each utterance as it is finalised.
+    """
+    import vosk
+
+    recognizer = vosk.KaldiRecognizer(model, TARGET_RATE)
+    texts = []
+
+    def finished(result):
+        text = json.loads(result).get("text", "").strip()
+        if text:
+            texts.append(text)
+            if on_text:
+                on_text(None, text)
+
+    for pcm in AudioStream(audio_path, TARGET_RATE, block_seconds):
+        if recognizer.AcceptWaveform(pcm):
+            finished(recognizer.Result())
+    finished(recognizer.FinalResult())
+    return "\n".join(texts)
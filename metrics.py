@@ -0,0 +1,274 @@
+"""
+Lightweight per-stage metrics.
+
+Stages of the conversion pipeline (image decode, preprocessing, Tesseract,
+PDF writing, audio decode, speech recognition, ...) are wrapped in
+`with stage("name"):` blocks or decorated with `@timed("name")`. While
+metrics are disabled (the default) a stage costs one attribute check. When
+enabled, every stage records its duration plus optional item and byte counts
+and, if asked for, the tracemalloc peak while it ran (see below). Results can be
+streamed as JSON lines and summarised (count, sum, p50, p95) into a
+Prometheus text file.
+
+Enable from the environment, e.g. for a batch run:
+
+    ANAPRO_METRICS=metrics.jsonl ANAPRO_METRICS_PROM=metrics.prom python batch_cli.py scans/
+
+or from code with metrics.enable(...). Stages that run in a process pool
+are recorded in the worker processes and don't show up here. tracemalloc
+keeps one peak for the whole process, so only a stage that starts while no
+other stage is open records it: the peak traced memory of the process while
+the stage ran, its nested stages included. Stages that overlap it, nested or
+on other threads, record no peak, and anything those other threads allocate
+counts towards it.
+
+"""
+
+import atexit
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+from collections import deque
+
+
+class _NullStage:
+    """What stage() returns while metrics are disabled."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def add(self, items=0, nbytes=0):
+        pass
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage:
+    def __init__(self, registry, name, items, nbytes):
+        self.registry = registry
+        self.name = name
+        self.items = items
+        self.bytes = nbytes
+
+    def add(self, items=0, nbytes=0):
+        """Count items/bytes processed by this stage once they are known."""
+        self.items += items
+        self.bytes += nbytes
+
+    def __enter__(self):
+        self.traces_peak = self.registry._open_stage()
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        seconds = time.perf_counter() - self.started
+        peak = self.registry._close_stage(self.traces_peak)
+        self.registry.record(self.name, seconds, self.items, self.bytes, peak, exc_type is not None)
+        return False
+
+
+class _StageStats:
+    def __init__(self, max_samples):
+        self.count = 0
+        self.errors = 0
+        self.seconds = 0.0
+        self.items = 0
+        self.bytes = 0
+        self.peak = 0
+        self.samples = deque(maxlen=max_samples)
+
+
+def _quantile(ordered, q):
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+class Metrics:
+    def __init__(self, max_samples=10000):
+        self.enabled = False
+        self.trace_memory = False
+        self.max_samples = max_samples
+        self._stats = {}
+        self._lock = threading.Lock()
+        self._open_stages = 0
+        self._jsonl = None
+        self._prometheus_path = None
+
+    def enable(self, jsonl_path=None, prometheus_path=None, trace_memory=False):
+        """Start recording; stream stages to jsonl_path and write a summary to prometheus_path at exit."""
+        with self._lock:
+            if jsonl_path and self._jsonl is None:
+                self._jsonl = open(jsonl_path, "a", encoding="utf-8")
+            if prometheus_path:
+                if self._prometheus_path is None:
+                    atexit.register(self.flush)
+                self._prometheus_path = prometheus_path
+            if trace_memory and not tracemalloc.is_tracing():
+                tracemalloc.start()
+            self.trace_memory = trace_memory
+            self.enabled = True
+
+    def disable(self):
+        with self._lock:
+            self.enabled = False
+            if self.trace_memory:
+                tracemalloc.stop()
+                self.trace_memory = False
+            if self._jsonl:
+                self._jsonl.close()
+                self._jsonl = None
+
+    def _open_stage(self):
+        """Note a stage starting; True if it is the only one open and so owns the memory peak."""
+        with self._lock:
+            self._open_stages += 1
+            if self._open_stages == 1 and self.trace_memory:
+                tracemalloc.reset_peak()
+                return True
+            return False
+
+    def _close_stage(self, traces_peak):
+        """Note a stage ending; returns its memory peak, or None if it doesn't own one."""
+        with self._lock:
+            self._open_stages -= 1
+            if traces_peak and tracemalloc.is_tracing():
+                return tracemalloc.get_traced_memory()[1]
+            return None
+
+    def stage(self, name, items=0, nbytes=0):
+        """Context manager timing one run of a stage; use .add() on it to count items or bytes."""
+        if not self.enabled:
+            return _NULL_STAGE
+        return _Stage(self, name, items, nbytes)
+
+    def timed(self, name):
+        """Decorator timing every call of a function as a stage."""
+        def decorator(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return fn(*args, **kwargs)
+                with _Stage(self, name, 0, 0):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def count(self, name, items=0, nbytes=0):
+        """Add items/bytes to a stage without timing anything."""
+        if self.enabled:
+            self.record(name, None, items, nbytes, None, False)
+
+    def record(self, name, seconds, items, nbytes, peak, failed):
+        with self._lock:
+            stats = self._stats.get(name)
+            if stats is None:
+                stats = self._stats[name] = _StageStats(self.max_samples)
+            stats.items += items
+            stats.bytes += nbytes
+            if seconds is not None:
+                stats.count += 1
+                stats.errors += failed
+                stats.seconds += seconds
+                stats.samples.append(seconds)
+            if peak:
+                stats.peak = max(stats.peak, peak)
+            if self._jsonl and seconds is not None:
+                event = {"time": time.time(), "stage": name, "seconds": round(seconds, 6), "items": items,
+                         "bytes": nbytes, "pid": os.getpid()}
+                if peak is not None:
+                    event["peak_bytes"] = peak
+                if failed:
+                    event["error"] = True
+                self._jsonl.write(json.dumps(event) + "\n")
+                self._jsonl.flush()
+
+    def summary(self):
+        """{stage: {count, errors, seconds, p50, p95, max, items, bytes, peak_bytes}}."""
+        with self._lock:
+            result = {}
+            for name, stats in self._stats.items():
+                ordered = sorted(stats.samples)
+                result[name] = {
+                    "count": stats.count,
+                    "errors": stats.errors,
+                    "seconds": stats.seconds,
+                    "p50": _quantile(ordered, 0.5) if ordered else None,
+                    "p95": _quantile(ordered, 0.95) if ordered else None,
+                    "max": ordered[-1] if ordered else None,
+                    "items": stats.items,
+                    "bytes": stats.bytes,
+                    "peak_bytes": stats.peak or None,
+                }
+            return result
+
+    def prometheus_text(self, prefix="anapro"):
+        summary = self.summary()
+        lines = [f"# HELP {prefix}_stage_seconds Time spent per run of a pipeline stage.",
+                 f"# TYPE {prefix}_stage_seconds summary"]
+        for name, s in sorted(summary.items()):
+            label = f'stage="{name}"'
+            if s["count"]:
+                lines.append(f'{prefix}_stage_seconds{{{label},quantile="0.5"}} {s["p50"]:.6f}')
+                lines.append(f'{prefix}_stage_seconds{{{label},quantile="0.95"}} {s["p95"]:.6f}')
+            lines.append(f"{prefix}_stage_seconds_sum{{{label}}} {s['seconds']:.6f}")
+            lines.append(f"{prefix}_stage_seconds_count{{{label}}} {s['count']}")
+        for metric, key, kind in (("stage_errors_total", "errors", "counter"),
+                                  ("stage_items_total", "items", "counter"),
+                                  ("stage_bytes_total", "bytes", "counter"),
+                                  ("stage_peak_memory_bytes", "peak_bytes", "gauge")):
+            values = [(name, s[key]) for name, s in sorted(summary.items()) if s[key]]
+            if values:
+                lines.append(f"# TYPE {prefix}_{metric} {kind}")
+                lines.extend(f'{prefix}_{metric}{{stage="{name}"}} {value}' for name, value in values)
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path):
+        """Write the summary atomically, as the node exporter's textfile collector expects."""
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.prometheus_text())
+        os.replace(tmp_path, path)
+
+    def write_summary_jsonl(self, path):
+        """Append one JSON line per stage with its summary."""
+        with open(path, "a", encoding="utf-8") as f:
+            for name, s in sorted(self.summary().items()):
+                f.write(json.dumps(dict(s, stage=name, time=time.time())) + "\n")
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+    def flush(self):
+        """Rewrite the Prometheus file now; long-running processes call this between passes."""
+        if self._prometheus_path and self._stats:
+            try:
+                self.write_prometheus(self._prometheus_path)
+            except OSError:
+                pass
+
+
+metrics = Metrics()
+stage = metrics.stage
+timed = metrics.timed
+count = metrics.count
+enable = metrics.enable
+flush = metrics.flush
+
+
+def enable_from_environment():
+    """Turn metrics on if ANAPRO_METRICS (JSON lines path) or ANAPRO_METRICS_PROM is set."""
+    jsonl_path = os.environ.get("ANAPRO_METRICS")
+    prometheus_path = os.environ.get("ANAPRO_METRICS_PROM")
+    if jsonl_path or prometheus_path:
+        metrics.enable(jsonl_path or None, prometheus_path or None,
+                       trace_memory=os.environ.get("ANAPRO_TRACEMALLOC") == "1")
+
+
+enable_from_environment()
@@ -0,0 +1,258 @@
+"""
+OCR backends.
+
+pytesseract starts a new tesseract process for every image, writing temp
+files and reloading the traineddata each time. When tesserocr (bindings to
+the Tesseract C API) is installed we keep one engine per language alive and
+hand it image buffers in memory instead. pytesseract stays as the fallback.
+
+"""
+
+import functools
+import os
+import shlex
+import threading
+from collections import namedtuple
+from collections.abc import Mapping
+
+from PIL import Image
+import pytesseract
+
+from metrics import stage
+
+# OpenMP reads its thread limit when libtesseract is loaded, so it has to be
+# in the environment during the import. Parallelism comes from our own worker
+# pool. It is taken out again so it doesn't leak into whatever else this
+# process starts.
+_omp_limit = os.environ.get("OMP_THREAD_LIMIT")
+os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+try:
+    import tesserocr
+except ImportError:
+    tesserocr = None
+finally:
+    if _omp_limit is None:
+        del os.environ["OMP_THREAD_LIMIT"]
+
+_local = threading.local()
+
+
+class _SubprocessEnv(Mapping):
+    """
+    os.environ plus the calling thread's overrides. pytesseract hands its
+    environ to every tesseract process it starts, so this caps the processes
+    of one worker without touching the environment of the whole program.
+    """
+
+    def _merged(self):
+        return {**os.environ, **getattr(_local, "env", {})}
+
+    def __getitem__(self, key):
+        return self._merged()[key]
+
+    def __iter__(self):
+        return iter(self._merged())
+
+    def __len__(self):
+        return len(self._merged())
+
+
+pytesseract.pytesseract.environ = _SubprocessEnv()
+
+
+def limit_tesseract_threads(threads=1):
+    """Cap the OpenMP threads of the tesseract processes the calling thread starts."""
+    _local.env = {"OMP_THREAD_LIMIT": str(threads)}
+
+# A recognised word and its box in image pixels. line groups words that
+# Tesseract put on the same text line.
+Word = namedtuple("Word", ["text", "left", "top", "width", "height", "line"])
+
+
+def _parse_config(config):
+    """Split a pytesseract style config string into psm, oem and -c variables."""
+    psm = oem = None
+    variables = {}
+    args = shlex.split(config or "")
+    i = 0
+    while i < len(args):
+        arg = args[i]
+        if arg in ("--psm", "--oem") and i + 1 < len(args):
+            if arg == "--psm":
+                psm = int(args[i + 1])
+            else:
+                oem = int(args[i + 1])
+            i += 1
+        elif arg == "-c" and i + 1 < len(args) and "=" in args[i + 1]:
+            name, value = args[i + 1].split("=", 1)
+            variables[name] = value
+            i += 1
+        i += 1
+    return psm, oem, variables
+
+
+class PytesseractBackend:
+    name = "pytesseract"
+
+    def __init__(self, lang="eng", config=""):
+        self.lang = lang
+        self.config = config
+        self.signature = f"{self.name}:{self.version()}"
+
+    @staticmethod
+    def version():
+        """Version of the tesseract executable, or "none" if there isn't one."""
+        try:
+            return str(pytesseract.get_tesseract_version())
+        except (pytesseract.TesseractNotFoundError, OSError):
+            return "none"
+
+    def image_to_string(self, img):
+        return pytesseract.image_to_string(img, lang=self.lang, config=self.config)
+
+    def image_to_words(self, img):
+        data = pytesseract.image_to_data(img, lang=self.lang, config=self.config,
+                                         output_type=pytesseract.Output.DICT)
+        words = []
+        for i, text in enumerate(data["text"]):
+            if text.strip():
+                line = (data["block_num"][i], data["par_num"][i], data["line_num"][i])
+                words.append(Word(text, data["left"][i], data["top"][i],
+                                  data["width"][i], data["height"][i], line))
+        return words
+
+    def close(self):
+        pass
+
+
+class TesserocrBackend:
+    name = "tesserocr"
+
+    def __init__(self, lang="eng", config=""):
+        if tesserocr is None:
+            raise RuntimeError("tesserocr is not installed")
+        psm, oem, variables = _parse_config(config)
+        kwargs = {"lang": lang}
+        if psm is not None:
+            kwargs["psm"] = psm
+        if oem is not None:
+            kwargs["oem"] = oem
+        self.lang = lang
+        self.config = config
+        # Loading the traineddata is the expensive part; it happens once here.
+        self.api = tesserocr.PyTessBaseAPI(**kwargs)
+        for name, value in variables.items():
+            self.api.SetVariable(name, value)
+        self.signature = f"{self.name}:{self.version()}"
+
+    @staticmethod
+    def version():
+        """Version of the Tesseract library tesserocr is linked against."""
+        return tesserocr.tesseract_version().splitlines()[0]
+
+    def image_to_string(self, img):
+        self.api.SetImage(img)
+        return self.api.GetUTF8Text()
+
+    def image_to_words(self, img):
+        self.api.SetImage(img)
+        self.api.Recognize()
+        words = []
+        line = 0
+        iterator = self.api.GetIterator()
+        level = tesserocr.RIL.WORD
+        for word in tesserocr.iterate_level(iterator, level):
+            if word.IsAtBeginningOf(tesserocr.RIL.TEXTLINE):
+                line += 1
+            text = word.GetUTF8Text(level)
+            box = word.BoundingBox(level)
+            if text and text.strip() and box:
+                left, top, right, bottom = box
+                words.append(Word(text, left, top, right - left, bottom - top, line))
+        return words
+
+    def close(self):
+        self.api.End()
+
+
+BACKENDS = {
+    "tesserocr": TesserocrBackend,
+    "pytesseract": PytesseractBackend,
+}
+
+
+def default_backend_name():
+    """The fastest backend available in this environment."""
+    return "tesserocr" if tesserocr is not None else "pytesseract"
+
+
+def _create(name, lang, config):
+    """A new backend called name, or the pytesseract one if that can't be created."""
+    try:
+        return BACKENDS[name](lang, config)
+    except RuntimeError:
+        return PytesseractBackend(lang, config)
+
+
+@functools.lru_cache(maxsize=None)
+def backend_signature(lang="eng", config="", name=None):
+    """
+    Name and Tesseract version of the backend get_backend() ends up using,
+    fallback included, for OCR cache keys: results from another engine or
+    version may differ.
+    """
+    backend = _create(name or default_backend_name(), lang, config)
+    try:
+        return backend.signature
+    finally:
+        backend.close()
+
+
+def get_backend(lang="eng", config="", name=None):
+    """
+    Return a long-lived backend for lang and config.
+
+    Engines are kept per thread because a Tesseract API handle must not be
+    used from two threads at once. If the in-process engine can't be created
+    (missing bindings or traineddata) the pytesseract backend is used.
+    """
+    name = name or default_backend_name()
+    engines = getattr(_local, "engines", None)
+    if engines is None:
+        engines = _local.engines = {}
+    key = (name, lang, config)
+    backend = engines.get(key)
+    if backend is None:
+        backend = engines[key] = _create(name, lang, config)
+    return backend
+
+
+def image_to_string(image, lang="eng", config="", backend=None):
+    """Recognise a PIL image or an image path with a cached backend."""
+    engine = get_backend(lang, config, backend)
+    if isinstance(image, Image.Image):
+        with stage("ocr.recognize", items=1):
+            return engine.image_to_string(image)
+    with Image.open(image) as img:
+        with stage("ocr.recognize", items=1):
+            return engine.image_to_string(img)
+
+
+def words_to_text(words):
+    """Plain text for a list of Words, one line of text per recognised line."""
+    lines = []
+    current = None
+    for word in words:
+        if word.line != current:
+            lines.append([])
+            current = word.line
+        lines[-1].append(word.text)
+    return "\n".join(" ".join(line) for line in lines)
+
+
+def close_backends():
+    """Release the engines created on the calling thread."""
+    engines = getattr(_local, "engines", {})
+    for backend in engines.values():
+        backend.close()
+    engines.clear()
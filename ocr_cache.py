@@ -0,0 +1,182 @@
+"""
+Persistent OCR result cache.
+
+Entries are keyed by a hash of the image bytes together with the Tesseract
+language and config (which the OCR engine extends with the backend, the
+Tesseract version and the preprocessing settings), so re-converting the same
+scans skips recognition.
+The cache is bounded in size and evicts the least recently used entries.
+The store underneath (FileCache) also holds tts.py's phrase cache.
+
+"""
+
+import hashlib
+import os
+import threading
+from collections import Counter, OrderedDict
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "anapro", "ocr")
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+def image_key(image_bytes, lang="eng", config=""):
+    """Content-addressed key for an image and the settings it was recognised with."""
+    digest = hashlib.sha256(image_bytes)
+    digest.update(b"\0" + lang.encode("utf-8") + b"\0" + config.encode("utf-8"))
+    return digest.hexdigest()
+
+
+def file_key(image_path, lang="eng", config=""):
+    """Key for an image file on disk."""
+    with open(image_path, "rb") as f:
+        return image_key(f.read(), lang, config)
+
+
+class FileCache:
+    """
+    A directory of files keyed by hex digests, bounded in size.
+
+    The least recently used entries are evicted first; recency survives
+    restarts through the files' mtimes. Entries that are pinned (lookup or
+    store with pin=True) are never evicted until unpin() is called for them.
+    """
+
+    suffix = ""
+
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.total_bytes = 0
+        self._entries = OrderedDict()  # key -> size, least recently used first
+        self._pins = Counter()
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        self._load()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + self.suffix)
+
+    def _load(self):
+        """Rebuild the LRU order from the files already on disk."""
+        found = []
+        for entry in os.scandir(self.cache_dir):
+            if not entry.is_dir():
+                continue
+            for item in os.scandir(entry.path):
+                if item.name.endswith(self.suffix) and not item.name.endswith(".tmp"):
+                    stat = item.stat()
+                    found.append((stat.st_mtime, item.name[:len(item.name) - len(self.suffix)], stat.st_size))
+        for _, key, size in sorted(found):
+            self._entries[key] = size
+            self.total_bytes += size
+        self._evict()
+
+    def lookup(self, key, pin=False):
+        """Return the path of the entry for key, or None on a miss."""
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            if pin:
+                self._pins[key] += 1
+        path = self._path(key)
+        try:
+            os.utime(path)  # mtime records recency across runs
+            return path
+        except OSError:
+            if pin:
+                self.unpin(key)
+            self.discard(key)
+            return None
+
+    def unpin(self, key):
+        """Release one pin taken by lookup() or store(); the entry can be evicted once none are left."""
+        with self._lock:
+            self._pins[key] -= 1
+            if self._pins[key] <= 0:
+                del self._pins[key]
+            self._evict()
+
+    def discard(self, key):
+        """Forget an entry whose file turned out to be missing or unreadable."""
+        with self._lock:
+            if key in self._entries:
+                self.total_bytes -= self._entries.pop(key)
+                self.hits -= 1
+                self.misses += 1
+
+    def store(self, key, data, pin=False):
+        """Store data under key, evict old entries if over the size limit and return its path."""
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self.total_bytes -= self._entries.pop(key, 0)
+            self._entries[key] = len(data)
+            self.total_bytes += len(data)
+            if pin:
+                self._pins[key] += 1
+            self._evict()
+        return path
+
+    def _evict(self):
+        if self.total_bytes <= self.max_bytes:
+            return
+        for key in list(self._entries):
+            if self.total_bytes <= self.max_bytes:
+                break
+            if key in self._pins:
+                continue
+            self.total_bytes -= self._entries.pop(key)
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def stats(self):
+        """Hit/miss counts and current size of the cache."""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses,
+                    "entries": len(self._entries), "bytes": self.total_bytes}
+
+    def clear(self):
+        """Remove every cached entry."""
+        with self._lock:
+            keys = list(self._entries)
+            self._entries.clear()
+            self.total_bytes = 0
+        for key in keys:
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+
+class OcrCache(FileCache):
+    suffix = ".txt"
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        super().__init__(cache_dir, max_bytes)
+
+    def get(self, key):
+        """Return the cached text for key, or None on a miss."""
+        path = self.lookup(key)
+        if path is None:
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return f.read()
+        except OSError:
+            self.discard(key)
+            return None
+
+    def put(self, key, text):
+        """Store text under key and evict old entries if over the size limit."""
+        self.store(key, text.encode("utf-8"))
@@ -0,0 +1,181 @@
+"""
+Parallel OCR engine shared by the image to PDF converters.
+
+Images are recognised on a pool of workers while results are handed back in
+the same order as the input paths. Tesseract's own OpenMP threads are capped
+so the pool and Tesseract don't fight over the same cores.
+
+"""
+
+import copy
+import json
+import os
+from collections import deque, namedtuple
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+
+from PIL import Image
+
+from ocr_backend import Word, backend_signature, get_backend, limit_tesseract_threads, words_to_text
+from ocr_cache import file_key
+from metrics import stage
+
+OcrResult = namedtuple("OcrResult", ["path", "text", "error"])
+# words are positioned in the pixels of the original image at path.
+WordsResult = namedtuple("WordsResult", ["path", "text", "words", "error"])
+
+
+def default_workers():
+    """Number of workers to use when none is configured."""
+    return max(1, os.cpu_count() or 1)
+
+
+def recognize_image(image_path, lang="eng", config="", preprocessor=None, backend=None):
+    """Run OCR on a single image, returning an OcrResult instead of raising."""
+    try:
+        engine = get_backend(lang, config, backend)
+        with Image.open(image_path) as img:
+            with stage("ocr.load", items=1) as timing:
+                img.load()
+                timing.add(nbytes=os.path.getsize(image_path))
+            if preprocessor:
+                with stage("ocr.preprocess", items=1):
+                    img = preprocessor.process(img)
+            with stage("ocr.recognize", items=1):
+                text = engine.image_to_string(img)
+        return OcrResult(image_path, text, None)
+    except Exception as e:
+        return OcrResult(image_path, "", str(e))
+
+
+def recognize_words(image_path, lang="eng", config="", preprocessor=None, backend=None):
+    """Run OCR on a single image and return every word with its box, instead of raising."""
+    try:
+        engine = get_backend(lang, config, backend)
+        with Image.open(image_path) as img:
+            width, height = img.size
+            with stage("ocr.load", items=1) as timing:
+                img.load()
+                timing.add(nbytes=os.path.getsize(image_path))
+            if preprocessor:
+                with stage("ocr.preprocess", items=1):
+                    img = preprocessor.process(img)
+            with stage("ocr.recognize_words", items=1):
+                words = engine.image_to_words(img)
+            sx, sy = width / img.width, height / img.height
+        if sx != 1 or sy != 1:
+            words = [Word(w.text, round(w.left * sx), round(w.top * sy), round(w.width * sx),
+                          round(w.height * sy), w.line) for w in words]
+        return WordsResult(image_path, words_to_text(words), words, None)
+    except Exception as e:
+        return WordsResult(image_path, "", [], str(e))
+
+
+class ParallelOcrEngine:
+    def __init__(self, workers=None, lang="eng", config="", use_processes=False, tesseract_threads=1,
+                 cache=None, preprocessor=None, backend=None):
+        self.workers = workers or default_workers()
+        self.lang = lang
+        self.config = config
+        self.use_processes = use_processes
+        self.tesseract_threads = tesseract_threads
+        self.cache = cache
+        self.preprocessor = preprocessor
+        self.backend = backend
+        self._pool = None
+
+    def _executor(self):
+        # The pool outlives a single batch so each worker's OCR engine stays loaded.
+        # Every worker caps the tesseract processes it starts as it comes up.
+        if self._pool is None:
+            pool = ProcessPoolExecutor if self.use_processes else ThreadPoolExecutor
+            self._pool = pool(max_workers=self.workers, initializer=limit_tesseract_threads,
+                              initargs=(self.tesseract_threads,))
+        return self._pool
+
+    def close(self):
+        """Shut down the worker pool."""
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def _cache_key(self, image_path, preprocessor=None, words=False):
+        config = self.config + "|" + backend_signature(self.lang, self.config, self.backend)
+        preprocessor = preprocessor or self.preprocessor
+        if preprocessor:
+            config += "|" + preprocessor.signature()
+        if words:
+            config += "|words"
+        try:
+            return file_key(image_path, self.lang, config)
+        except OSError:
+            return None
+
+    def _submit(self, executor, image_path):
+        """Return a future for image_path, answered from the cache when possible."""
+        key = self._cache_key(image_path) if self.cache else None
+        if key:
+            text = self.cache.get(key)
+            if text is not None:
+                future = Future()
+                future.set_result(OcrResult(image_path, text, None))
+                return None, future
+        return key, executor.submit(recognize_image, image_path, self.lang, self.config,
+                                    self.preprocessor, self.backend)
+
+    def _collect(self, key, future):
+        result = future.result()
+        if key and result.error is None:
+            self.cache.put(key, result.text)
+        return result
+
+    def _ordered(self, image_paths, submit, collect):
+        window = self.workers * 2
+        pending = deque()
+        executor = self._executor()
+        try:
+            for image_path in image_paths:
+                pending.append(submit(executor, image_path))
+                if len(pending) >= window:
+                    yield collect(*pending.popleft())
+            while pending:
+                yield collect(*pending.popleft())
+        finally:
+            # Closed early: don't recognise images nobody is going to read
+            for _, future in pending:
+                future.cancel()
+
+    def imap(self, image_paths):
+        """Yield an OcrResult for every path, in input order, as results become ready."""
+        return self._ordered(image_paths, self._submit, self._collect)
+
+    def imap_words(self, image_paths):
+        """Yield a WordsResult for every path, in input order, for searchable PDFs."""
+        preprocessor = self.preprocessor
+        if preprocessor and preprocessor.deskew:
+            # Boxes are scaled back onto the original image, which a rotation would break.
+            preprocessor = copy.copy(preprocessor)
+            preprocessor.deskew = False
+
+        def submit(executor, image_path):
+            key = self._cache_key(image_path, preprocessor, words=True) if self.cache else None
+            if key:
+                cached = self.cache.get(key)
+                if cached is not None:
+                    words = [Word(*word) for word in json.loads(cached)]
+                    future = Future()
+                    future.set_result(WordsResult(image_path, words_to_text(words), words, None))
+                    return None, future
+            return key, executor.submit(recognize_words, image_path, self.lang, self.config,
+                                        preprocessor, self.backend)
+
+        def collect(key, future):
+            result = future.result()
+            if key and result.error is None:
+                self.cache.put(key, json.dumps(result.words, ensure_ascii=False))
+            return result
+
+        return self._ordered(image_paths, submit, collect)
+
+    def recognize(self, image_paths):
+        """Return OcrResults for all paths, in input order."""
+        return list(self.imap(image_paths))
@@ -0,0 +1,106 @@
+"""
+Rendered page cache for the PDF readers.
+
+Pages are rendered once per (page number, zoom) and kept in a bounded LRU.
+After every page turn the neighbouring pages are rendered on a background
+thread, so flipping forwards or backwards doesn't wait for MuPDF.
+
+"""
+
+import queue
+import threading
+from collections import OrderedDict
+
+import fitz
+
+from metrics import stage
+
+# MuPDF must not be entered from two threads at once.
+render_lock = threading.Lock()
+
+
+class PageRenderCache:
+    def __init__(self, document, max_pages=16, prefetch=2):
+        self.document = document
+        self.max_pages = max_pages
+        self.prefetch = prefetch
+        self._pages = OrderedDict()  # (page number, zoom) -> pixmap
+        self._lock = threading.Lock()
+        self._requests = queue.Queue()
+        self._generation = 0
+        self._closed = False
+        self._thread = threading.Thread(target=self._prefetch_loop, daemon=True)
+        self._thread.start()
+
+    @staticmethod
+    def _key(page_no, zoom):
+        return page_no, round(zoom, 3)
+
+    def _lookup(self, key):
+        with self._lock:
+            pix = self._pages.get(key)
+            if pix is not None:
+                self._pages.move_to_end(key)
+            return pix
+
+    def _store(self, key, pix):
+        with self._lock:
+            self._pages[key] = pix
+            self._pages.move_to_end(key)
+            while len(self._pages) > self.max_pages:
+                self._pages.popitem(last=False)
+
+    def _render(self, page_no, zoom):
+        with render_lock, stage("render.page", items=1) as timing:
+            page = self.document.load_page(page_no)
+            pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom))
+            timing.add(nbytes=len(pix.samples_mv))
+            return pix
+
+    def page_rect(self, page_no):
+        """Size of a page in points, for working out the zoom to render it at."""
+        with render_lock:
+            return self.document[page_no].rect
+
+    def get(self, page_no, zoom=1.0):
+        """Return the pixmap for page_no at zoom, rendering it now if it isn't cached."""
+        key = self._key(page_no, zoom)
+        pix = self._lookup(key)
+        if pix is None:
+            pix = self._render(page_no, zoom)
+            self._store(key, pix)
+        return pix
+
+    def prefetch_around(self, page_no, zoom=1.0):
+        """Queue the pages within prefetch of page_no, nearest first, replacing older requests."""
+        with self._lock:
+            self._generation += 1
+            generation = self._generation
+        for distance in range(1, self.prefetch + 1):
+            for neighbour in (page_no + distance, page_no - distance):
+                if 0 <= neighbour < self.document.page_count:
+                    self._requests.put((generation, neighbour, zoom))
+
+    def _prefetch_loop(self):
+        while True:
+            generation, page_no, zoom = self._requests.get()
+            if self._closed:
+                return
+            if generation != self._generation:
+                continue  # the reader has moved on since this was queued
+            key = self._key(page_no, zoom)
+            if self._lookup(key) is None:
+                try:
+                    self._store(key, self._render(page_no, zoom))
+                except Exception:
+                    pass  # the page is rendered (and the error shown) when it's viewed
+
+    def clear(self):
+        with self._lock:
+            self._pages.clear()
+
+    def close(self):
+        """Stop the prefetch thread and drop the cached pages."""
+        self._closed = True
+        self._requests.put((None, None, None))
+        self.clear()
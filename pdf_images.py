@@ -0,0 +1,149 @@
+"""
+Image XObjects for the PDF writer.
+
+JPEG files are embedded as their original DCT stream and non-interlaced PNG
+files as their original zlib data (PDF's Flate filter with the PNG predictor
+reads it as is), so neither is decoded or re-encoded. Anything else, such as
+PNGs with an alpha channel, GIF or BMP, is decoded once with PIL and stored
+losslessly with Flate.
+
+"""
+
+import struct
+import zlib
+from collections import namedtuple
+
+# dictionary: the entries of the image XObject besides Type/Subtype/Length.
+# smask: an optional (dictionary, data) pair for a soft mask (alpha channel).
+PdfImage = namedtuple("PdfImage", ["width", "height", "dpi", "dictionary", "data", "smask"])
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def _jpeg_image(data):
+    width = height = components = None
+    dpi = None
+    adobe = False
+    pos = 2
+    while pos + 4 <= len(data):
+        if data[pos] != 0xFF:
+            raise ValueError("Corrupt JPEG marker")
+        marker = data[pos + 1]
+        if marker == 0xFF:  # fill byte
+            pos += 1
+            continue
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+            pos += 2
+            continue
+        length = struct.unpack(">H", data[pos + 2:pos + 4])[0]
+        segment = data[pos + 4:pos + 2 + length]
+        if marker == 0xE0 and segment[:5] == b"JFIF\0":
+            units, x_density = segment[7], struct.unpack(">H", segment[8:10])[0]
+            if units == 1 and x_density:
+                dpi = float(x_density)
+            elif units == 2 and x_density:
+                dpi = x_density * 2.54
+        elif marker == 0xEE and segment[:5] == b"Adobe":
+            adobe = True
+        elif marker in JPEG_SOF_MARKERS:
+            height, width = struct.unpack(">HH", segment[1:5])
+            components = segment[5]
+            break
+        elif marker == 0xDA:
+            break
+        pos += 2 + length
+    if not width:
+        raise ValueError("JPEG has no frame header")
+    colorspace = {1: "/DeviceGray", 3: "/DeviceRGB", 4: "/DeviceCMYK"}.get(components)
+    if colorspace is None:
+        raise ValueError(f"Unsupported JPEG with {components} components")
+    dictionary = f"/Width {width} /Height {height} /ColorSpace {colorspace} /BitsPerComponent 8 /Filter /DCTDecode"
+    if components == 4 and adobe:
+        # Photoshop writes inverted CMYK.
+        dictionary += " /Decode [1 0 1 0 1 0 1 0]"
+    return PdfImage(width, height, dpi, dictionary, data, None)
+
+
+def _png_chunks(data):
+    pos = len(PNG_SIGNATURE)
+    while pos + 8 <= len(data):
+        length, kind = struct.unpack(">I4s", data[pos:pos + 8])
+        yield kind, data[pos + 8:pos + 8 + length]
+        pos += 12 + length
+
+
+def _png_image(data):
+    """Embed the PNG's own IDAT stream, or return None if PDF can't take it as is."""
+    header = None
+    palette = None
+    dpi = None
+    idat = []
+    for kind, chunk in _png_chunks(data):
+        if kind == b"IHDR":
+            header = struct.unpack(">IIBBBBB", chunk)
+        elif kind == b"PLTE":
+            palette = chunk
+        elif kind == b"tRNS":
+            return None
+        elif kind == b"pHYs":
+            x_ppu, _, unit = struct.unpack(">IIB", chunk)
+            if unit == 1 and x_ppu:
+                dpi = x_ppu * 0.0254
+        elif kind == b"IDAT":
+            idat.append(chunk)
+        elif kind == b"IEND":
+            break
+    if header is None or not idat:
+        return None
+    width, height, bit_depth, color_type, _, _, interlace = header
+    if color_type == 3 and not palette:
+        return None
+    colors = {0: 1, 2: 3, 3: 1}.get(color_type)
+    if interlace or colors is None or (color_type == 3 and bit_depth > 8):
+        return None
+    if color_type == 3:
+        colorspace = f"[/Indexed /DeviceRGB {len(palette) // 3 - 1} <{palette.hex()}>]"
+    else:
+        colorspace = "/DeviceGray" if color_type == 0 else "/DeviceRGB"
+    dictionary = (f"/Width {width} /Height {height} /ColorSpace {colorspace} /BitsPerComponent {bit_depth} "
+                  f"/Filter /FlateDecode /DecodeParms << /Predictor 15 /Colors {colors} "
+                  f"/BitsPerComponent {bit_depth} /Columns {width} >>")
+    return PdfImage(width, height, dpi, dictionary, b"".join(idat), None)
+
+
+def _decoded_image(path):
+    """Decode with PIL and store the pixels (and any alpha) with Flate."""
+    from PIL import Image
+
+    with Image.open(path) as img:
+        dpi = img.info.get("dpi", (None,))[0]
+        has_alpha = img.mode in ("RGBA", "LA", "PA") or (img.mode == "P" and "transparency" in img.info)
+        if has_alpha:
+            img = img.convert("LA" if img.mode == "LA" else "RGBA")
+            alpha = img.getchannel("A")
+            img = img.convert("L" if img.mode == "LA" else "RGB")
+        elif img.mode not in ("L", "RGB"):
+            img = img.convert("RGB")
+        width, height = img.size
+        colorspace = "/DeviceGray" if img.mode == "L" else "/DeviceRGB"
+        dictionary = (f"/Width {width} /Height {height} /ColorSpace {colorspace} "
+                      f"/BitsPerComponent 8 /Filter /FlateDecode")
+        smask = None
+        if has_alpha:
+            smask = (f"/Width {width} /Height {height} /ColorSpace /DeviceGray "
+                     f"/BitsPerComponent 8 /Filter /FlateDecode", zlib.compress(alpha.tobytes()))
+        return PdfImage(width, height, dpi, dictionary, zlib.compress(img.tobytes()), smask)
+
+
+def load_image(path):
+    """Read an image file into a PdfImage, passing JPEG and PNG data through untouched."""
+    with open(path, "rb") as f:
+        data = f.read()
+    if data[:2] == b"\xff\xd8":
+        return _jpeg_image(data)
+    if data[:8] == PNG_SIGNATURE:
+        image = _png_image(data)
+        if image is not None:
+            return image
+    return _decoded_image(path)
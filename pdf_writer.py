@@ -0,0 +1,478 @@
+"""
+Streaming PDF writer.
+
+FPDF keeps the whole document in memory until output() is called, and the
+converters used to build one big string for every image before laying it
+out. This writer takes text one section at a time, lays each section out on
+its own page(s) and writes every finished page straight to disk, so memory
+stays flat however long the batch is. FPDF is still used for font metrics.
+
+Images can be added as pages too, embedded without recompression (see
+pdf_images), optionally with an invisible layer of OCR'd words on top so the
+page is searchable.
+
+"""
+
+import functools
+import os
+import struct
+import zlib
+
+from fpdf import FPDF
+
+from metrics import stage
+from pdf_images import PdfImage, load_image
+
+MM = 72 / 25.4  # points per millimetre
+A4 = (210, 297)
+
+
+def latin1(text):
+    """The text as the core PDF fonts can show it."""
+    return text.encode("latin-1", "replace").decode("latin-1")
+
+
+def unused_path(path):
+    """path, or path with _1, _2, ... before the extension if it already exists."""
+    root, ext = os.path.splitext(path)
+    n = 0
+    while os.path.exists(path):
+        n += 1
+        path = f"{root}_{n}{ext}"
+    return path
+
+
+# Character codes of the invisible font are two bytes. A BMP character is its
+# own code; characters beyond the BMP are given the codes of the surrogate
+# range, which no character uses, and the ToUnicode CMap maps them back.
+_EXTRA_CODES = range(0xD800, 0xE000)
+
+
+def _cmap_sections(kind, entries):
+    # A CMap section may hold at most 100 entries.
+    sections = []
+    for i in range(0, len(entries), 100):
+        chunk = entries[i:i + 100]
+        sections.append(f"{len(chunk)} begin{kind}\n" + "\n".join(chunk) + f"\nend{kind}\n")
+    return "".join(sections)
+
+
+def _to_unicode_cmap(extra_codes=None):
+    """ToUnicode CMap for the invisible font; extra_codes maps characters beyond the BMP to their codes."""
+    ranges = [f"<{hi:02X}00> <{hi:02X}FF> <{hi:02X}00>" for hi in range(256) if not 0xD8 <= hi <= 0xDF]
+    chars = [f"<{code:04X}> <{ch.encode('utf-16-be').hex().upper()}>"
+             for ch, code in sorted((extra_codes or {}).items(), key=lambda item: item[1])]
+    return ("/CIDInit /ProcSet findresource begin\n12 dict begin\nbegincmap\n"
+            "/CIDSystemInfo << /Registry (Adobe) /Ordering (UCS) /Supplement 0 >> def\n"
+            "/CMapName /Adobe-Identity-UCS def\n/CMapType 2 def\n"
+            "1 begincodespacerange\n<0000> <FFFF>\nendcodespacerange\n"
+            + _cmap_sections("bfrange", ranges) + _cmap_sections("bfchar", chars)
+            + "endcmap\nCMapName currentdict /CMap defineresource pop\nend\nend\n").encode("ascii")
+
+
+def _sfnt_checksum(data):
+    data += b"\0" * (-len(data) % 4)
+    return sum(struct.unpack(f">{len(data) // 4}L", data)) & 0xFFFFFFFF
+
+
+@functools.lru_cache(maxsize=None)
+def _glyphless_font():
+    """
+    A TrueType font with one blank glyph, 500/1000 em wide, as Tesseract
+    embeds for its text layer: viewers need a font program to place and
+    select the text by, and this one draws nothing.
+    """
+    family = "GlyphLessFont".encode("utf-16-be")
+    tables = {
+        # .notdef and the blank glyph: no outlines, so both are empty in glyf
+        "cmap": struct.pack(">HHHHLHHHHHHHHHHH", 0, 1, 3, 1, 12, 4, 24, 0, 2, 2, 0, 0, 0xFFFF, 0, 0xFFFF, 1)
+                + struct.pack(">H", 0),
+        "glyf": b"",
+        "head": struct.pack(">LLLLHHqqhhhhHHhhh", 0x00010000, 0x00010000, 0, 0x5F0F3CF5, 0x000B, 1000, 0, 0,
+                            0, 0, 500, 1000, 0, 8, 2, 0, 0),
+        "hhea": struct.pack(">LhhhHhhhhhhhhhhhH", 0x00010000, 1000, 0, 0, 500, 0, 0, 500, 1, 0, 0,
+                            0, 0, 0, 0, 0, 2),
+        "hmtx": struct.pack(">HhHh", 500, 0, 500, 0),
+        "loca": struct.pack(">HHH", 0, 0, 0),
+        "maxp": struct.pack(">LHHHHHHHHHHHHHH", 0x00010000, 2, 0, 0, 0, 0, 2, 0, 0, 0, 0, 0, 0, 0, 0),
+        "name": struct.pack(">HHHHHHHHH", 0, 1, 18, 3, 1, 0x409, 1, len(family), 0) + family,
+        "post": struct.pack(">LLhhLLLLL", 0x00030000, 0, 0, 0, 1, 0, 0, 0, 0),
+    }
+    count = len(tables)
+    search = 2 ** (count.bit_length() - 1)
+    header = struct.pack(">LHHHH", 0x00010000, count, search * 16, search.bit_length() - 1, (count - search) * 16)
+    directory, body = b"", b""
+    offset = len(header) + 16 * count
+    for tag in sorted(tables):
+        data = tables[tag]
+        if tag == "head":
+            head_at = offset + len(body)
+        directory += struct.pack(">4sLLL", tag.encode("ascii"), _sfnt_checksum(data), offset + len(body), len(data))
+        body += data + b"\0" * (-len(data) % 4)
+    font = header + directory + body
+    # head.checkSumAdjustment makes the whole file sum to a fixed value
+    adjust = (0xB1B0AFBA - _sfnt_checksum(font)) & 0xFFFFFFFF
+    return font[:head_at + 8] + struct.pack(">L", adjust) + font[head_at + 12:]
+
+
+def _escape(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)").replace("\r", "")
+
+
+class TextLayout:
+    """Breaks text into the lines and pages StreamingPdfWriter writes."""
+
+    def __init__(self, font_size=12, line_height=10, margin=10, page_size=A4):
+        self.font_size = font_size
+        self.line_height = line_height
+        self.margin = margin
+        self.page_width, self.page_height = page_size
+        self._widths = {}
+        self._metrics = FPDF()
+        self._metrics.set_font("Helvetica", size=font_size)
+
+    def _text_width(self, text):
+        widths = self._widths
+        total = 0
+        for ch in text:
+            width = widths.get(ch)
+            if width is None:
+                width = widths[ch] = self._metrics.get_string_width(ch)
+            total += width
+        return total
+
+    def wrap(self, text):
+        """Split text into lines that fit between the margins."""
+        with stage("pdf.layout", nbytes=len(text)):
+            return self._wrap(text)
+
+    def _wrap(self, text):
+        max_width = self.page_width - 2 * self.margin
+        space = self._text_width(" ")
+        lines = []
+        for paragraph in latin1(text).split("\n"):
+            line, line_width = [], 0
+            for word in paragraph.split(" "):
+                word_width = self._text_width(word)
+                # Break words that can't fit on a line of their own.
+                while word_width > max_width:
+                    if line:
+                        lines.append(" ".join(line))
+                        line, line_width = [], 0
+                    cut = len(word)
+                    while cut > 1 and self._text_width(word[:cut]) > max_width:
+                        cut -= 1
+                    lines.append(word[:cut])
+                    word = word[cut:]
+                    word_width = self._text_width(word)
+                extra = word_width + (space if line else 0)
+                if line and line_width + extra > max_width:
+                    lines.append(" ".join(line))
+                    line, line_width = [word], word_width
+                else:
+                    line.append(word)
+                    line_width += extra
+            lines.append(" ".join(line))
+        return lines
+
+    def lines_per_page(self):
+        return max(1, int((self.page_height - 2 * self.margin) // self.line_height))
+
+    def paginate(self, text, title=None):
+        """The pages (lists of lines) add_text(text, title) would write."""
+        lines = (self.wrap(title) if title else []) + self.wrap(text)
+        per_page = self.lines_per_page()
+        return [lines[i:i + per_page] for i in range(0, len(lines), per_page)]
+
+    def page_texts(self, text, title=None, pages=None):
+        """
+        The part of text on each page paginate(text, title) gives (or pages,
+        if already paginated), as it was before latin1() replaced what the
+        core fonts can't show. For the full-text index, which keeps Ethiopic.
+        """
+        if pages is None:
+            pages = self.paginate(text, title)
+        # latin1() swaps characters one for one and wrapping only drops the
+        # spaces it breaks lines at, so each line is found at its place in shown.
+        shown = latin1(text)
+        skip = len(self.wrap(title)) if title else 0
+        cursor = 0
+        texts = []
+        for lines in pages:
+            parts = []
+            for line in lines:
+                if skip:
+                    skip -= 1
+                    continue
+                start = shown.find(line, cursor)
+                if start < 0:
+                    continue
+                parts.append(text[start:start + len(line)])
+                cursor = start + len(line)
+            texts.append("\n".join(parts))
+        return texts
+
+
+class StreamingPdfWriter:
+    def __init__(self, path, font_size=12, line_height=10, margin=10, page_size=A4, layout=None):
+        self.path = path
+        self.layout = layout or TextLayout(font_size, line_height, margin, page_size)
+        self.font_size = self.layout.font_size
+        self.line_height = self.layout.line_height
+        self.margin = self.layout.margin
+        self.page_width, self.page_height = self.layout.page_width, self.layout.page_height
+        self.page_count = 0
+        self._offsets = {}
+        self._page_ids = []
+        self._next_id = 4  # 1: catalog, 2: page tree, 3: font
+        self._text_layer_font = None
+        self._to_unicode = None  # id of the invisible font's ToUnicode CMap, written at close
+        self._extra_codes = {}  # characters beyond the BMP in the text layer -> their codes
+        self._lines = None  # wrapped lines not yet written, while text is arriving
+        self._file = open(path, "wb")
+        self._write(b"%PDF-1.5\n%\xe2\xe3\xcf\xd3\n")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _write(self, data):
+        self._file.write(data)
+
+    def _new_id(self):
+        obj_id = self._next_id
+        self._next_id += 1
+        return obj_id
+
+    def _write_object(self, obj_id, body, stream=None):
+        self._offsets[obj_id] = self._file.tell()
+        self._write(f"{obj_id} 0 obj\n".encode("ascii"))
+        self._write(body.encode("latin-1"))
+        if stream is not None:
+            self._write(b"\nstream\n")
+            self._write(stream)
+            self._write(b"\nendstream")
+        self._write(b"\nendobj\n")
+
+    def wrap(self, text):
+        """Split text into lines that fit between the margins."""
+        return self.layout.wrap(text)
+
+    def add_text(self, text, title=None):
+        """Lay out text starting on a new page and write its page(s) to disk."""
+        self.begin_text(title)
+        self.write_text(text)
+        self.end_text()
+
+    def begin_text(self, title=None):
+        """Start a new page for text that will arrive in pieces through write_text."""
+        self.end_text()
+        self._lines = self.wrap(title) if title else []
+
+    def write_text(self, text):
+        """Append text as a new paragraph, writing each page as soon as it is full."""
+        if self._lines is None:
+            self._lines = []
+        self._lines.extend(self.wrap(text))
+        per_page = self.layout.lines_per_page()
+        while len(self._lines) >= per_page:
+            self._write_text_page(self._lines[:per_page])
+            del self._lines[:per_page]
+
+    def end_text(self):
+        """Write the last, partly filled page of the current text."""
+        if self._lines:
+            self._write_text_page(self._lines)
+        self._lines = None
+
+    def add_pages(self, pages):
+        """Write pages already laid out by TextLayout.paginate."""
+        self.end_text()
+        for lines in pages:
+            self._write_text_page(lines)
+
+    def _write_text_page(self, lines):
+        with stage("pdf.text_page", items=1) as timing:
+            start = self._file.tell()
+            self._write_text_lines(lines)
+            timing.add(nbytes=self._file.tell() - start)
+
+    def _write_text_lines(self, lines):
+        x = self.margin * MM
+        # Baseline of the first line, matching FPDF's multi_cell placement.
+        y = (self.page_height - self.margin - self.line_height / 2) * MM - self.font_size * 0.35
+        step = self.line_height * MM
+        parts = [f"BT /F1 {self.font_size} Tf {x:.2f} {y:.2f} Td"]
+        for i, line in enumerate(lines):
+            if i:
+                parts.append(f"0 {-step:.2f} Td")
+            parts.append(f"({_escape(line)}) Tj")
+        parts.append("ET")
+        content = zlib.compress("\n".join(parts).encode("latin-1"))
+        self._write_page(content)
+
+    def _invisible_font(self):
+        """Object id of the font used for invisible text, written on first use."""
+        if self._text_layer_font is None:
+            file_id, gid_map_id, descriptor_id, cid_font_id, font_id = (self._new_id() for _ in range(5))
+            self._to_unicode = self._new_id()
+            program = zlib.compress(_glyphless_font())
+            self._write_object(file_id, f"<< /Length {len(program)} /Length1 {len(_glyphless_font())} "
+                                        "/Filter /FlateDecode >>", program)
+            # Every character code is drawn with the blank glyph
+            gid_map = zlib.compress(b"\0\1" * 0x10000)
+            self._write_object(gid_map_id, f"<< /Length {len(gid_map)} /Filter /FlateDecode >>", gid_map)
+            self._write_object(descriptor_id, "<< /Type /FontDescriptor /FontName /GlyphLessFont /Flags 5 "
+                                              "/FontBBox [0 0 500 1000] /ItalicAngle 0 /Ascent 1000 "
+                                              "/Descent 0 /CapHeight 1000 /StemV 80 "
+                                              f"/FontFile2 {file_id} 0 R >>")
+            self._write_object(cid_font_id, "<< /Type /Font /Subtype /CIDFontType2 /BaseFont /GlyphLessFont "
+                                            "/CIDSystemInfo << /Registry (Adobe) /Ordering (Identity) "
+                                            f"/Supplement 0 >> /FontDescriptor {descriptor_id} 0 R "
+                                            f"/DW 500 /CIDToGIDMap {gid_map_id} 0 R >>")
+            self._write_object(font_id, "<< /Type /Font /Subtype /Type0 /BaseFont /GlyphLessFont "
+                                        f"/Encoding /Identity-H /DescendantFonts [{cid_font_id} 0 R] "
+                                        f"/ToUnicode {self._to_unicode} 0 R >>")
+            self._text_layer_font = font_id
+        return self._text_layer_font
+
+    def _codes(self, text):
+        """The invisible font's character codes for text, as a hex string."""
+        codes = []
+        for ch in text:
+            code = ord(ch)
+            if 0xD800 <= code <= 0xDFFF:
+                code = 0xFFFD  # a lone surrogate is no character at all
+            elif code > 0xFFFF:
+                code = self._extra_codes.get(ch)
+                if code is None:
+                    if len(self._extra_codes) < len(_EXTRA_CODES):
+                        code = self._extra_codes[ch] = _EXTRA_CODES[len(self._extra_codes)]
+                    else:
+                        code = 0xFFFD
+            codes.append(f"{code:04X}")
+        return "".join(codes)
+
+    def _text_layer(self, words, scale, page_height):
+        """Content stream operators drawing words invisibly over their boxes."""
+        # Every glyph is 500/1000 em wide, so horizontal scaling stretches a
+        # word across exactly its box.
+        parts = ["BT 3 Tr"]
+        for word in words:
+            text = word.text.strip()
+            if not text or word.width <= 0 or word.height <= 0:
+                continue
+            size = word.height * scale
+            stretch = 100 * word.width * scale / (size * 0.5 * len(text))
+            x = word.left * scale
+            y = page_height - (word.top + word.height) * scale
+            parts.append(f"/F2 {size:.2f} Tf {stretch:.2f} Tz 1 0 0 1 {x:.2f} {y:.2f} Tm "
+                         f"<{self._codes(text)}> Tj")
+        parts.append("ET")
+        return " ".join(parts)
+
+    def add_image(self, image_path, dpi=None, words=None):
+        """
+        Add an image (a path, or a PdfImage already loaded) as a page of its
+        own, sized from its DPI.
+
+        words, a list of ocr_backend.Word in image pixels, are laid over the
+        image as invisible text so the page can be searched and copied from.
+        """
+        self.end_text()
+        with stage("pdf.image_page", items=1) as timing:
+            start = self._file.tell()
+            self._write_image_page(image_path, dpi, words)
+            timing.add(nbytes=self._file.tell() - start)
+
+    def _write_image_page(self, image_path, dpi, words):
+        image = image_path if isinstance(image_path, PdfImage) else load_image(image_path)
+        dpi = dpi or image.dpi
+        if not dpi or dpi < 10:
+            # No usable resolution: fit the long side to the page's long side.
+            dpi = max(image.width, image.height) / (max(self.page_width, self.page_height) / 25.4)
+        width, height = image.width * 72 / dpi, image.height * 72 / dpi
+        extra = ""
+        if image.smask:
+            smask_id = self._new_id()
+            smask_dict, smask_data = image.smask
+            self._write_object(smask_id, f"<< /Type /XObject /Subtype /Image {smask_dict} "
+                                         f"/Length {len(smask_data)} >>", smask_data)
+            extra = f" /SMask {smask_id} 0 R"
+        image_id = self._new_id()
+        self._write_object(image_id, f"<< /Type /XObject /Subtype /Image {image.dictionary}{extra} "
+                                     f"/Length {len(image.data)} >>", image.data)
+        content = f"q {width:.2f} 0 0 {height:.2f} 0 0 cm /Im1 Do Q"
+        resources = f"/XObject << /Im1 {image_id} 0 R >>"
+        if words:
+            content += "\n" + self._text_layer(words, 72 / dpi, height)
+            resources += f" /Font << /F2 {self._invisible_font()} 0 R >>"
+        self._write_page(zlib.compress(content.encode("ascii")), resources, (width, height))
+
+    def _write_page(self, content, resources="/Font << /F1 3 0 R >>", size=None):
+        """Write a content stream and the page object that shows it, then flush."""
+        width, height = size or (self.page_width * MM, self.page_height * MM)
+        content_id = self._new_id()
+        self._write_object(content_id, f"<< /Length {len(content)} /Filter /FlateDecode >>", content)
+        page_id = self._new_id()
+        self._write_object(page_id, f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {width:.2f} {height:.2f}] "
+                                    f"/Resources << {resources} >> /Contents {content_id} 0 R >>")
+        self._page_ids.append(page_id)
+        self.page_count += 1
+        self._file.flush()
+
+    def close(self):
+        """Write the page tree, catalog and cross-reference table and close the file."""
+        if self._file.closed:
+            return
+        self.end_text()
+        if self._to_unicode is not None:
+            # Written last, once every character of the text layer has its code
+            cmap = _to_unicode_cmap(self._extra_codes)
+            self._write_object(self._to_unicode, f"<< /Length {len(cmap)} >>", cmap)
+        self._write_object(3, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica "
+                              "/Encoding /WinAnsiEncoding >>")
+        kids = " ".join(f"{page_id} 0 R" for page_id in self._page_ids)
+        self._write_object(2, f"<< /Type /Pages /Kids [{kids}] /Count {self.page_count} >>")
+        self._write_object(1, "<< /Type /Catalog /Pages 2 0 R >>")
+        xref_offset = self._file.tell()
+        self._write(f"xref\n0 {self._next_id}\n0000000000 65535 f \n".encode("ascii"))
+        for obj_id in range(1, self._next_id):
+            self._write(f"{self._offsets[obj_id]:010d} 00000 n \n".encode("ascii"))
+        self._write(f"trailer\n<< /Size {self._next_id} /Root 1 0 R >>\n"
+                    f"startxref\n{xref_offset}\n%%EOF\n".encode("ascii"))
+        self._file.close()
+
+
+def images_to_pdf(image_paths, pdf_path):
+    """Write one page per image without OCR. Returns (pages written, [(path, error)])."""
+    failures = []
+    with StreamingPdfWriter(pdf_path) as pdf:
+        for image_path in image_paths:
+            try:
+                pdf.add_image(image_path)
+            except Exception as e:
+                failures.append((image_path, str(e)))
+    return pdf.page_count, failures
+
+
+def searchable_pdf(results, pdf_path):
+    """
+    Write one searchable page per ocr_engine.WordsResult: the original image
+    with its recognised words as invisible text. An image whose OCR failed
+    still gets its page, without text, and is listed among the failures.
+    Returns (pages written, [(path, error)]).
+    """
+    failures = []
+    with StreamingPdfWriter(pdf_path) as pdf:
+        for result in results:
+            try:
+                pdf.add_image(result.path, words=None if result.error else result.words)
+            except Exception as e:
+                failures.append((result.path, result.error or str(e)))
+                continue
+            if result.error:
+                failures.append((result.path, result.error))
+    return pdf.page_count, failures
@@ -0,0 +1,46 @@
+"""
+Put rendered PDF pages on screen without re-encoding them.
+
+The readers used to turn every pixmap into a PNG (Kivy) or copy it through a
+PIL image (Tk) before it could be shown. Here the raw RGB samples go straight
+into a Kivy texture or a Tk photo image, and pages are rendered at the pixel
+size they will be shown at.
+
+"""
+
+
+def fit_zoom(page_rect, width, height):
+    """Zoom at which a page fills width x height pixels, keeping its aspect ratio."""
+    if width <= 1 or height <= 1:
+        return 1.0
+    return min(width / page_rect.width, height / page_rect.height)
+
+
+def _samples(pix):
+    # samples_mv is a view on MuPDF's buffer (PyMuPDF 1.21+); samples copies it.
+    samples = getattr(pix, "samples_mv", None)
+    return samples if samples is not None else pix.samples
+
+
+def pixmap_to_texture(pix, texture=None):
+    """Upload an RGB pixmap into a Kivy texture, reusing texture when the size matches."""
+    from kivy.graphics.texture import Texture
+
+    if pix.alpha:
+        raise ValueError("Expected a pixmap without alpha")
+    if texture is None or tuple(texture.size) != (pix.width, pix.height):
+        texture = Texture.create(size=(pix.width, pix.height), colorfmt="rgb")
+        # MuPDF's rows run top to bottom, OpenGL's bottom to top.
+        texture.flip_vertical()
+    texture.blit_buffer(_samples(pix), colorfmt="rgb", bufferfmt="ubyte")
+    return texture
+
+
+def pixmap_to_photo(pix, master=None):
+    """A Tk PhotoImage holding an RGB pixmap, passed to Tk as uncompressed PPM."""
+    import tkinter as tk
+
+    if pix.alpha:
+        raise ValueError("Expected a pixmap without alpha")
+    header = b"P6 %d %d 255\n" % (pix.width, pix.height)
+    return tk.PhotoImage(master=master, data=b"".join((header, _samples(pix))), format="PPM")
@@ -0,0 +1,133 @@
+"""
+Image preprocessing that runs before Tesseract.
+
+Phone photos arrive at full camera resolution and in colour, which makes
+recognition slow and its accuracy uneven. Each step here works on whole
+NumPy arrays (no per-pixel Python loops) and can be switched off on its own.
+
+"""
+
+import numpy as np
+from PIL import Image
+
+A4_LONG_SIDE_INCHES = 11.69
+
+
+def to_grayscale(img):
+    """Return an 8-bit grayscale copy of img using ITU-R 601 luma weights."""
+    if img.mode == "L":
+        return img
+    rgb = np.asarray(img.convert("RGB"), dtype=np.float32)
+    gray = rgb @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+    return Image.fromarray(np.clip(gray + 0.5, 0, 255).astype(np.uint8), mode="L")
+
+
+def estimate_dpi(img, page_inches=A4_LONG_SIDE_INCHES):
+    """DPI from the image metadata, or from assuming the photo spans an A4 page."""
+    dpi = img.info.get("dpi")
+    if dpi and dpi[0] >= 100:
+        return float(dpi[0])
+    return max(img.size) / page_inches
+
+
+def downscale(img, target_dpi, page_inches=A4_LONG_SIDE_INCHES):
+    """Shrink img so it is no finer than target_dpi. Never upscales."""
+    scale = target_dpi / estimate_dpi(img, page_inches)
+    if scale >= 1:
+        return img
+    size = (max(1, round(img.width * scale)), max(1, round(img.height * scale)))
+    return img.resize(size, Image.BOX if scale < 0.5 else Image.BILINEAR)
+
+
+def otsu_threshold(gray):
+    """Global threshold that best separates the two peaks of the histogram."""
+    hist = np.bincount(gray.ravel(), minlength=256).astype(np.float64)
+    levels = np.arange(256)
+    weight_bg = np.cumsum(hist)
+    weight_fg = weight_bg[-1] - weight_bg
+    sum_bg = np.cumsum(hist * levels)
+    mean_bg = sum_bg / np.maximum(weight_bg, 1)
+    mean_fg = (sum_bg[-1] - sum_bg) / np.maximum(weight_fg, 1)
+    between = weight_bg * weight_fg * (mean_bg - mean_fg) ** 2
+    return int(np.argmax(between))
+
+
+def adaptive_binarize(gray, block_size=31, offset=10):
+    """Threshold every pixel against the mean of its block_size neighbourhood."""
+    arr = np.asarray(gray)
+    r = block_size // 2
+    padded = np.pad(arr, r + 1, mode="edge").astype(np.int64)
+    integral = padded.cumsum(axis=0).cumsum(axis=1)
+    n = 2 * r + 1
+    h, w = arr.shape
+    window_sum = (integral[n:n + h, n:n + w] - integral[:h, n:n + w]
+                  - integral[n:n + h, :w] + integral[:h, :w])
+    binary = arr.astype(np.int64) * (n * n) > window_sum - offset * (n * n)
+    return Image.fromarray(np.where(binary, 255, 0).astype(np.uint8), mode="L")
+
+
+def estimate_skew(gray, max_angle=5.0, step=0.25, max_points=50000, min_gain=1.05):
+    """Angle in degrees that best lines up the dark pixels into horizontal rows."""
+    arr = np.asarray(gray)
+    # otsu_threshold puts level t itself in the dark class; on a pure 0/255 scan t is 0
+    ys, xs = np.nonzero(arr <= otsu_threshold(arr))
+    if len(ys) < 2:
+        return 0.0
+    if len(ys) > max_points:
+        pick = np.random.default_rng(0).choice(len(ys), max_points, replace=False)
+        ys, xs = ys[pick], xs[pick]
+    angles = np.arange(-max_angle, max_angle + step / 2, step)
+    radians = np.deg2rad(angles)[:, None]
+    rows = np.rint(ys * np.cos(radians) - xs * np.sin(radians)).astype(np.int64)
+    rows -= rows.min()
+    height = int(rows.max()) + 1
+    # One bincount for all angles: offset each angle's rows into its own range.
+    profiles = np.bincount((rows + np.arange(len(angles))[:, None] * height).ravel(),
+                           minlength=len(angles) * height).reshape(len(angles), height)
+    scores = (np.diff(profiles, axis=1).astype(np.float64) ** 2).sum(axis=1)
+    best = int(np.argmax(scores))
+    # Only trust a rotation that clearly beats leaving the page as it is.
+    if scores[best] < scores[np.argmin(np.abs(angles))] * min_gain:
+        return 0.0
+    return float(angles[best])
+
+
+def deskew(gray, max_angle=5.0, step=0.25):
+    """Rotate gray so its text lines run horizontally."""
+    angle = estimate_skew(gray, max_angle, step)
+    if abs(angle) < step / 2:
+        return gray
+    return gray.rotate(angle, resample=Image.BICUBIC, expand=True, fillcolor=255)
+
+
+class Preprocessor:
+    def __init__(self, grayscale=True, target_dpi=300, binarize=True, block_size=31, offset=10,
+                 deskew=True, max_skew=5.0, skew_step=0.25, page_inches=A4_LONG_SIDE_INCHES):
+        self.grayscale = grayscale
+        self.target_dpi = target_dpi
+        self.binarize = binarize
+        self.block_size = block_size
+        self.offset = offset
+        self.deskew = deskew
+        self.max_skew = max_skew
+        self.skew_step = skew_step
+        self.page_inches = page_inches
+
+    def signature(self):
+        """Short description of the settings, used in OCR cache keys."""
+        return (f"gray={self.grayscale};dpi={self.target_dpi};bin={self.binarize}:"
+                f"{self.block_size}:{self.offset};deskew={self.deskew}:{self.max_skew}:"
+                f"{self.skew_step};page={self.page_inches}")
+
+    def process(self, img):
+        """Run the enabled steps on img and return the image to hand to Tesseract."""
+        # Downscaling first keeps every later step working on fewer pixels.
+        if self.target_dpi:
+            img = downscale(img, self.target_dpi, self.page_inches)
+        if self.grayscale or self.binarize or self.deskew:
+            img = to_grayscale(img)
+        if self.deskew:
+            img = deskew(img, self.max_skew, self.skew_step)
+        if self.binarize:
+            img = adaptive_binarize(img, self.block_size, self.offset)
+        return img
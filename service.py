@@ -0,0 +1,374 @@
+"""
+HTTP conversion service.
+
+Serves the conversions the desktop front-ends do, so one machine can do the
+OCR for a whole office. An upload becomes a job on a bounded pool of worker
+processes; the client polls the job and downloads the PDF when it is done.
+
+    POST   /jobs             multipart upload: one or more "images", or one "audio"
+                             file; optional fields mode (text, searchable, images),
+                             lang (Tesseract), backend (sphinx, vosk, google) and
+                             language (speech). 202 with the job, or 429 when the
+                             queue is full.
+    GET    /jobs/<id>        the job's status: queued, running, done, empty or error
+    GET    /jobs/<id>/pdf    the PDF, streamed from disk, once the job is done
+    DELETE /jobs/<id>        cancel the job if it hasn't started and delete its files
+    GET    /health           pool size and jobs waiting
+
+    python service.py --port 8000 --workers 4 --queue 16 --max-upload-mb 64
+
+Each worker process keeps its own ConversionEngine (and so its own view of
+the shared OCR cache) for the life of the pool.
+
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+
+from flask import Flask, jsonify, request, send_file, url_for
+from werkzeug.exceptions import HTTPException
+
+from batch_cli import AUDIO_EXTENSIONS, IMAGE_EXTENSIONS
+from engine import MODES
+
+AUDIO_BACKENDS = ("sphinx", "vosk", "google")
+DEFAULT_MAX_UPLOAD_MB = 64
+JOB_TTL = 3600  # seconds a finished job and its PDF are kept
+
+_engines = {}  # worker process: lang -> ConversionEngine
+
+
+def _engine_for(lang):
+    engine = _engines.get(lang)
+    if engine is None:
+        from engine import ConversionEngine
+        from ocr_cache import OcrCache
+        from preprocess import Preprocessor
+
+        # The pool runs one job per process, so each engine needs one OCR thread
+        engine = _engines[lang] = ConversionEngine(workers=1, lang=lang, cache=OcrCache(),
+                                                   preprocessor=Preprocessor())
+    return engine
+
+
+def convert_images(image_paths, pdf_path, mode="text", lang="eng"):
+    """Worker: OCR image_paths into pdf_path and return the number of pages."""
+    pages = 0
+    errors = []
+    for result in _engine_for(lang).convert(image_paths, pdf_path, mode=mode, titles=len(image_paths) > 1):
+        if result.status == "error":
+            errors.append(f"{os.path.basename(result.source)}: {result.error}")
+        pages += result.pages
+    if errors and not pages:
+        raise RuntimeError("; ".join(errors))
+    return pages
+
+
+def convert_audio(audio_path, pdf_path, backend="sphinx", language="en-US"):
+    """Worker: transcribe audio_path into pdf_path and return the number of pages."""
+    from long_audio import iter_segments, recognize_segment
+    from pdf_writer import StreamingPdfWriter
+
+    found = False
+    # Segments are recognised one after another; the pool already runs a job per CPU
+    with StreamingPdfWriter(pdf_path) as pdf:
+        pdf.begin_text()
+        for segment in iter_segments(audio_path):
+            text = recognize_segment(backend, segment, language).strip()
+            if text:
+                found = True
+                pdf.write_text(text)
+    if not found:
+        os.remove(pdf_path)
+        return 0
+    return pdf.page_count
+
+
+class Job:
+    def __init__(self, job_id, kind, directory, pdf_path, future):
+        self.id = job_id
+        self.kind = kind
+        self.directory = directory
+        self.pdf_path = pdf_path
+        self.future = future
+        self.created = time.time()
+        self.finished = None
+
+    @property
+    def status(self):
+        if not self.future.done():
+            return "running" if self.future.running() else "queued"
+        if self.future.cancelled() or self.future.exception() is not None:
+            return "error"
+        return "done" if self.future.result() else "empty"
+
+    def to_dict(self):
+        status = self.status
+        info = {"id": self.id, "kind": self.kind, "status": status, "created": self.created,
+                "status_url": url_for("job_status", job_id=self.id)}
+        if status == "done":
+            info["pages"] = self.future.result()
+            info["result_url"] = url_for("job_pdf", job_id=self.id)
+        elif status == "error":
+            info["error"] = self.error()
+        return info
+
+    def error(self):
+        if self.future.cancelled():
+            return "cancelled"
+        error = self.future.exception()
+        if isinstance(error, BrokenProcessPool):
+            return "A worker process died while the job was queued or running"
+        return str(error)
+
+
+class ConversionService:
+    """The worker pool and the jobs submitted to it."""
+
+    def __init__(self, work_dir=None, workers=None, queue_size=None, job_ttl=JOB_TTL):
+        self.workers = workers or max(1, os.cpu_count() or 1)
+        # Jobs beyond the ones running that may wait for a worker before uploads get a 429
+        self.queue_size = queue_size if queue_size is not None else self.workers * 4
+        self._own_work_dir = not work_dir
+        self.work_dir = work_dir or tempfile.mkdtemp(prefix="anapro-service-")
+        self.job_ttl = job_ttl
+        os.makedirs(self.work_dir, exist_ok=True)
+        self.pool = self._new_pool()
+        self.jobs = {}
+        self.active = 0
+        self._lock = threading.Lock()
+
+    def _new_pool(self):
+        # spawn, not fork: forking a threaded server can copy a held lock into the child
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=get_context("spawn"))
+
+    def _replace_pool(self, broken):
+        """
+        Start a new pool in place of broken, one of whose workers has died.
+
+        The jobs broken still held have already failed with BrokenProcessPool;
+        it can't run anything more, so without this every later job would too.
+        """
+        with self._lock:
+            if self.pool is not broken:
+                return  # another job's failure got here first
+            self.pool = self._new_pool()
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    @property
+    def capacity(self):
+        return self.workers + self.queue_size
+
+    def reserve(self):
+        """Claim a place for a new job; False when the pool and its queue are full."""
+        with self._lock:
+            if self.active >= self.capacity:
+                return False
+            self.active += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self.active -= 1
+
+    def new_directory(self):
+        job_id = uuid.uuid4().hex
+        directory = os.path.join(self.work_dir, job_id)
+        os.makedirs(directory)
+        return job_id, directory
+
+    def submit(self, job_id, kind, directory, fn, source, *options):
+        """Queue fn(source, pdf_path, *options) on the pool as job job_id; a place must have been reserved."""
+        pdf_path = os.path.join(directory, "output.pdf")
+        pool = self.pool
+        try:
+            future = pool.submit(fn, source, pdf_path, *options)
+        except BrokenProcessPool:
+            # A worker died since the last job finished; its callback may not have run yet
+            self._replace_pool(pool)
+            pool = self.pool
+            future = pool.submit(fn, source, pdf_path, *options)
+        job = Job(job_id, kind, directory, pdf_path, future)
+        with self._lock:
+            self.jobs[job_id] = job
+        future.add_done_callback(lambda future: self._finished(job, pool))
+        return job
+
+    def _finished(self, job, pool):
+        job.finished = time.time()
+        self.release()
+        if not job.future.cancelled() and isinstance(job.future.exception(), BrokenProcessPool):
+            self._replace_pool(pool)
+
+    def get(self, job_id):
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def remove(self, job_id):
+        """Forget a job and delete its files, cancelling it if it hasn't started."""
+        with self._lock:
+            job = self.jobs.pop(job_id, None)
+        if job is None:
+            return False
+        job.future.cancel()
+        if job.future.done():
+            shutil.rmtree(job.directory, ignore_errors=True)
+        else:
+            # Running: its files go once it finishes
+            job.future.add_done_callback(lambda future: shutil.rmtree(job.directory, ignore_errors=True))
+        return True
+
+    def expire(self):
+        """Remove finished jobs older than job_ttl."""
+        cutoff = time.time() - self.job_ttl
+        with self._lock:
+            expired = [job.id for job in self.jobs.values() if job.finished and job.finished < cutoff]
+        for job_id in expired:
+            self.remove(job_id)
+
+    def close(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
+        if self._own_work_dir:
+            shutil.rmtree(self.work_dir, ignore_errors=True)
+
+
+def error(status, message, retry_after=None):
+    response = jsonify({"error": message})
+    response.status_code = status
+    if retry_after:
+        response.headers["Retry-After"] = str(retry_after)
+    return response
+
+
+def unsupported(files, extensions):
+    """Names of the uploaded files that don't have one of the extensions."""
+    return [upload.filename for upload in files if not (upload.filename or "").lower().endswith(extensions)]
+
+
+def save_uploads(files, directory):
+    """Save uploaded files into directory, numbered in upload order, and return their paths."""
+    paths = []
+    for index, upload in enumerate(files):
+        # Only the (already checked) extension is kept: the decoders go by it, and
+        # client file names may be anything, Ethiopic included
+        path = os.path.join(directory, f"{index:04d}{os.path.splitext(upload.filename)[1].lower()}")
+        upload.save(path)
+        paths.append(path)
+    return paths
+
+
+def create_app(service=None, max_upload_mb=DEFAULT_MAX_UPLOAD_MB):
+    app = Flask(__name__)
+    app.config["MAX_CONTENT_LENGTH"] = max_upload_mb * 1024 * 1024
+    service = service or ConversionService()
+    app.extensions["conversion_service"] = service
+
+    @app.errorhandler(HTTPException)
+    def http_error(e):
+        return error(e.code, e.description)
+
+    @app.post("/jobs")
+    def create_job():
+        service.expire()
+        images = request.files.getlist("images")
+        audio = request.files.getlist("audio")
+        if bool(images) == bool(audio):
+            return error(400, "Upload one or more 'images' or a single 'audio' file")
+        if len(audio) > 1:
+            return error(400, "Upload one audio file per job")
+        mode = request.form.get("mode", "text")
+        backend = request.form.get("backend", "sphinx")
+        if mode not in MODES:
+            return error(400, f"mode must be one of {', '.join(MODES)}")
+        if backend not in AUDIO_BACKENDS:
+            return error(400, f"backend must be one of {', '.join(AUDIO_BACKENDS)}")
+        rejected = unsupported(images, IMAGE_EXTENSIONS) + unsupported(audio, AUDIO_EXTENSIONS)
+        if rejected:
+            return error(400, f"Unsupported file type: {', '.join(rejected)}")
+        if not service.reserve():
+            return error(429, "Too many jobs queued, try again later", retry_after=5)
+        job_id, directory = service.new_directory()
+        try:
+            if images:
+                paths = save_uploads(images, directory)
+                job = service.submit(job_id, "images", directory, convert_images, paths, mode,
+                                     request.form.get("lang", "eng"))
+            else:
+                path, = save_uploads(audio, directory)
+                job = service.submit(job_id, "audio", directory, convert_audio, path, backend,
+                                     request.form.get("language", "en-US"))
+        except BaseException:
+            service.release()
+            shutil.rmtree(directory, ignore_errors=True)
+            raise
+        response = jsonify(job.to_dict())
+        response.status_code = 202
+        response.headers["Location"] = url_for("job_status", job_id=job.id)
+        return response
+
+    @app.get("/jobs/<job_id>")
+    def job_status(job_id):
+        job = service.get(job_id)
+        if job is None:
+            return error(404, "No such job")
+        return jsonify(job.to_dict())
+
+    @app.get("/jobs/<job_id>/pdf")
+    def job_pdf(job_id):
+        job = service.get(job_id)
+        if job is None:
+            return error(404, "No such job")
+        status = job.status
+        if status != "done":
+            return error(409, f"Job is {status}, there is no PDF")
+        # send_file streams the file in blocks rather than reading it into memory
+        return send_file(job.pdf_path, mimetype="application/pdf", as_attachment=True,
+                         download_name=f"{job.id}.pdf")
+
+    @app.delete("/jobs/<job_id>")
+    def delete_job(job_id):
+        if not service.remove(job_id):
+            return error(404, "No such job")
+        return "", 204
+
+    @app.get("/health")
+    def health():
+        return jsonify({"workers": service.workers, "capacity": service.capacity, "active": service.active})
+
+    return app
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Serve image and audio to PDF conversion over HTTP.")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("-w", "--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--queue", type=int, default=None,
+                        help="jobs allowed to wait for a worker before uploads are refused (default: 4 per worker)")
+    parser.add_argument("--max-upload-mb", type=int, default=DEFAULT_MAX_UPLOAD_MB, help="largest request accepted")
+    parser.add_argument("--work-dir", help="where uploads and PDFs are kept (default: a temporary directory)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    service = ConversionService(work_dir=args.work_dir, workers=args.workers, queue_size=args.queue)
+    app = create_app(service, max_upload_mb=args.max_upload_mb)
+    try:
+        app.run(host=args.host, port=args.port, threaded=True)
+    finally:
+        service.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,199 @@
+"""
+Online speech recognition client with an offline fallback.
+
+recognize_google() opens a new connection for every request, never retries
+and has no time limit, so a slow network could hold a conversion far
+longer than offline recognition would have taken. SpeechClient keeps a
+pool of HTTP connections, caps the number of requests in flight, retries
+failed requests with jittered exponential backoff and hedges: if Google
+hasn't answered within a deadline, recognition also starts offline
+(PocketSphinx or Vosk) and whichever answers first is used.
+
+The service URL comes from the base_url argument or ANAPRO_SPEECH_URL, so
+the client can be pointed at a local fake server.
+
+Requests are built and answers parsed with the helpers recognize_google()
+itself uses, which live in speech_recognition's internals; requirements.txt
+pins SpeechRecognition and tests/test_speech_client.py checks them.
+
+"""
+
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeout
+
+import requests
+import speech_recognition as sr
+from requests.adapters import HTTPAdapter
+try:
+    # Not public API: requirements.txt pins the version these were checked against
+    from speech_recognition.recognizers.google import ENDPOINT, OutputParser, create_request_builder
+except ImportError as e:
+    raise ImportError(f"SpeechRecognition {sr.__version__} lacks the Google request helpers speech_client uses; "
+                      f"install the version pinned in requirements.txt") from e
+
+from metrics import count, stage
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+def _float_env(name, default):
+    try:
+        return float(os.environ[name])
+    except (KeyError, ValueError):
+        return default
+
+
+def service_url():
+    """The speech service the client talks to unless given base_url."""
+    return os.environ.get("ANAPRO_SPEECH_URL") or ENDPOINT
+
+
+class SpeechClient:
+    def __init__(self, base_url=None, key=None, timeout=10.0, retries=2, backoff=0.5, max_concurrency=4,
+                 deadline=None, deadline_per_second=0.5, fallback="sphinx", model_path=None, offline_workers=2):
+        self.base_url = base_url or service_url()
+        self.key = key or os.environ.get("ANAPRO_SPEECH_KEY")
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        # Seconds to wait for Google before starting offline recognition too,
+        # plus this much for every second of audio
+        self.deadline = deadline if deadline is not None else _float_env("ANAPRO_ONLINE_DEADLINE", 3.0)
+        self.deadline_per_second = deadline_per_second
+        self.fallback = fallback
+        self.model_path = model_path
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_concurrency)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        # Requests beyond max_concurrency wait here, which counts against their deadline
+        self._online = ThreadPoolExecutor(max_workers=max_concurrency)
+        self._offline = ThreadPoolExecutor(max_workers=offline_workers)
+        self._parser = OutputParser(show_all=False, with_confidence=False)
+
+    def close(self):
+        self._online.shutdown(wait=False)
+        self._offline.shutdown(wait=False)
+        self.session.close()
+
+    def _post(self, url, data, headers):
+        """POST with retries on connection errors, timeouts and 429/5xx, sleeping with full jitter between tries."""
+        for attempt in range(self.retries + 1):
+            last = attempt == self.retries
+            try:
+                response = self.session.post(url, data=data, headers=headers, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if last:
+                    raise sr.RequestError(f"recognition connection failed: {e}")
+                delay = random.uniform(0, self.backoff * 2 ** attempt)
+            else:
+                if response.status_code not in RETRY_STATUSES:
+                    if response.status_code >= 400:
+                        raise sr.RequestError(f"recognition request failed: {response.status_code} {response.reason}")
+                    return response
+                if last:
+                    raise sr.RequestError(f"recognition request failed: {response.status_code} {response.reason}")
+                delay = random.uniform(0, self.backoff * 2 ** attempt)
+                retry_after = response.headers.get("Retry-After", "")
+                if retry_after.isdigit():
+                    delay = max(delay, min(float(retry_after), 10.0))
+            time.sleep(delay)
+
+    def recognize_online(self, audio, language="en-US"):
+        """Recognise sr.AudioData with Google; raises sr.UnknownValueError or sr.RequestError like recognize_google."""
+        builder = create_request_builder(endpoint=self.base_url, key=self.key, language=language)
+        with stage("speech.online", items=1, nbytes=len(audio.frame_data)):
+            response = self._post(builder.build_url(), builder.build_data(audio), builder.build_headers(audio))
+            return self._parser.parse(response.text)
+
+    def recognize_offline(self, audio, language="en-US", fallback=None, model_path=None):
+        """Recognise sr.AudioData with PocketSphinx or Vosk."""
+        fallback = fallback or self.fallback
+        with stage(f"speech.offline.{fallback}", items=1, nbytes=len(audio.frame_data)):
+            if fallback == "vosk":
+                import vosk
+                from vosk_models import model_path_for, registry
+
+                model = registry.get(model_path or self.model_path or model_path_for(language))
+                recognizer = vosk.KaldiRecognizer(model, 16000)
+                recognizer.AcceptWaveform(audio.get_raw_data(convert_rate=16000, convert_width=2))
+                text = json.loads(recognizer.FinalResult()).get("text", "")
+                if not text:
+                    raise sr.UnknownValueError()
+                return text
+            return sr.Recognizer().recognize_sphinx(audio)
+
+    def deadline_for(self, audio):
+        seconds = len(audio.frame_data) / (audio.sample_rate * audio.sample_width)
+        return self.deadline + self.deadline_per_second * seconds
+
+    def recognize(self, audio, language="en-US", deadline=None, fallback=None, model_path=None):
+        """
+        Recognise sr.AudioData online, hedged with offline recognition.
+
+        Returns the text from Google if it answers within the deadline, and
+        otherwise whichever of Google and the offline recogniser answers
+        first. Google hearing nothing intelligible counts and raises
+        sr.UnknownValueError. The offline recogniser hearing nothing is
+        weaker evidence: Google then gets until a second deadline has passed
+        to do better before sr.UnknownValueError is raised. sr.RequestError is
+        raised only if both fail.
+        """
+        if deadline is None:
+            deadline = self.deadline_for(audio)
+        online = self._online.submit(self.recognize_online, audio, language)
+        try:
+            return online.result(timeout=max(deadline, 0))
+        except FutureTimeout:
+            pass  # still waiting; hedge below
+        except sr.UnknownValueError:
+            raise
+        except Exception:
+            pass  # failed even after retries; go offline
+        give_up = time.monotonic() + max(deadline, 0)
+        offline = self._offline.submit(self.recognize_offline, audio, language, fallback, model_path)
+        futures = {online: "online", offline: "offline"}
+        errors = []
+        unintelligible = None
+        while futures:
+            timeout = max(give_up - time.monotonic(), 0) if unintelligible else None
+            done, _ = wait(futures, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                break  # Google is still busy; go with the offline answer
+            for future in done:
+                source = futures.pop(future)
+                try:
+                    text = future.result()
+                except sr.UnknownValueError as e:
+                    if source == "offline":
+                        unintelligible = e
+                        continue
+                    count(f"speech.hedge.{source}", items=1)
+                    raise
+                except Exception as e:
+                    errors.append(f"{source}: {e}")
+                    continue
+                count(f"speech.hedge.{source}", items=1)
+                return text
+        if unintelligible is not None:
+            count("speech.hedge.offline", items=1)
+            raise unintelligible
+        raise sr.RequestError("; ".join(errors))
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """The shared client, created on first use."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = SpeechClient()
+        return _client
@@ -0,0 +1,52 @@
+import os
+import sys
+
+import pytest
+
+# The modules live at the top of the repository rather than in a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class FakeOcr:
+    """Stands in for Tesseract: an image's text is texts[path], or 'text of <file name>'."""
+
+    name = "fake"
+    texts = {}
+
+    def __init__(self, lang="eng", config=""):
+        self.signature = f"{self.name}:{self.version()}"
+
+    @staticmethod
+    def version():
+        return "1.0"
+
+    def image_to_string(self, img):
+        return self.texts.get(img.filename, f"text of {os.path.basename(img.filename)}")
+
+    def image_to_words(self, img):
+        from ocr_backend import Word
+
+        return [Word(text, 10 * i, 0, 8, 10, 0) for i, text in enumerate(self.image_to_string(img).split())]
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def fake_ocr(monkeypatch):
+    """Register the "fake" OCR backend; returns the path -> text dict it answers from."""
+    import ocr_backend
+
+    texts = {}
+    monkeypatch.setitem(ocr_backend.BACKENDS, "fake", FakeOcr)
+    monkeypatch.setattr(FakeOcr, "texts", texts)
+    return texts
+
+
+def make_image(path, width=40, height=60):
+    """Write a small white image to path (its format from the extension) and return the path."""
+    from PIL import Image
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    Image.new("RGB", (width, height), "white").save(path)
+    return path
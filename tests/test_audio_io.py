@@ -0,0 +1,38 @@
+import struct
+
+import numpy as np
+
+import audio_io
+from audio_io import AudioStream
+
+
+def write_wav(path, tag, bits, data, rate=16000, channels=1):
+    block = channels * bits // 8
+    fmt = struct.pack("<HHIIHH", tag, channels, rate, rate * block, block, bits)
+    with open(path, "wb") as f:
+        f.write(b"RIFF" + struct.pack("<I", 4 + 8 + len(fmt) + 8 + len(data)) + b"WAVE")
+        f.write(b"fmt " + struct.pack("<I", len(fmt)) + fmt)
+        f.write(b"data" + struct.pack("<I", len(data)) + data)
+    return path
+
+
+def test_pcm_wav_is_read_directly(tmp_path):
+    samples = (np.sin(np.arange(16000) / 10) * 10000).astype("<i2")
+    path = write_wav(str(tmp_path / "talk.wav"), audio_io.WAVE_FORMAT_PCM, 16, samples.tobytes())
+    decoded = np.frombuffer(b"".join(AudioStream(path)), dtype="<i2")
+    assert len(decoded) == len(samples) and np.abs(decoded - samples).max() <= 1
+
+
+def test_other_wav_encodings_go_to_the_general_decoders(tmp_path, monkeypatch):
+    path = write_wav(str(tmp_path / "alaw.wav"), 6, 8, bytes(16000))  # A-law
+    decoded = []
+
+    def fake_ffmpeg(path, block_seconds):
+        decoded.append(path)
+        yield 16000, 1
+        yield np.zeros((16000, 1), dtype=np.float32)
+
+    monkeypatch.setattr(audio_io, "soundfile", None)
+    monkeypatch.setattr(audio_io, "_ffmpeg_blocks", fake_ffmpeg)
+    assert b"".join(AudioStream(path)) == bytes(32000)
+    assert decoded == [path]
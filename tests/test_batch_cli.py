@@ -0,0 +1,76 @@
+import os
+import time
+
+import fitz
+from conftest import make_image
+
+from batch_cli import BatchConverter
+
+
+def converter(tmp_path, layout):
+    batch = BatchConverter(str(tmp_path / "in"), str(tmp_path / "out"), layout=layout, cache=False, index=False,
+                           workers=1)
+    batch.engine.ocr.backend = "fake"
+    batch.engine.ocr.preprocessor = None  # keeps the image's file name for the fake backend
+    return batch
+
+
+def pdf_names(batch, sources):
+    return [os.path.relpath(batch.output_for(source), batch.output_root) for source in sources]
+
+
+def test_colliding_names_get_their_own_pdfs(tmp_path, fake_ocr):
+    sources = [make_image(str(tmp_path / "in" / name)) for name in ("x.jpg", "x.png", "a_b.png", "a/b.png")]
+    batch = converter(tmp_path, "flat")
+    try:
+        batch.run()
+    finally:
+        batch.engine.close()
+    assert pdf_names(batch, sources) == ["x.pdf", "x.png.pdf", "a_b.png.pdf", "a_b.pdf"]
+    for source in sources:
+        with fitz.open(batch.output_for(source)) as pdf:
+            assert os.path.basename(source) in pdf[0].get_text()
+
+
+def test_audio_and_image_with_the_same_stem(tmp_path):
+    batch = converter(tmp_path, "mirror")
+    batch.engine.close()
+    source = tmp_path / "in" / "talk"
+    batch.plan_outputs([f"{source}.wav", f"{source}.png", f"{source}.wav.png"])
+    assert pdf_names(batch, [f"{source}.png", f"{source}.wav", f"{source}.wav.png"]) == [
+        "talk.pdf", "talk_2.pdf", "talk.wav.pdf"]
+
+
+def test_dir_layout_keeps_a_directory_in_one_pdf(tmp_path):
+    batch = converter(tmp_path, "dir")
+    batch.engine.close()
+    root = tmp_path / "in"
+    sources = [str(root / "a" / "b" / "1.png"), str(root / "a_b" / "2.jpg"), str(root / "a_b" / "3.png"),
+               str(root / "a" / "b.wav")]
+    batch.plan_outputs(sources)
+    assert pdf_names(batch, sources) == ["a_b.pdf", "a_b_2.pdf", "a_b_2.pdf", "a_b.wav.pdf"]
+
+
+def test_audio_files_are_transcribed_in_parallel(tmp_path, monkeypatch):
+    import long_audio
+
+    def slow_recognize(backend, segment, language, model_path):
+        time.sleep(0.4)
+        return f"words of {segment.index}"
+
+    monkeypatch.setattr(long_audio, "iter_segments",
+                        lambda path, **options: iter([long_audio.Segment(0, 0, 1, b"", 16000, 2)]))
+    monkeypatch.setattr(long_audio, "recognize_segment", slow_recognize)
+    sources = [str(tmp_path / "in" / f"talk{i}.wav") for i in range(3)]
+    batch = BatchConverter(str(tmp_path / "in"), str(tmp_path / "out"), cache=False, index=False, workers=4,
+                           audio_backend="google")
+    started = time.monotonic()
+    try:
+        batch.convert_audio(sources)
+    finally:
+        batch.engine.close()
+    assert time.monotonic() - started < 1.0  # one after the other would take 1.2 s
+    assert [batch.results[source] for source in sources] == ["ok", "ok", "ok"]
+    for source in sources:
+        with fitz.open(batch.output_for(source)) as pdf:
+            assert "words of 0" in pdf[0].get_text()
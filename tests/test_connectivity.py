@@ -0,0 +1,61 @@
+import threading
+
+from connectivity import ConnectivityMonitor, probe_address, speech_service_url
+
+
+def test_probes_the_speech_service_host(monkeypatch):
+    monkeypatch.setenv("ANAPRO_SPEECH_URL", "https://speech.invalid/v1/recognize")
+    monitor = ConnectivityMonitor(timeout=0.1)
+    assert monitor.probe() is False
+    assert (monitor.host, monitor.port) == ("speech.invalid", 443)
+    assert probe_address("http://127.0.0.1:8080/recognize") == ("127.0.0.1", 8080)
+
+
+class SlowMonitor(ConnectivityMonitor):
+    """Answers "online" and holds the first probe until released."""
+
+    def __init__(self):
+        super().__init__(host="unused", ttl=60.0)
+        self.probing = threading.Event()
+        self.release = threading.Event()
+        self.probes = threading.Semaphore(0)
+
+    def probe(self):
+        self.probing.set()
+        self.release.wait()
+        self.probes.release()
+        return True
+
+
+def test_check_now_during_a_probe_is_not_lost():
+    monitor = SlowMonitor().start()
+    try:
+        assert monitor.probing.wait(5)
+        monitor.check_now()
+        monitor.release.set()
+        assert monitor.probes.acquire(timeout=5)
+        assert monitor.probes.acquire(timeout=5)  # the second probe comes long before ttl
+    finally:
+        monitor.stop()
+
+
+def test_default_url_is_the_one_speech_client_uses(monkeypatch):
+    from speech_client import service_url
+
+    monkeypatch.delenv("ANAPRO_SPEECH_URL", raising=False)
+    assert speech_service_url() == service_url()
+
+
+class BrokenMonitor(ConnectivityMonitor):
+    def probe(self):
+        raise RuntimeError("probe failed")
+
+
+def test_a_failing_probe_counts_as_offline():
+    monitor = BrokenMonitor(host="unused").start()
+    try:
+        assert monitor.wait_for_first_check(5)
+        assert monitor.is_online is False
+        assert monitor._thread.is_alive()
+    finally:
+        monitor.stop()
@@ -0,0 +1,23 @@
+import os
+
+import fitz
+from conftest import make_image
+
+from engine import ConversionEngine
+
+
+def test_interleaved_sources_keep_all_their_pages(tmp_path, fake_ocr):
+    sources = [make_image(str(tmp_path / name)) for name in ("a1.png", "b1.png", "a2.png", "b2.png", "a3.png")]
+    engine = ConversionEngine(workers=2, backend="fake")
+    try:
+        results = list(engine.convert(sources, lambda source: str(tmp_path / (os.path.basename(source)[0] + ".pdf")),
+                                      titles=True))
+    finally:
+        engine.close()
+    assert [os.path.basename(result.source) for result in results] == ["a1.png", "a2.png", "a3.png", "b1.png",
+                                                                       "b2.png"]
+    assert all(result.status == "ok" for result in results)
+    for name, members in (("a.pdf", ["a1", "a2", "a3"]), ("b.pdf", ["b1", "b2"])):
+        with fitz.open(str(tmp_path / name)) as pdf:
+            text = "".join(page.get_text() for page in pdf)
+        assert [member for member in ("a1", "a2", "a3", "b1", "b2") if f"text of {member}.png" in text] == members
@@ -0,0 +1,50 @@
+import os
+
+import pytest
+from conftest import FakeOcr, make_image
+
+from batch_cli import BatchConverter
+from folder_watch import CACHE_NAME, FolderWatcher
+
+
+def watcher(tmp_path, mode):
+    converter = BatchConverter(str(tmp_path / "in"), str(tmp_path / "out"), layout="dir", mode=mode, cache=False,
+                               index=False, workers=1)
+    converter.engine.ocr.backend = "fake"
+    converter.engine.ocr.preprocessor = None  # keeps the image's file name for the fake backend
+    return FolderWatcher(converter)
+
+
+@pytest.mark.parametrize("mode", ["text", "searchable"])
+def test_dir_layout_only_recognises_changed_images(tmp_path, fake_ocr, monkeypatch, mode):
+    recognised = []
+    original = FakeOcr.image_to_string
+    monkeypatch.setattr(FakeOcr, "image_to_string",
+                        lambda self, img: recognised.append(os.path.basename(img.filename)) or original(self, img))
+    images = [make_image(str(tmp_path / "in" / "scans" / f"{i}.png"), width=40 + i) for i in range(3)]
+    watch = watcher(tmp_path, mode)
+    try:
+        watch.run_once()
+        assert sorted(recognised) == ["0.png", "1.png", "2.png"]
+        assert os.path.isdir(tmp_path / "out" / CACHE_NAME)
+
+        del recognised[:]
+        make_image(images[1], width=50)  # new contents
+        watch.run_once()
+        assert recognised == ["1.png"]
+        assert watch.converter.results == {path: "ok" for path in images}
+    finally:
+        watch.converter.engine.close()
+
+
+def test_renamed_directory_drops_its_entries(tmp_path, fake_ocr):
+    make_image(str(tmp_path / "in" / "old" / "a.png"))
+    watch = watcher(tmp_path, "text")
+    try:
+        watch.run_once()
+        os.rename(tmp_path / "in" / "old", tmp_path / "in" / "new")
+        watch.run_once()
+    finally:
+        watch.converter.engine.close()
+    assert sorted(watch.manifest) == [os.path.join("new", "a.png")]
+    assert sorted(os.listdir(tmp_path / "out")) == [".manifest.json", CACHE_NAME, "new.pdf"]
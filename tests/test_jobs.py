@@ -0,0 +1,67 @@
+from jobs import Job
+
+
+class ManualDispatcher:
+    """Holds posted calls until run() is called, like a UI thread that has fallen behind."""
+
+    def __init__(self):
+        self.calls = []
+
+    def post(self, fn, *args):
+        self.calls.append((fn, args))
+
+    def run(self):
+        calls, self.calls = self.calls, []
+        for fn, args in calls:
+            fn(*args)
+
+
+def test_progress_is_coalesced_to_the_latest_value():
+    dispatcher = ManualDispatcher()
+    seen = []
+    job = Job(None, dispatcher, on_progress=lambda job, done, total, message: seen.append((done, total, message)))
+    for done in range(100):
+        job.progress(done, 100, "working")
+    assert len(dispatcher.calls) == 1
+    dispatcher.run()
+    assert seen == [(99, 100, "working")]
+    job.progress(100, 100, "done")
+    dispatcher.run()
+    assert seen[-1] == (100, 100, "done")
+
+
+def test_cancelled_job_stops_between_items_and_closes_its_items():
+    dispatcher = ManualDispatcher()
+    results = []
+    seen = []
+    closed = []
+
+    def items():
+        try:
+            for i in range(10):
+                yield i
+        finally:
+            closed.append(True)
+
+    def task(job):
+        for i in job.track(items(), 10):
+            seen.append(i)
+            if i == 2:
+                job.cancel()
+        return "finished"
+
+    job = Job(task, dispatcher, on_done=lambda job, result: results.append(result))
+    job.run()
+    dispatcher.run()
+    assert seen == [0, 1, 2]
+    assert closed == [True]
+    assert job.state == "cancelled"
+    assert results == [None]
+
+
+def test_job_cancelled_before_it_starts_never_runs():
+    ran = []
+    job = Job(lambda job: ran.append(True), ManualDispatcher())
+    job.cancel()
+    job.run()
+    assert ran == [] and job.state == "cancelled"
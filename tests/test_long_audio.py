@@ -0,0 +1,46 @@
+import time
+
+import numpy as np
+import pytest
+
+import long_audio
+from long_audio import Segment, SilenceSplitter, transcribe_long_audio
+
+
+class Cancelled(Exception):
+    pass
+
+
+def test_cancelling_does_not_wait_for_queued_segments(monkeypatch):
+    def slow_recognize(backend, segment, language, model_path):
+        time.sleep(0.5)
+        return f"segment {segment.index}"
+
+    monkeypatch.setattr(long_audio, "iter_segments",
+                        lambda path, **options: (Segment(i, i, i + 1, b"", 16000, 2) for i in range(40)))
+    monkeypatch.setattr(long_audio, "recognize_segment", slow_recognize)
+    cancelled_at = []
+
+    def on_text(segment, text):
+        cancelled_at.append(time.monotonic())
+        raise Cancelled()
+
+    with pytest.raises(Cancelled):
+        transcribe_long_audio("talk.wav", backend="google", online_concurrency=2, on_text=on_text)
+    # Two segments are still running, but the six queued behind them would take another 1.5 s
+    assert time.monotonic() - cancelled_at[0] < 0.3
+
+
+def tone(seconds, amplitude=0.3, rate=16000):
+    t = np.arange(int(seconds * rate)) / rate
+    return (amplitude * 32767 * np.sin(2 * np.pi * 440 * t)).astype("<i2")
+
+
+def test_speech_at_the_very_start_is_kept():
+    rng = np.random.default_rng(0)
+    quiet = (rng.normal(0, 0.0005 * 32767, 16000)).astype("<i2")
+    pcm = np.concatenate([tone(3), quiet, tone(1)]).tobytes()
+    splitter = SilenceSplitter(16000, 2)
+    segments = [segment for i in range(0, len(pcm), 8000) for segment in splitter.feed(pcm[i:i + 8000])]
+    segments.extend(splitter.flush())
+    assert [(round(s.start, 1), round(s.end, 1)) for s in segments] == [(0.0, 3.2), (3.8, 5.0)]
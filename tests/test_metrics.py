@@ -0,0 +1,48 @@
+import threading
+
+from metrics import Metrics
+
+
+def traced_metrics():
+    registry = Metrics()
+    registry.enable(trace_memory=True)
+    return registry
+
+
+def test_nested_stage_does_not_reset_the_outer_peak():
+    registry = traced_metrics()
+    try:
+        with registry.stage("outer"):
+            buffer = bytearray(8 << 20)
+            del buffer
+            with registry.stage("inner"):
+                bytearray(1024)
+    finally:
+        registry.disable()
+    summary = registry.summary()
+    assert summary["outer"]["peak_bytes"] >= 8 << 20
+    assert summary["inner"]["peak_bytes"] is None
+
+
+def test_overlapping_stage_on_another_thread_records_no_peak():
+    registry = traced_metrics()
+    started, done = threading.Event(), threading.Event()
+
+    def other():
+        with registry.stage("other"):
+            started.set()
+            done.wait()
+
+    thread = threading.Thread(target=other)
+    thread.start()
+    started.wait()
+    try:
+        with registry.stage("overlapping"):
+            bytearray(1024)
+    finally:
+        done.set()
+        thread.join()
+        registry.disable()
+    summary = registry.summary()
+    assert summary["overlapping"]["peak_bytes"] is None
+    assert summary["other"]["peak_bytes"]
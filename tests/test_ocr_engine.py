@@ -0,0 +1,104 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from conftest import FakeOcr, make_image
+
+from ocr_backend import backend_signature
+from ocr_engine import ParallelOcrEngine
+
+
+def test_cache_key_covers_backend_and_tesseract_version(tmp_path, fake_ocr, monkeypatch):
+    image = make_image(str(tmp_path / "scan.png"))
+    fake_key = ParallelOcrEngine(backend="fake")._cache_key(image)
+    assert fake_key != ParallelOcrEngine(backend="pytesseract")._cache_key(image)
+    assert ParallelOcrEngine(backend="fake")._cache_key(image, words=True) != fake_key
+
+    monkeypatch.setattr(FakeOcr, "version", staticmethod(lambda: "2.0"))
+    backend_signature.cache_clear()
+    try:
+        assert ParallelOcrEngine(backend="fake")._cache_key(image) != fake_key
+    finally:
+        backend_signature.cache_clear()
+
+
+class BrokenOcr(FakeOcr):
+    def __init__(self, lang="eng", config=""):
+        raise RuntimeError("no traineddata")
+
+
+def test_signature_names_the_fallback_backend(monkeypatch):
+    import ocr_backend
+
+    monkeypatch.setitem(ocr_backend.BACKENDS, "broken", BrokenOcr)
+    backend_signature.cache_clear()
+    try:
+        assert backend_signature(name="broken").startswith("pytesseract:")
+    finally:
+        backend_signature.cache_clear()
+
+
+class SlowOcr(FakeOcr):
+    """Takes longer on earlier images, so workers finish out of order."""
+
+    calls = []
+
+    def image_to_string(self, img):
+        name = os.path.basename(img.filename)
+        self.calls.append(name)
+        time.sleep(0.05 if name.startswith("0") else 0)
+        return super().image_to_string(img)
+
+
+@pytest.fixture
+def slow_ocr(fake_ocr, monkeypatch):
+    import ocr_backend
+
+    monkeypatch.setitem(ocr_backend.BACKENDS, "slow", SlowOcr)
+    monkeypatch.setattr(SlowOcr, "calls", [])
+    return SlowOcr.calls
+
+
+def test_results_keep_input_order_and_failures_stay_per_image(tmp_path, slow_ocr):
+    paths = [make_image(str(tmp_path / f"{i}.png"), width=40 + i) for i in range(6)]
+    broken = tmp_path / "3.png"
+    broken.write_bytes(b"not an image")
+    engine = ParallelOcrEngine(workers=3, backend="slow")
+    try:
+        results = engine.recognize(paths)
+    finally:
+        engine.close()
+    assert [r.path for r in results] == paths
+    assert [r.text for r in results] == ["text of 0.png", "text of 1.png", "text of 2.png", "",
+                                         "text of 4.png", "text of 5.png"]
+    assert [r.error is not None for r in results] == [False, False, False, True, False, False]
+
+
+def test_closing_early_cancels_the_images_not_yet_started(tmp_path, slow_ocr):
+    paths = [make_image(str(tmp_path / f"0{i}.png"), width=40 + i) for i in range(10)]
+    engine = ParallelOcrEngine(workers=3, backend="slow")
+    # One worker behind a window of six, so most submitted images are still queued
+    engine._pool = ThreadPoolExecutor(max_workers=1)
+    try:
+        results = engine.imap(paths)
+        assert next(results).path == paths[0]
+        results.close()
+    finally:
+        engine.close()
+    assert len(slow_ocr) <= 2
+
+
+def test_thread_limit_stays_out_of_the_process_environment(monkeypatch):
+    import pytesseract
+
+    monkeypatch.delenv("OMP_THREAD_LIMIT", raising=False)
+    seen = {}
+    engine = ParallelOcrEngine(workers=1, tesseract_threads=3)
+    try:
+        engine._executor().submit(lambda: seen.update(pytesseract.pytesseract.environ)).result()
+    finally:
+        engine.close()
+    assert seen["OMP_THREAD_LIMIT"] == "3"
+    assert "OMP_THREAD_LIMIT" not in os.environ
+    assert "OMP_THREAD_LIMIT" not in pytesseract.pytesseract.environ
@@ -0,0 +1,44 @@
+import struct
+import zlib
+
+from PIL import Image
+
+from pdf_images import PNG_SIGNATURE, _png_chunks, _png_image, load_image
+
+
+def read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def png_without(data, kind):
+    """data, a PNG file, with its chunks of kind left out."""
+    chunks = [(k, body) for k, body in _png_chunks(data) if k != kind]
+    return PNG_SIGNATURE + b"".join(struct.pack(">I4s", len(body), k) + body
+                                    + struct.pack(">I", zlib.crc32(k + body)) for k, body in chunks)
+
+
+def test_jpeg_is_embedded_unchanged(tmp_path):
+    path = str(tmp_path / "photo.jpg")
+    Image.new("RGB", (30, 20), "red").save(path, dpi=(300, 300))
+    image = load_image(path)
+    assert image.data == read(path)
+    assert (image.width, image.height, image.dpi) == (30, 20, 300)
+    assert "/DCTDecode" in image.dictionary
+
+
+def test_png_idat_is_embedded_unchanged(tmp_path):
+    path = str(tmp_path / "scan.png")
+    Image.new("L", (30, 20), 200).save(path)
+    image = load_image(path)
+    assert image.data == b"".join(body for kind, body in _png_chunks(read(path)) if kind == b"IDAT")
+    assert "/Predictor 15" in image.dictionary
+
+
+def test_png_missing_its_header_or_palette_is_not_embedded(tmp_path):
+    path = str(tmp_path / "palette.png")
+    Image.new("P", (30, 20), 3).save(path)
+    data = read(path)
+    assert _png_image(data) is not None
+    assert _png_image(png_without(data, b"IHDR")) is None
+    assert _png_image(png_without(data, b"PLTE")) is None
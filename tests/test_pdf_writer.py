@@ -0,0 +1,38 @@
+import fitz
+from conftest import make_image
+
+from ocr_backend import Word
+from ocr_engine import WordsResult
+from pdf_writer import searchable_pdf
+
+WORDS = [Word("Hello", 20, 30, 100, 40, 1), Word("ሰላም", 140, 30, 90, 40, 1),
+         Word("𝔸𝔹", 20, 120, 80, 40, 2)]
+
+
+def test_text_layer_is_extracted_at_its_boxes(tmp_path):
+    image = make_image(str(tmp_path / "scan.png"), width=300, height=200)
+    pdf_path = str(tmp_path / "out.pdf")
+    assert searchable_pdf([WordsResult(image, "", WORDS, None)], pdf_path) == (1, [])
+
+    with fitz.open(pdf_path) as doc:
+        page = doc[0]
+        # 300 x 200 pixels with no DPI: the long side fills A4's long side
+        scale = page.rect.width / 300
+        found = page.get_text("words")
+        fonts = page.get_fonts()
+    assert [w[4] for w in found] == ["Hello", "ሰላም", "𝔸𝔹"]
+    for word, (x0, y0, x1, y1, *_) in zip(WORDS, found):
+        assert abs(x0 - word.left * scale) < 1
+        assert abs(x1 - (word.left + word.width) * scale) < 1
+        assert y0 < (word.top + word.height) * scale and y1 > word.top * scale
+    assert [font[1] for font in fonts if font[3] == "GlyphLessFont"] == ["ttf"]  # the font program is embedded
+
+
+def test_failed_ocr_keeps_the_image_page(tmp_path):
+    image = make_image(str(tmp_path / "scan.png"))
+    pdf_path = str(tmp_path / "out.pdf")
+    pages, failures = searchable_pdf([WordsResult(image, "", [], "tesseract failed")], pdf_path)
+    assert (pages, failures) == (1, [(image, "tesseract failed")])
+    with fitz.open(pdf_path) as doc:
+        assert len(doc[0].get_images()) == 1
+        assert doc[0].get_text().strip() == ""
@@ -0,0 +1,29 @@
+import numpy as np
+from PIL import Image
+
+from preprocess import deskew, estimate_skew, otsu_threshold
+
+
+def bilevel_page(angle):
+    """A white page with black text-like bars, rotated by angle and snapped back to pure 0/255."""
+    arr = np.full((600, 800), 255, dtype=np.uint8)
+    for top in range(60, 540, 40):
+        arr[top:top + 12, 80:720] = 0
+    page = Image.fromarray(arr, mode="L").rotate(angle, resample=Image.BILINEAR, expand=True, fillcolor=255)
+    return Image.fromarray(np.where(np.asarray(page) < 128, 0, 255).astype(np.uint8), mode="L")
+
+
+def test_otsu_threshold_of_bilevel_page_is_zero():
+    assert otsu_threshold(np.asarray(bilevel_page(0))) == 0
+
+
+def test_estimate_skew_on_bilevel_page():
+    assert abs(estimate_skew(bilevel_page(3.0)) - -3.0) <= 0.25
+    assert abs(estimate_skew(bilevel_page(-2.0)) - 2.0) <= 0.25
+
+
+def test_deskew_straightens_bilevel_page():
+    page = bilevel_page(3.0)
+    straightened = deskew(page)
+    assert straightened.size != page.size
+    assert abs(estimate_skew(straightened)) <= 0.25
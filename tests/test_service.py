@@ -0,0 +1,75 @@
+import os
+import time
+
+import pytest
+
+pytest.importorskip("flask")
+
+from service import ConversionService, create_app
+
+
+def crash(source, pdf_path):
+    os._exit(1)
+
+
+def write_pdf(source, pdf_path):
+    with open(pdf_path, "wb") as f:
+        f.write(b"%PDF-1.4\n")
+    return 1
+
+
+def wait_for(job, timeout=60):
+    deadline = time.monotonic() + timeout
+    while job.status in ("queued", "running"):
+        assert time.monotonic() < deadline, "job didn't finish"
+        time.sleep(0.05)
+    return job.status
+
+
+@pytest.fixture
+def service(tmp_path):
+    service = ConversionService(work_dir=str(tmp_path), workers=1, queue_size=2)
+    yield service
+    service.close()
+
+
+def submit(service, fn):
+    assert service.reserve()
+    job_id, directory = service.new_directory()
+    return service.submit(job_id, "images", directory, fn, "source")
+
+
+def test_pool_recovers_after_a_worker_dies(service):
+    crashed = submit(service, crash)
+    assert wait_for(crashed) == "error"
+    with create_app(service).test_request_context():
+        assert "worker process died" in crashed.to_dict()["error"]
+
+    job = submit(service, write_pdf)
+    assert wait_for(job) == "done"
+    assert service.active == 0
+
+
+def test_submit_replaces_a_pool_broken_behind_its_back(service):
+    broken = service.pool
+    broken.submit(crash, "source", os.devnull).exception(timeout=60)
+
+    job = submit(service, write_pdf)
+    assert service.pool is not broken
+    assert wait_for(job) == "done"
+
+
+def test_post_after_a_worker_dies(service, tmp_path):
+    from PIL import Image
+
+    wait_for(submit(service, crash))
+    image_path = tmp_path / "page.png"
+    Image.new("L", (40, 60), 255).save(image_path)
+    client = create_app(service).test_client()
+    with open(image_path, "rb") as f:
+        response = client.post("/jobs", data={"images": (f, "page.png"), "mode": "images"})
+    assert response.status_code == 202
+    job = service.get(response.json["id"])
+    assert wait_for(job) == "done"
+    pdf = client.get(f"/jobs/{job.id}/pdf")
+    assert pdf.status_code == 200 and pdf.data.startswith(b"%PDF")
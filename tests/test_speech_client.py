@@ -0,0 +1,117 @@
+"""
+speech_client.py builds on speech_recognition.recognizers.google, which is
+not public API. These tests pin down what it relies on, so upgrading
+SpeechRecognition past the version in requirements.txt fails here first.
+"""
+
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+import speech_recognition as sr
+
+from speech_client import SpeechClient
+
+RESPONSE = ('{"result":[]}\n'
+            '{"result":[{"alternative":[{"transcript":"ሰላም ለዓለም","confidence":0.9}],"final":true}],'
+            '"result_index":0}\n')
+
+
+def pinned_version():
+    with open(os.path.join(os.path.dirname(__file__), os.pardir, "requirements.txt"), encoding="utf-16") as f:
+        for line in f:
+            if line.startswith("SpeechRecognition=="):
+                return line.strip().split("==")[1]
+
+
+def test_installed_version_is_the_pinned_one():
+    assert sr.__version__ == pinned_version(), (
+        "speech_client.py uses speech_recognition.recognizers.google internals; check them (this file) "
+        "against the new version before moving the pin in requirements.txt")
+
+
+@pytest.fixture
+def fake_google():
+    requests_seen = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers["Content-Length"]))
+            requests_seen.append((self.path, self.headers["Content-Type"], body))
+            data = RESPONSE.encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}/speech-api/v2/recognize", requests_seen
+    server.shutdown()
+    server.server_close()
+
+
+def test_recognize_online_round_trip(fake_google):
+    url, requests_seen = fake_google
+    client = SpeechClient(base_url=url, key="test-key", retries=0)
+    try:
+        audio = sr.AudioData(b"\0\0" * 16000, 16000, 2)
+        assert client.recognize_online(audio, language="am-ET") == "ሰላም ለዓለም"
+    finally:
+        client.close()
+    path, content_type, body = requests_seen[0]
+    query = parse_qs(urlsplit(path).query)
+    assert urlsplit(path).path == "/speech-api/v2/recognize"
+    assert query["key"] == ["test-key"] and query["lang"] == ["am-ET"]
+    assert content_type.startswith("audio/x-flac") and "rate=16000" in content_type
+    assert body.startswith(b"fLaC")
+
+
+def test_no_result_is_unknown_value():
+    client = SpeechClient(base_url="http://127.0.0.1:9/recognize")
+    try:
+        with pytest.raises(sr.UnknownValueError):
+            client._parser.parse('{"result":[]}\n')
+    finally:
+        client.close()
+
+
+class HedgedClient(SpeechClient):
+    """Google answers after online_delay seconds; the offline recogniser hears nothing, at once."""
+
+    def __init__(self, online_delay):
+        super().__init__(base_url="http://127.0.0.1:9/recognize", deadline=0.1, deadline_per_second=0)
+        self.online_delay = online_delay
+
+    def recognize_online(self, audio, language="en-US"):
+        time.sleep(self.online_delay)
+        return "hello"
+
+    def recognize_offline(self, audio, language="en-US", fallback=None, model_path=None):
+        raise sr.UnknownValueError()
+
+
+def test_offline_hearing_nothing_waits_for_google():
+    client = HedgedClient(online_delay=0.15)
+    try:
+        assert client.recognize(sr.AudioData(b"\0\0" * 1600, 16000, 2)) == "hello"
+    finally:
+        client.close()
+
+
+def test_offline_hearing_nothing_is_the_answer_once_google_runs_out_of_time():
+    client = HedgedClient(online_delay=2)
+    started = time.monotonic()
+    try:
+        with pytest.raises(sr.UnknownValueError):
+            client.recognize(sr.AudioData(b"\0\0" * 1600, 16000, 2))
+    finally:
+        client.close()
+    assert time.monotonic() - started < 1
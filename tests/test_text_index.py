@@ -0,0 +1,84 @@
+import os
+
+from conftest import make_image
+
+from batch_cli import BatchConverter
+from engine import ConversionEngine
+from folder_watch import FolderWatcher
+from pdf_writer import TextLayout
+from text_index import TextIndex, match_expression
+
+
+def long_text(marker_page, marker, pages=3):
+    """Text filling about `pages` PDF pages, with marker on page marker_page only."""
+    per_page = TextLayout().lines_per_page()
+    lines = [f"line {i}" for i in range(per_page * pages - per_page // 2)]
+    lines[per_page * (marker_page - 1) + 3] = marker
+    return "\n".join(lines)
+
+
+def test_match_expression_quotes_words():
+    assert match_expression('tax OR "(') == '"tax" "OR"*'
+    assert match_expression("!!") is None
+
+
+def test_add_text_indexes_each_page(tmp_path):
+    with TextIndex(str(tmp_path / "index.sqlite")) as index:
+        index.add_text("audio.wav", "audio.pdf", long_text(2, "ሰላም ኢትዮጵያ"))
+        hits = index.search("ኢትዮጵያ")
+        assert [hit.page for hit in hits] == [2]
+        assert index.stats() == {"pages": 3, "sources": 1}
+
+
+def test_remove_pdf(tmp_path):
+    with TextIndex(str(tmp_path / "index.sqlite")) as index:
+        index.add_text("a.png", "a.pdf", "alpha")
+        index.add_text("b.png", "b.pdf", "alpha")
+        index.remove_pdf("a.pdf")
+        assert [os.path.basename(hit.pdf) for hit in index.search("alpha")] == ["b.pdf"]
+
+
+def test_engine_indexes_the_page_each_text_is_on(tmp_path, fake_ocr):
+    first = make_image(str(tmp_path / "first.png"))
+    second = make_image(str(tmp_path / "second.png"))
+    fake_ocr[first] = long_text(3, "needle")
+    fake_ocr[second] = "haystack"
+    pdf = str(tmp_path / "out.pdf")
+    index = TextIndex(str(tmp_path / "index.sqlite"))
+    engine = ConversionEngine(workers=1, backend="fake", index=index)
+    try:
+        results = list(engine.convert([first, second], pdf))
+        assert [result.pages for result in results] == [3, 1]
+        assert [hit.page for hit in index.search("needle")] == [3]
+        assert [hit.page for hit in index.search("haystack")] == [4]
+
+        # Rewriting the PDF without the first image drops its pages from the index
+        list(engine.convert([second], pdf))
+        assert index.search("needle") == []
+        assert [hit.page for hit in index.search("haystack")] == [1]
+    finally:
+        engine.close()
+        index.close()
+
+
+def test_folder_watch_forgets_deleted_pdfs(tmp_path, fake_ocr):
+    source = tmp_path / "in"
+    image = make_image(str(source / "a" / "scan.png"))
+    make_image(str(source / "b.png"))
+    fake_ocr[image] = "needle"
+    converter = BatchConverter(str(source), str(tmp_path / "out"), cache=False, index=False, workers=1)
+    converter.index = converter.engine.index = TextIndex(str(tmp_path / "index.sqlite"))
+    converter.engine.ocr.backend = "fake"
+    converter.engine.ocr.preprocessor = None  # keeps the image's file name for the fake backend
+    watcher = FolderWatcher(converter)
+    try:
+        watcher.run_once()
+        assert len(converter.index.search("needle")) == 1
+
+        os.remove(image)
+        watcher.run_once()
+        assert converter.index.search("needle") == []
+        assert len(converter.index.search("text of b")) == 1
+    finally:
+        converter.engine.close()
+        converter.index.close()
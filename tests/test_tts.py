@@ -0,0 +1,65 @@
+import os
+import threading
+
+import tts
+from tts import PhraseCache, Speaker, phrase_key, wav_bytes
+
+
+class FakeVoices:
+    """A TTS backend whose default voice is "alto" and which writes silence."""
+
+    name = "fake"
+    suffix = ".wav"
+
+    def resolve_voice(self, language, voice=None):
+        return voice or "alto"
+
+    def synthesize(self, text, language, voice, path):
+        with open(path, "wb") as f:
+            f.write(wav_bytes(b"\0\0" * 2400, tts.PLAYBACK_RATE))
+
+
+class GatedPlayer:
+    """Plays nothing; the first phrase waits until release is set, the rest are recorded."""
+
+    def __init__(self):
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.played = []
+        self.done = threading.Event()
+
+    def play(self, path, stopped):
+        self.started.set()
+        self.release.wait(5)
+        self.played.append(os.path.exists(path))
+
+    def close(self):
+        pass
+
+    def terminate(self):
+        pass
+
+
+def test_queued_phrases_survive_eviction(tmp_path, monkeypatch):
+    monkeypatch.setitem(tts.BACKENDS, "fake", FakeVoices)
+    size = len(wav_bytes(b"\0\0" * 2400, tts.PLAYBACK_RATE))
+    cache = PhraseCache(str(tmp_path / "phrases"), max_bytes=size)  # room for one phrase only
+    player = GatedPlayer()
+    speaker = Speaker(cache=cache, player=player, lookahead=2, backend="fake")
+    speaker.speak("One. Two. Three.", on_done=player.done.set)
+    assert player.started.wait(5)
+    # Meanwhile something else fills the cache
+    for i in range(3):
+        cache.store(f"{i:064x}", b"x" * size)
+    player.release.set()
+    assert player.done.wait(5)
+    assert player.played == [True, True, True]
+    assert cache.stats()["bytes"] <= size  # nothing is left pinned
+
+
+def test_phrase_key_uses_the_resolved_voice(tmp_path, monkeypatch):
+    monkeypatch.setitem(tts.BACKENDS, "fake", FakeVoices)
+    speaker = Speaker(cache=PhraseCache(str(tmp_path / "phrases")), player=GatedPlayer(), backend="fake")
+    path = speaker.synthesize("Hello.", "en-US", "fake")
+    assert os.path.basename(path) == phrase_key("Hello.", "en-US", "fake", "alto") + ".wav"
+    assert speaker.synthesize("Hello.", "en-US", "fake", voice="alto") == path
@@ -0,0 +1,217 @@
+"""
+Full-text index of everything recognised.
+
+The text of every OCR'd image and transcribed recording is kept in an SQLite
+FTS5 index, one row per PDF page, together with its source file, the PDF
+and page it was written to, the source's modification time and when it was
+indexed. search() returns the best matching pages, ranked by BM25,
+in milliseconds however many documents have been converted, so the PDF
+readers can find a document without opening PDFs one at a time.
+
+Writes are queued and committed in batches, one transaction per batch,
+rather than a commit per page. Indexing a source again replaces what was
+indexed for it in the same PDF before, and whoever rewrites or deletes a
+PDF calls remove_pdf() so its stale pages go too.
+
+    python text_index.py "land registry 1962"
+
+"""
+
+import argparse
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from collections import namedtuple
+
+DEFAULT_INDEX_PATH = os.path.join(os.path.expanduser("~"), ".cache", "anapro", "text_index.sqlite")
+
+# source: the image or audio file; pdf: the PDF its text went to; page: the
+# page of it (1-based); snippet: matching text with the terms in [brackets].
+Hit = namedtuple("Hit", ["source", "pdf", "page", "snippet", "rank", "modified", "indexed"])
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    id INTEGER PRIMARY KEY,
+    source TEXT NOT NULL,
+    pdf TEXT NOT NULL,
+    page INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    modified REAL,
+    indexed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS pages_source ON pages (source, pdf);
+CREATE INDEX IF NOT EXISTS pages_pdf ON pages (pdf);
+CREATE VIRTUAL TABLE IF NOT EXISTS pages_fts USING fts5 (
+    text, content='pages', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS pages_insert AFTER INSERT ON pages BEGIN
+    INSERT INTO pages_fts (rowid, text) VALUES (new.id, new.text);
+END;
+CREATE TRIGGER IF NOT EXISTS pages_delete AFTER DELETE ON pages BEGIN
+    INSERT INTO pages_fts (pages_fts, rowid, text) VALUES ('delete', old.id, old.text);
+END;
+"""
+
+_INSERT = "INSERT INTO pages (source, pdf, page, text, modified, indexed) VALUES (?, ?, ?, ?, ?, ?)"
+_DELETE_SOURCE = "DELETE FROM pages WHERE source = ? AND pdf = ?"
+_DELETE_PDF = "DELETE FROM pages WHERE pdf = ?"
+
+
+def match_expression(query, prefix=True):
+    """
+    An FTS5 query matching pages with every word of query.
+
+    Words are quoted, so punctuation and FTS5 operators typed into a search
+    box are taken literally; with prefix the last word also matches longer
+    words, for search as you type. None if query has no words.
+    """
+    words = re.findall(r"\w+", query)
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words]
+    if prefix:
+        terms[-1] += "*"
+    return " ".join(terms)
+
+
+def source_mtime(source):
+    try:
+        return os.path.getmtime(source)
+    except OSError:
+        return None
+
+
+class TextIndex:
+    def __init__(self, path=DEFAULT_INDEX_PATH, batch_size=500):
+        self.path = path
+        self.batch_size = batch_size
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # Transactions are managed here; several processes (the CLIs, the apps) may share the file
+        self._db = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+        self._pending = []  # (sql, args) to run, in order
+        self._pending_pages = 0
+        self._layout = None
+        self._lock = threading.Lock()
+
+    def add_pages(self, source, pdf, pages, first_page=1):
+        """
+        Index the texts of consecutive pages of pdf, starting at first_page,
+        as the text of source, replacing what was indexed for it there before.
+        """
+        source = os.path.abspath(source)
+        pdf = os.path.abspath(pdf)
+        modified = source_mtime(source)
+        indexed = time.time()
+        rows = [(source, pdf, first_page + i, text, modified, indexed)
+                for i, text in enumerate(pages) if text.strip()]
+        with self._lock:
+            self._pending.append((_DELETE_SOURCE, (source, pdf)))
+            self._pending.extend((_INSERT, row) for row in rows)
+            self._pending_pages += len(rows)
+            full = self._pending_pages >= self.batch_size
+        if full:
+            self.flush()
+
+    def add_text(self, source, pdf, text, page=1, layout=None):
+        """
+        Index text as the text of source, written to pdf from page on, one
+        row per page as layout (StreamingPdfWriter's default) lays it out.
+        """
+        if layout is None:
+            if self._layout is None:
+                from pdf_writer import TextLayout
+
+                self._layout = TextLayout()
+            layout = self._layout
+        self.add_pages(source, pdf, layout.page_texts(text), page)
+
+    def flush(self):
+        """Write everything queued in one transaction."""
+        with self._lock:
+            pending, self._pending = self._pending, []
+            self._pending_pages = 0
+            if not pending:
+                return
+            db = self._db
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                for sql, args in pending:
+                    db.execute(sql, args)
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            db.execute("COMMIT")
+
+    def remove_pdf(self, pdf):
+        """Forget everything indexed for pdf, because it is being rewritten or has been deleted."""
+        with self._lock:
+            self._pending.append((_DELETE_PDF, (os.path.abspath(pdf),)))
+
+    def search(self, query, limit=20, offset=0):
+        """The best matching pages for the words in query, best first, as Hits."""
+        expression = match_expression(query)
+        if expression is None:
+            return []
+        self.flush()
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT p.source, p.pdf, p.page, snippet(pages_fts, 0, '[', ']', '...', 12), pages_fts.rank, "
+                "p.modified, p.indexed "
+                "FROM pages_fts JOIN pages p ON p.id = pages_fts.rowid "
+                "WHERE pages_fts MATCH ? ORDER BY pages_fts.rank LIMIT ? OFFSET ?",
+                (expression, limit, offset)).fetchall()
+        return [Hit(*row) for row in rows]
+
+    def stats(self):
+        """Number of pages and of source files indexed."""
+        self.flush()
+        with self._lock:
+            pages, sources = self._db.execute("SELECT COUNT(*), COUNT(DISTINCT source) FROM pages").fetchone()
+        return {"pages": pages, "sources": sources}
+
+    def close(self):
+        self.flush()
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    """The shared index in the user's cache directory, opened on first use."""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = TextIndex()
+        return _index
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Search the text of every converted image and recording.")
+    parser.add_argument("query", help="words to look for; the last may be the start of a word")
+    parser.add_argument("-n", "--limit", type=int, default=20, help="most hits to show (default: 20)")
+    parser.add_argument("--index", default=DEFAULT_INDEX_PATH, help="index file (default: %(default)s)")
+    args = parser.parse_args(argv)
+    with TextIndex(args.index) as index:
+        hits = index.search(args.query, limit=args.limit)
+    for hit in hits:
+        print(f"{hit.pdf}:{hit.page}\t{hit.source}\t{' '.join(hit.snippet.split())}")
+    return 0 if hits else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
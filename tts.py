@@ -0,0 +1,385 @@
+"""
+Text to speech.
+
+Ahadu used to send the whole text to gTTS, wait for the complete MP3, save
+it as output.mp3 and run `start output.mp3` through the shell (Windows
+only). Here the text is split into sentences (Ethiopic ። and ፧ included)
+and a synthesis thread works through them while a playback thread plays
+the ones that are ready, so the first sentence is heard while the rest are
+still being synthesised.
+
+pyttsx3 speaks offline with the system's voices; gTTS is used when there is
+no local voice for the language and the network is up. Every sentence is
+decoded once into a small WAV and kept in a phrase cache keyed by the text,
+language, backend and the voice the backend actually uses, so repeated
+phrases play without synthesis. Phrases waiting to be played are pinned in
+the cache so eviction can't delete them first. Playback goes through
+PyAudio, or winsound / the platform's command-line player when PyAudio is
+missing, never through a shell.
+
+"""
+
+import hashlib
+import io
+import os
+import queue
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import wave
+
+from audio_io import SAMPLE_WIDTH, read_pcm
+from metrics import stage
+from ocr_cache import FileCache
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "anapro", "tts")
+DEFAULT_MAX_BYTES = 128 * 1024 * 1024
+PLAYBACK_RATE = 24000  # cached phrases are 24 kHz mono 16-bit
+
+# Sentence ends: Latin punctuation before a space, Ethiopic full stop,
+# question mark and paragraph separator with or without one, and line breaks.
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+|(?<=[።፧፨])\s*|\s*\n\s*")
+_CLAUSE_END = re.compile(r"(?<=[,;:፣፤፥፦])\s*")
+
+
+def split_sentences(text, max_chars=250):
+    """Split text into sentences, breaking overlong ones at clause marks and then at spaces."""
+    chunks = []
+    for sentence in _SENTENCE_END.split(text):
+        sentence = sentence.strip()
+        if not sentence:
+            continue
+        while len(sentence) > max_chars:
+            clauses = [m.end() for m in _CLAUSE_END.finditer(sentence, 0, max_chars) if m.end() < len(sentence)]
+            cut = clauses[-1] if clauses else sentence.rfind(" ", 0, max_chars)
+            if cut <= 0:
+                cut = max_chars
+            chunks.append(sentence[:cut].strip())
+            sentence = sentence[cut:].strip()
+        if sentence:
+            chunks.append(sentence)
+    return chunks
+
+
+def phrase_key(text, language, backend, voice=None):
+    """Cache key for a phrase as spoken by a backend and voice."""
+    digest = hashlib.sha256(" ".join(text.split()).encode("utf-8"))
+    for part in (language, backend, voice or ""):
+        digest.update(b"\0" + part.encode("utf-8"))
+    return digest.hexdigest()
+
+
+def gtts_language(language):
+    """gTTS language code for a recogniser language code such as am-ET."""
+    return language.split("-")[0].lower()
+
+
+class PhraseCache(FileCache):
+    suffix = ".wav"
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        super().__init__(cache_dir, max_bytes)
+
+
+class Pyttsx3Backend:
+    name = "pyttsx3"
+    # NSSpeechSynthesizer writes AIFF whatever the file is called
+    suffix = ".aiff" if sys.platform == "darwin" else ".wav"
+
+    def __init__(self):
+        import pyttsx3
+
+        # The engine must stay on the thread that created it
+        self.engine = pyttsx3.init()
+        self._voices = {}  # language -> voice_for(language)
+
+    def resolve_voice(self, language, voice=None):
+        """Id of the voice synthesize() will use: voice, else one for language, else the engine's current one."""
+        if voice:
+            return voice
+        if language not in self._voices:
+            self._voices[language] = self.voice_for(language)
+        return self._voices[language] or self.engine.getProperty("voice")
+
+    def voice_for(self, language):
+        """Id of an installed voice that speaks language, or None."""
+        code = gtts_language(language)
+        for voice in self.engine.getProperty("voices"):
+            for lang in getattr(voice, "languages", None) or []:
+                if isinstance(lang, bytes):
+                    lang = lang[1:].decode("ascii", "ignore")  # espeak prefixes a priority byte
+                if str(lang).lower().replace("_", "-").split("-")[0] == code:
+                    return voice.id
+        return None
+
+    def synthesize(self, text, language, voice, path):
+        voice = self.resolve_voice(language, voice)
+        if voice:
+            self.engine.setProperty("voice", voice)
+        self.engine.save_to_file(text, path)
+        self.engine.runAndWait()
+
+
+class GttsBackend:
+    name = "gtts"
+    suffix = ".mp3"
+
+    def resolve_voice(self, language, voice=None):
+        """gTTS has a single voice per language."""
+        return None
+
+    def synthesize(self, text, language, voice, path):
+        from gtts import gTTS
+
+        gTTS(text=text, lang=gtts_language(language)).save(path)
+
+
+BACKENDS = {
+    "pyttsx3": Pyttsx3Backend,
+    "gtts": GttsBackend,
+}
+
+
+class Player:
+    """Plays 16-bit mono WAV files without a shell."""
+
+    def __init__(self):
+        self._pyaudio = None
+        self._stream = None
+
+    def _open_stream(self):
+        if self._stream is None:
+            import pyaudio
+
+            if self._pyaudio is None:
+                self._pyaudio = pyaudio.PyAudio()
+            self._stream = self._pyaudio.open(format=pyaudio.paInt16, channels=1, rate=PLAYBACK_RATE,
+                                              output=True)
+        return self._stream
+
+    def play(self, path, stopped):
+        """Play path, returning early once stopped (a threading.Event) is set."""
+        try:
+            stream = self._open_stream()
+        except ImportError:
+            self._play_external(path, stopped)
+            return
+        with wave.open(path, "rb") as f:
+            chunk = PLAYBACK_RATE // 20
+            while not stopped.is_set():
+                frames = f.readframes(chunk)
+                if not frames:
+                    break
+                stream.write(frames)
+
+    def _play_external(self, path, stopped):
+        if sys.platform == "win32":
+            import winsound
+
+            winsound.PlaySound(path, winsound.SND_FILENAME)
+            return
+        players = (["afplay"], ["paplay"], ["aplay", "-q"], ["ffplay", "-nodisp", "-autoexit", "-loglevel", "quiet"])
+        for command in players:
+            if shutil.which(command[0]):
+                process = subprocess.Popen(command + [path])
+                while process.poll() is None:
+                    if stopped.wait(0.05):
+                        process.terminate()
+                        process.wait()
+                return
+        raise RuntimeError("No audio output: install PyAudio")
+
+    def close(self):
+        """Release the output stream; the next play() opens it again."""
+        if self._stream is not None:
+            self._stream.stop_stream()
+            self._stream.close()
+            self._stream = None
+
+    def terminate(self):
+        self.close()
+        if self._pyaudio is not None:
+            self._pyaudio.terminate()
+            self._pyaudio = None
+
+
+_DONE = object()
+
+
+class _Failed:
+    def __init__(self, error):
+        self.error = error
+
+
+class Utterance:
+    """One speak() request: its sentences and the synthesised ones waiting to be played."""
+
+    def __init__(self, sentences, language, online, voice, lookahead, on_done, on_error):
+        self.sentences = sentences
+        self.language = language
+        self.online = online
+        self.voice = voice
+        self.on_done = on_done
+        self.on_error = on_error
+        self.stopped = threading.Event()
+        self.ready = queue.Queue(maxsize=lookahead)
+
+    def stop(self):
+        self.stopped.set()
+
+    def put(self, item):
+        """Hand a synthesised sentence to playback, waiting while lookahead of them are unplayed."""
+        while not self.stopped.is_set():
+            try:
+                self.ready.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+
+class Speaker:
+    def __init__(self, cache=None, player=None, lookahead=2, backend=None):
+        self.cache = cache or PhraseCache()
+        self.player = player or Player()
+        self.lookahead = lookahead
+        self.backend = backend  # None: pick per language, see choose_backend
+        self._backends = {}  # only used on the synthesis thread
+        self._requests = queue.Queue()
+        self._current = None
+        self._playing = threading.Lock()  # one utterance at a time on the player
+        threading.Thread(target=self._synthesis_loop, daemon=True).start()
+
+    def speak(self, text, language="en-US", online=False, voice=None, on_done=None, on_error=None):
+        """
+        Start speaking text, stopping anything still playing, and return the Utterance.
+
+        on_done() and on_error(exception) are called from the playback thread.
+        """
+        self.stop()
+        utterance = Utterance(split_sentences(text), language, online, voice, self.lookahead, on_done, on_error)
+        self._current = utterance
+        self._requests.put(utterance)
+        threading.Thread(target=self._play, args=(utterance,), daemon=True).start()
+        return utterance
+
+    def stop(self):
+        if self._current:
+            self._current.stop()
+            self._current = None
+
+    def _backend(self, name):
+        backend = self._backends.get(name)
+        if backend is None:
+            backend = self._backends[name] = BACKENDS[name]()
+        return backend
+
+    def choose_backend(self, language, online):
+        """pyttsx3 if a local voice speaks language, else gTTS when online, else pyttsx3's default voice."""
+        if self.backend:
+            return self.backend
+        try:
+            if self._backend("pyttsx3").voice_for(language):
+                return "pyttsx3"
+        except Exception:
+            if not online:
+                raise
+        return "gtts" if online else "pyttsx3"
+
+    def synthesize(self, text, language, backend_name, voice=None):
+        """Path of a cached WAV of text, synthesising and caching it first if needed."""
+        key, path = self._synthesize(text, language, backend_name, voice)
+        self.cache.unpin(key)
+        return path
+
+    def _synthesize(self, text, language, backend_name, voice):
+        """(key, path) of a cached WAV of text, pinned in the cache until unpin(key)."""
+        backend = self._backend(backend_name)
+        key = phrase_key(text, language, backend_name, backend.resolve_voice(language, voice))
+        path = self.cache.lookup(key, pin=True)
+        if path:
+            return key, path
+        with stage(f"tts.{backend_name}", items=1, nbytes=len(text)):
+            with tempfile.TemporaryDirectory() as tmp:
+                raw_path = os.path.join(tmp, "phrase" + backend.suffix)
+                backend.synthesize(text, language, voice, raw_path)
+                pcm = read_pcm(raw_path, PLAYBACK_RATE)
+        return key, self.cache.store(key, wav_bytes(pcm, PLAYBACK_RATE), pin=True)
+
+    def _synthesis_loop(self):
+        while True:
+            utterance = self._requests.get()
+            if utterance.stopped.is_set():
+                continue
+            try:
+                backend_name = self.choose_backend(utterance.language, utterance.online)
+                for sentence in utterance.sentences:
+                    phrase = self._synthesize(sentence, utterance.language, backend_name, utterance.voice)
+                    if not utterance.put(phrase):
+                        self.cache.unpin(phrase[0])
+                        break
+                else:
+                    utterance.put(_DONE)
+            except Exception as e:
+                utterance.put(_Failed(e))
+            if utterance.stopped.is_set():
+                self._unpin_unplayed(utterance)
+
+    def _unpin_unplayed(self, utterance):
+        """Release the phrases a stopped utterance will never play."""
+        while True:
+            try:
+                item = utterance.ready.get_nowait()
+            except queue.Empty:
+                return
+            if isinstance(item, tuple):
+                self.cache.unpin(item[0])
+
+    def _play(self, utterance):
+        with self._playing:
+            self._play_sentences(utterance)
+
+    def _play_sentences(self, utterance):
+        try:
+            while not utterance.stopped.is_set():
+                try:
+                    item = utterance.ready.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                if item is _DONE:
+                    break
+                if isinstance(item, _Failed):
+                    raise item.error
+                key, path = item
+                try:
+                    with stage("tts.play", items=1):
+                        self.player.play(path, utterance.stopped)
+                finally:
+                    self.cache.unpin(key)
+        except Exception as e:
+            if utterance.on_error:
+                utterance.on_error(e)
+            return
+        finally:
+            self.player.close()
+            self._unpin_unplayed(utterance)
+        if utterance.on_done and not utterance.stopped.is_set():
+            utterance.on_done()
+
+    def close(self):
+        self.stop()
+        self.player.terminate()
+
+
+def wav_bytes(pcm, rate):
+    """A mono 16-bit WAV file holding pcm."""
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(SAMPLE_WIDTH)
+        f.setframerate(rate)
+        f.writeframes(pcm)
+    return buf.getvalue()
@@ -0,0 +1,121 @@
+"""
+Shared Vosk model registry.
+
+Loading a Vosk model takes seconds and hundreds of MB, so each model is
+loaded once, shared by every recogniser and can be warmed up on a background
+thread before it is needed. An optional memory cap unloads the least
+recently used model.
+
+"""
+
+import os
+import threading
+from collections import OrderedDict
+
+MODEL_PATHS = {
+    "am-ET": "vosk-model-amharic",
+    "en-US": "vosk-model-en",
+}
+
+
+def model_path_for(language):
+    """Directory of the Vosk model for a recogniser language code such as am-ET."""
+    return MODEL_PATHS.get(language, MODEL_PATHS["en-US"])
+
+
+def model_size(model_path):
+    """Bytes on disk of a model directory, used as an estimate of its memory use."""
+    total = 0
+    for dirpath, _, filenames in os.walk(model_path):
+        for filename in filenames:
+            try:
+                total += os.path.getsize(os.path.join(dirpath, filename))
+            except OSError:
+                pass
+    return total
+
+
+class _Loading:
+    def __init__(self):
+        self.done = threading.Event()
+        self.model = None
+        self.error = None
+
+
+class ModelRegistry:
+    def __init__(self, max_bytes=None):
+        self.max_bytes = max_bytes
+        self._models = OrderedDict()  # path -> (model, size), least recently used first
+        self._loading = {}
+        self._lock = threading.Lock()
+
+    def get(self, model_path):
+        """Return the loaded model for model_path, loading it if no one has yet."""
+        with self._lock:
+            if model_path in self._models:
+                self._models.move_to_end(model_path)
+                return self._models[model_path][0]
+            loading = self._loading.get(model_path)
+            owner = loading is None
+            if owner:
+                loading = self._loading[model_path] = _Loading()
+        if owner:
+            self._load(model_path, loading)
+        else:
+            loading.done.wait()
+        if loading.error:
+            raise loading.error
+        return loading.model
+
+    def _load(self, model_path, loading):
+        try:
+            import vosk
+
+            if not os.path.exists(model_path):
+                raise FileNotFoundError(f"Vosk model not found: {model_path}")
+            loading.model = vosk.Model(model_path)
+            size = model_size(model_path) if self.max_bytes else 0
+            with self._lock:
+                self._models[model_path] = (loading.model, size)
+                self._evict(keep=model_path)
+        except Exception as e:
+            loading.error = e
+        finally:
+            with self._lock:
+                self._loading.pop(model_path, None)
+            loading.done.set()
+
+    def _evict(self, keep):
+        if not self.max_bytes:
+            return
+        while sum(size for _, size in self._models.values()) > self.max_bytes and len(self._models) > 1:
+            path = next(iter(self._models))
+            if path == keep:
+                break
+            # Recognisers still holding the model keep it alive until they finish.
+            del self._models[path]
+
+    def preload(self, model_path):
+        """Start loading model_path on a background thread if it isn't loaded yet."""
+        with self._lock:
+            if model_path in self._models or model_path in self._loading:
+                return
+        thread = threading.Thread(target=self._preload, args=(model_path,), daemon=True)
+        thread.start()
+
+    def _preload(self, model_path):
+        try:
+            self.get(model_path)
+        except Exception:
+            pass  # reported when the model is actually used
+
+    def is_loaded(self, model_path):
+        with self._lock:
+            return model_path in self._models
+
+    def unload(self, model_path):
+        with self._lock:
+            self._models.pop(model_path, None)
+
+
+registry = ModelRegistry()
@@ -1,9 +1,12 @@
 import os
-import pytesseract
-from fpdf import FPDF
 from tkinter import filedialog,messagebox
 import tkinter as tk
-from PIL import image
+from engine import ConversionEngine
+from jobs import JobExecutor, TkDispatcher
+from text_index import get_index
+
+engine=None
+jobs=None
 
 
 def select_image():
@@ -12,43 +15,40 @@ def select_image():
         process_images(file_paths)
 
 def process_images(file_paths):
-    extracted_text=""
-    for file in file_paths:
-        text=pytesseract.image_to_string(image)
-
-    save_to_pdf(text)
-
-def save_to_pdf(text):
     pdf_file=filedialog.asksaveasfilename(defaultextension=".pdf", filetypes=[("PDF Files", "*.pdf")])
     if not pdf_file:
         return
-    
-    if os.path.exists(pdf_file):
-        pdf=FPDF()
-        pdf.set_auto_page_break(auto=True)
-        pdf.set_font("Arial",size=12)
-        pdf.multi_cell(0,10,text)
-        pdf.output(pdf_file)
-        messagebox.showinfo("succes, you make new pdf file!!!!")
+    existed=os.path.exists(pdf_file)
+    jobs.submit(lambda job: save_to_pdf(job, list(file_paths), pdf_file),
+                on_done=lambda job, pages: show_result(pages, existed),
+                on_error=lambda job, e: messagebox.showerror("Error", str(e)))
+
+def save_to_pdf(job, file_paths, pdf_file):
+    # every image's text goes on its own page(s); empty pdfs are not kept
+    pages=0
+    for result in engine.convert(file_paths, pdf_file):
+        pages+=result.pages
+    return pages
+
+def show_result(pages, existed):
+    if not pages:
+        messagebox.showerror("Error", "no text found in the images")
+    elif existed:
+        messagebox.showinfo("Success", "you modified the existing pdf!!!")
     else:
-        pdf=FPDF()
-        pdf.set_auto_page_break(auto=True)
-        pdf.set_font("Arial",size=12)
-        pdf.multi_cell(0,10,text)
-        pdf.output(pdf_file)
-        messagebox.showinfo("you modifies the existing pdf!!!")
+        messagebox.showinfo("Success", "success, you made a new pdf file!!!!")
 
 def main():
+    global engine, jobs
     root=tk.Tk()
     root.title("PDF maker")
     root.geometry("300x400")
+    engine=ConversionEngine(index=get_index())
+    jobs=JobExecutor(TkDispatcher(root))
     btn=tk.Button(root,text="select image",command=select_image)
     btn.pack()
 
     root.mainloop()
 
 if __name__=="__main__":
-    main
-
-    
-
+    main()